@@ -1,12 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, Form, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional, Dict
+from datetime import date, timedelta
 from pydantic import BaseModel
-from app.services.ai_service import AIService
+from app.services.ai_service import AIService, get_provider_breaker
+from app.services.question_pool_service import QuestionPoolService
+from app.services.background_jobs import job_manager, job_to_dict
+from app.services.llm_dispatcher import llm_dispatcher
+from app.services.ai_usage_service import AIQuotaExceeded, USAGE_GROUPS, usage_meter, get_usage_summary
 from app.services.auth_service import get_current_user
+from app.services.speech_service import AudioRejected, SpeechStream, size_limit_message, transcribe_stream
 from app.models.user import User
-from database import get_db
+from database import get_db, SessionLocal
 from config import settings
+import asyncio
 import json
 import logging
 
@@ -66,23 +74,36 @@ class TextToSpeechRequest(BaseModel):
 @router.post("/generate-questions")
 async def generate_questions(
     request: QuestionGenerationRequest,
+    async_mode: bool = Query(False, description="后台执行，返回任务ID"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """AI生成题目"""
+    """AI生成题目（优先从预生成题目池取题）；async_mode=true 时提交后台任务并立即返回任务ID"""
+    if async_mode:
+        job = job_manager.submit(db, "generate_questions", current_user.id, request.dict())
+        return JSONResponse(status_code=202, content=job_to_dict(job))
     try:
-        questions = await ai_service.generate_questions(
+        pool = QuestionPoolService(db, ai_service)
+        params = dict(
             subject=request.subject,
             difficulty=request.difficulty,
             count=request.count,
-            question_types=request.question_types or []
+            question_types=request.question_types
         )
+        questions = pool.take(**params) if settings.question_pool_enabled else []
+        # 先提交取题结果，现场调用AI期间不持有写事务
+        db.commit()
+        questions = await pool.fill_missing(questions, **params)
         return {
             "success": True,
             "data": questions,
             "message": f"成功生成{len(questions)}道题目"
         }
+    except AIQuotaExceeded:
+        db.rollback()
+        raise
     except Exception as e:
+        db.rollback()
         raise HTTPException(status_code=500, detail=f"生成题目失败: {str(e)}")
 
 
@@ -106,6 +127,8 @@ async def smart_grading(
             "data": result,
             "message": "智能评分完成"
         }
+    except AIQuotaExceeded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"智能评分失败: {str(e)}")
 
@@ -127,29 +150,87 @@ async def real_time_qa(
             "data": result,
             "message": "AI回答完成"
         }
+    except AIQuotaExceeded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"AI问答失败: {str(e)}")
 
 
 @router.post("/speech-to-text")
 async def speech_to_text(
-    audio_file: UploadFile = File(...),
-    language: str = Form("zh-CN"),
+    request: Request,
+    language: str = Query("zh-CN"),
+    audio_format: str = Query("wav", description="wav 或 pcm（16位单声道）"),
+    sample_rate: Optional[int] = Query(None, description="pcm 格式的采样率"),
     current_user: User = Depends(get_current_user)
 ):
-    """语音转文字"""
+    """语音转文字：请求体为音频原始数据，边接收边识别，超出大小或时长限制时立即停止接收"""
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > settings.max_file_size:
+        raise HTTPException(status_code=413, detail=size_limit_message())
+
     try:
-        audio_data = await audio_file.read()
-        result = await ai_service.speech_to_text(audio_data, language)
+        result = await transcribe_stream(request.stream(), language, audio_format, sample_rate)
         return {
             "success": True,
             "data": result,
             "message": "语音识别完成"
         }
+    except AudioRejected as e:
+        raise HTTPException(status_code=413 if e.too_large else 400, detail=e.message)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"语音识别失败: {str(e)}")
 
 
+def _authenticate_token(token: str) -> Optional[User]:
+    db = SessionLocal()
+    try:
+        return get_current_user(token=token, db=db)
+    except HTTPException:
+        return None
+    finally:
+        db.close()
+
+
+@router.websocket("/speech-to-text/ws")
+async def speech_to_text_stream(
+    websocket: WebSocket,
+    token: str = Query(..., description="访问令牌"),
+    language: str = Query("zh-CN"),
+    audio_format: str = Query("pcm", description="wav 或 pcm（16位单声道）"),
+    sample_rate: Optional[int] = Query(None, description="pcm 格式的采样率")
+):
+    """流式语音识别：客户端逐块发送二进制音频，服务端推送部分识别结果，客户端发送文本 end 后返回最终结果
+
+    服务端消息：{"type": "partial", "text", "duration"}、{"type": "final", "text", "confidence", "language", "duration"}、
+    {"type": "error", "message"}
+    """
+    if await asyncio.to_thread(_authenticate_token, token) is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    try:
+        stream = SpeechStream(language, audio_format, sample_rate)
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes"):
+                partial = await asyncio.to_thread(stream.feed, message["bytes"])
+                if partial:
+                    await websocket.send_json({"type": "partial", **partial})
+            elif message.get("text") == "end":
+                break
+        result = await asyncio.to_thread(stream.finish)
+        await websocket.send_json({"type": "final", **result})
+        await websocket.close()
+    except AudioRejected as e:
+        await websocket.send_json({"type": "error", "message": e.message})
+        await websocket.close(code=status.WS_1009_MESSAGE_TOO_BIG if e.too_large else status.WS_1003_UNSUPPORTED_DATA)
+    except WebSocketDisconnect:
+        pass
+
+
 @router.post("/text-to-speech")
 async def text_to_speech(
     request: TextToSpeechRequest,
@@ -167,6 +248,8 @@ async def text_to_speech(
             },
             "message": "文字转语音完成"
         }
+    except AIQuotaExceeded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"文字转语音失败: {str(e)}")
 
@@ -189,16 +272,22 @@ async def get_recommendations(
             "data": questions,
             "message": f"为您推荐了{len(questions)}道题目"
         }
+    except AIQuotaExceeded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取推荐失败: {str(e)}")
 
 
 @router.get("/learning-report")
 async def get_learning_report(
+    async_mode: bool = Query(False, description="后台执行，返回任务ID"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """获取学习分析报告"""
+    """获取学习分析报告；async_mode=true 时提交后台任务并立即返回任务ID"""
+    if async_mode:
+        job = job_manager.submit(db, "learning_report", current_user.id, {})
+        return JSONResponse(status_code=202, content=job_to_dict(job))
     try:
         user_id = getattr(current_user, 'id', None)
         if user_id is None:
@@ -209,6 +298,8 @@ async def get_learning_report(
             "data": report,
             "message": "学习报告生成完成"
         }
+    except AIQuotaExceeded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"生成学习报告失败: {str(e)}")
 
@@ -229,6 +320,8 @@ async def get_learning_motivation(
             "data": motivation,
             "message": "学习激励生成完成"
         }
+    except AIQuotaExceeded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"生成学习激励失败: {str(e)}")
 
@@ -249,6 +342,8 @@ async def get_learning_style(
             "data": style,
             "message": "学习风格分析完成"
         }
+    except AIQuotaExceeded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"学习风格分析失败: {str(e)}")
 
@@ -271,10 +366,48 @@ async def analyze_wrong_question(
             "data": analysis,
             "message": "错题分析完成"
         }
+    except AIQuotaExceeded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"错题分析失败: {str(e)}")
 
 
+@router.get("/usage")
+def get_ai_usage(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    group_by: str = "feature",
+    user_id: Optional[int] = None,
+    limit: int = 100,
+    current_user: User = Depends(require_role(["admin"])),
+    db: Session = Depends(get_db)
+):
+    """AI用量统计（管理员）：group_by 为逗号分隔的 usage_date/provider/feature/user_id"""
+    groups = [name.strip() for name in group_by.split(",") if name.strip()]
+    invalid = [name for name in groups if name not in USAGE_GROUPS]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"不支持的分组字段: {', '.join(invalid)}")
+    end_date = end_date or date.today()
+    start_date = start_date or end_date - timedelta(days=6)
+
+    usage_meter.flush()
+    return {
+        "success": True,
+        "data": {
+            "start_date": start_date.isoformat(),
+            "end_date": end_date.isoformat(),
+            "group_by": groups,
+            "items": get_usage_summary(db, start_date, end_date, groups, user_id, min(limit, 1000)),
+            "quotas": {
+                "user_daily_tokens": settings.ai_user_daily_token_quota,
+                "user_daily_calls": settings.ai_user_daily_call_quotas,
+                "feature_daily_tokens": settings.ai_feature_daily_token_quotas
+            }
+        },
+        "message": "获取AI用量成功"
+    }
+
+
 @router.get("/ai-status")
 async def get_ai_status():
     """获取AI服务状态"""
@@ -284,7 +417,9 @@ async def get_ai_status():
             "clients_count": len(ai_service._clients),
             "cache_enabled": settings.ai_cache_enabled,
             "cache_size": len(ai_service._cache),
-            "available_models": list(ai_service._clients.keys()) if ai_service._clients else []
+            "available_models": list(ai_service._clients.keys()) if ai_service._clients else [],
+            "providers": {name: get_provider_breaker(name).snapshot() for name in ai_service._clients},
+            "dispatcher": llm_dispatcher.snapshot()
         }
         return {
             "success": True,
@@ -7,6 +7,7 @@ from database import get_db
 from app.models.user import User, StudySession, WrongQuestion
 from app.models.question import Question, QuestionCategory
 from app.services.auth_service import get_current_user
+from app.services.activity_rollup_service import ActivityRollupService
 
 router = APIRouter(prefix="/analytics", tags=["数据分析"])
 
@@ -21,33 +22,23 @@ async def get_study_trends(
     try:
         user_id = getattr(current_user, 'id', None)
         
-        # 获取最近N天的学习数据
         end_date = datetime.now()
-        start_date = end_date - timedelta(days=days)
         
-        # 按日期统计学习时间
-        study_data = db.query(
-            func.date(StudySession.start_time).label('date'),
-            func.sum(StudySession.duration).label('total_time'),
-            func.count(StudySession.id).label('session_count'),
-            func.avg(StudySession.accuracy).label('avg_accuracy')
-        ).filter(
-            StudySession.user_id == user_id,
-            StudySession.start_time >= start_date
-        ).group_by(
-            func.date(StudySession.start_time)
-        ).order_by(
-            func.date(StudySession.start_time)
-        ).all()
+        # 读取每日汇总（仅保留有学习记录的日期）
+        daily_rows = ActivityRollupService(db).get_recent_days(user_id, days=days)
         
         # 格式化数据
         trends = []
-        for data in study_data:
+        for day in daily_rows:
+            if not (day["session_count"] or day["study_minutes"] or day["questions_answered"]):
+                continue
             trends.append({
-                "date": data.date.strftime("%Y-%m-%d"),
-                "total_time": data.total_time or 0,
-                "session_count": data.session_count or 0,
-                "avg_accuracy": round(data.avg_accuracy or 0, 2)
+                "date": day["date"].strftime("%Y-%m-%d"),
+                "total_time": day["study_minutes"],
+                "session_count": day["session_count"],
+                "avg_accuracy": round(
+                    day["correct_answers"] / day["questions_answered"] * 100, 2
+                ) if day["questions_answered"] else 0
             })
         
         # 如果没有数据，返回模拟数据
@@ -200,50 +191,16 @@ async def get_learning_patterns(
     try:
         user_id = getattr(current_user, 'id', None)
         
-        # 按小时统计学习时间分布
-        hourly_data = db.query(
-            extract('hour', StudySession.start_time).label('hour'),
-            func.count(StudySession.id).label('session_count'),
-            func.sum(StudySession.duration).label('total_time')
-        ).filter(
-            StudySession.user_id == user_id
-        ).group_by(
-            extract('hour', StudySession.start_time)
-        ).order_by(
-            extract('hour', StudySession.start_time)
-        ).all()
-        
-        # 按星期统计学习时间分布
-        weekly_data = db.query(
-            extract('dow', StudySession.start_time).label('day_of_week'),
-            func.count(StudySession.id).label('session_count'),
-            func.sum(StudySession.duration).label('total_time')
-        ).filter(
-            StudySession.user_id == user_id
-        ).group_by(
-            extract('dow', StudySession.start_time)
-        ).order_by(
-            extract('dow', StudySession.start_time)
-        ).all()
+        # 按小时、按星期的学习分布读取每日汇总
+        distribution = ActivityRollupService(db).get_hourly_and_weekday_distribution(user_id)
+        day_names = ["周日", "周一", "周二", "周三", "周四", "周五", "周六"]
         
         # 格式化数据
         patterns = {
-            "hourly_distribution": [
-                {
-                    "hour": data.hour,
-                    "session_count": data.session_count or 0,
-                    "total_time": data.total_time or 0
-                }
-                for data in hourly_data
-            ],
+            "hourly_distribution": distribution["hourly"],
             "weekly_distribution": [
-                {
-                    "day_of_week": data.day_of_week,
-                    "day_name": ["周日", "周一", "周二", "周三", "周四", "周五", "周六"][data.day_of_week],
-                    "session_count": data.session_count or 0,
-                    "total_time": data.total_time or 0
-                }
-                for data in weekly_data
+                {**data, "day_name": day_names[data["day_of_week"]]}
+                for data in distribution["weekly"]
             ]
         }
         
@@ -1,5 +1,5 @@
 from datetime import timedelta
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 
@@ -7,19 +7,43 @@ from app.models.user import User
 from app.schemas.auth import Token
 from app.services.auth_service import AuthService
 from app.utils.jwt import get_current_user
+from app.utils.rate_limit import TokenBucketLimiter
 from config import settings
 from database import get_db
 
 router = APIRouter()
 
+# 登录限流：超出配额的请求在校验密码之前直接拒绝
+_username_limiter = TokenBucketLimiter(settings.login_rate_username_capacity,
+                                       settings.login_rate_username_per_minute / 60)
+_ip_limiter = TokenBucketLimiter(settings.login_rate_ip_capacity,
+                                 settings.login_rate_ip_per_minute / 60)
+
+
+def _check_login_rate(request: Request, username: str):
+    client_ip = request.client.host if request.client else "unknown"
+    for limiter, key in ((_ip_limiter, client_ip), (_username_limiter, username.lower())):
+        if not limiter.allow(key):
+            retry_after = limiter.retry_after(key)
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail={
+                    "error": "Too many login attempts",
+                    "message": f"登录尝试过于频繁，请 {retry_after} 秒后再试"
+                },
+                headers={"Retry-After": str(retry_after)},
+            )
+
 
 @router.post("/token", response_model=Token)
 async def login_for_access_token(
+        request: Request,
         form_data: OAuth2PasswordRequestForm = Depends(),
         db: Session = Depends(get_db)):
+    _check_login_rate(request, form_data.username)
     auth_service = AuthService(db)
-    user = auth_service.authenticate_user(form_data.username,
-                                          form_data.password)
+    user = await auth_service.authenticate_user(form_data.username,
+                                                form_data.password)
 
 
 from pydantic import BaseModel, Field
@@ -44,11 +68,12 @@ logger = logging.getLogger(__name__)
 
 
 @router.post("/login", response_model=Token)
-async def simple_login(form_data: LoginForm, db: Session = Depends(get_db)):
+async def simple_login(form_data: LoginForm, request: Request, db: Session = Depends(get_db)):
+    _check_login_rate(request, form_data.username)
     try:
         auth_service = AuthService(db)
-        user = auth_service.authenticate_user(form_data.username,
-                                              form_data.password)
+        user = await auth_service.authenticate_user(form_data.username,
+                                                    form_data.password)
         if not user:
             logger.warning(f"Login failed for username: {form_data.username}")
             raise HTTPException(
@@ -64,6 +89,8 @@ async def simple_login(form_data: LoginForm, db: Session = Depends(get_db)):
         logger.info(f"User {form_data.username} logged in successfully")
         return {"access_token": access_token, "token_type": "bearer"}
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Login error: {str(e)}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -100,9 +127,9 @@ async def register_user(form_data: RegisterForm,
 
     auth_service = AuthService(db)
     try:
-        user = auth_service.create_user(username=form_data.username,
-                                        password=form_data.password,
-                                        email=form_data.email)
+        user = await auth_service.create_user(username=form_data.username,
+                                              password=form_data.password,
+                                              email=form_data.email)
         return {
             "message": "User created successfully",
             "user_id": user.id,
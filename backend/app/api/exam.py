@@ -1,4 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Body
+from fastapi import APIRouter, Depends, HTTPException, status, Body, Query
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional, Dict
 from database import get_db
@@ -7,7 +8,11 @@ from app.models.question import Question, ExamQuestion
 from app.models.user import User
 from app.services.auth_service import get_current_user
 from app.services.ai_service import AIService
+from app.services.ai_usage_service import AIQuotaExceeded
+from app.services.exam_service import generate_ai_exam
+from app.services.background_jobs import job_manager, job_to_dict
 from app.schemas.exam import ExamCreate, Exam as ExamSchema
+from app.utils.etag import ETagGuard, path_param_scope, exam_scope, QUESTION_SET_SCOPE
 from sqlalchemy import or_
 from pydantic import BaseModel
 
@@ -16,6 +21,11 @@ router = APIRouter(prefix="/exam", tags=["考试系统"])
 # 初始化AI服务
 ai_service = AIService()
 
+exam_etag = ETagGuard("exam", path_param_scope(exam_scope, "exam_id"), authenticated=True)
+exam_questions_etag = ETagGuard(
+    "exam_questions", path_param_scope(exam_scope, "exam_id", QUESTION_SET_SCOPE), authenticated=True
+)
+
 
 class ExamGenerateRequest(BaseModel):
     subject: str
@@ -26,77 +36,36 @@ class ExamGenerateRequest(BaseModel):
     tags: Optional[List[str]] = None
 
 
-@router.post("/generate", response_model=ExamSchema, summary="AI智能组卷")
+@router.post("/generate", summary="智能组卷")
 async def generate_exam(
     req: ExamGenerateRequest = Body(...),
+    async_mode: bool = Query(False, description="后台执行，返回任务ID"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """AI智能组卷"""
+    """从题库按约束组卷，题库不足的题型由AI补齐；async_mode=true 时提交后台任务并立即返回任务ID"""
+    if async_mode:
+        job = job_manager.submit(db, "exam_generate", current_user.id, req.dict())
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=job_to_dict(job))
     try:
-        # 调用AI服务生成试卷
-        exam_data = await ai_service.generate_exam(
+        exam = await generate_ai_exam(
+            db,
+            ai_service,
             subject=req.subject,
             difficulty=req.difficulty,
+            created_by=getattr(current_user, 'id', None),
             exam_type=req.exam_type,
-            question_distribution=req.question_distribution or {
-                "single_choice": 20,
-                "multiple_choice": 10,
-                "fill_blank": 5,
-                "short_answer": 3
-            },
+            question_distribution=req.question_distribution,
             skill=req.skill,
             tags=req.tags
         )
-        
-        # 创建考试记录
-        exam = Exam(
-            title=exam_data.get("title", f"{req.subject}考试"),
-            description=exam_data.get("description", f"{req.subject}综合测试"),
-            subject=req.subject,
-            difficulty=req.difficulty,
-            exam_type=req.exam_type,
-            total_score=exam_data.get("total_score", 100),
-            time_limit=exam_data.get("time_limit", 120),
-            created_by=getattr(current_user, 'id', None),
-            ai_generated=True
-        )
-        db.add(exam)
-        db.flush()  # 获取exam.id
-        
-        # 添加试题到考试
-        for i, question_data in enumerate(exam_data.get("questions", [])):
-            # 查找或创建题目
-            question = db.query(Question).filter(
-                Question.content == question_data.get("content")
-            ).first()
-            
-            if not question:
-                # 创建新题目
-                question = Question(
-                    content=question_data.get("content"),
-                    question_type=question_data.get("question_type"),
-                    options=question_data.get("options", []),
-                    answer=question_data.get("answer"),
-                    explanation=question_data.get("explanation"),
-                    difficulty=question_data.get("difficulty", req.difficulty)
-                )
-                db.add(question)
-                db.flush()
-            
-            # 创建考试题目关联
-            exam_question = ExamQuestion(
-                exam_id=exam.id,
-                question_id=question.id,
-                score=question_data.get("score", 5),
-                sequence=i + 1
-            )
-            db.add(exam_question)
-        
         db.commit()
         db.refresh(exam)
         return {"id": exam.id}
         
+    except AIQuotaExceeded:
+        db.rollback()
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(
@@ -145,7 +114,7 @@ async def get_exam_list(
     return {"items": items, "total": total}
 
 
-@router.get("/{exam_id}", response_model=ExamSchema, summary="获取考试详情")
+@router.get("/{exam_id}", response_model=ExamSchema, summary="获取考试详情", dependencies=[Depends(exam_etag)])
 async def get_exam_detail(
     exam_id: int,
     current_user: User = Depends(get_current_user),
@@ -175,7 +144,7 @@ async def delete_exam(
     return {"success": True}
 
 
-@router.get("/{exam_id}/questions", summary="获取考试题目")
+@router.get("/{exam_id}/questions", summary="获取考试题目", dependencies=[Depends(exam_questions_etag)])
 async def get_exam_questions(
     exam_id: int,
     current_user: User = Depends(get_current_user),
@@ -0,0 +1,99 @@
+import asyncio
+import json
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from database import get_db, SessionLocal
+from app.models.background_job import BackgroundJob
+from app.models.user import User
+from app.services.auth_service import get_current_user
+from app.services.background_jobs import job_manager, job_to_dict, TERMINAL_STATUSES
+
+router = APIRouter(prefix="/jobs", tags=["后台任务"])
+
+# SSE 在没有本进程推送时回查数据库的间隔（任务可能由其他进程执行）
+SSE_POLL_SECONDS = 2
+
+
+def _get_own_job(db: Session, job_id: str, user_id: int) -> BackgroundJob:
+    job = db.query(BackgroundJob).filter(BackgroundJob.id == job_id, BackgroundJob.user_id == user_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+
+@router.get("", summary="获取我的后台任务")
+def list_jobs(
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    jobs = db.query(BackgroundJob).filter(
+        BackgroundJob.user_id == current_user.id
+    ).order_by(BackgroundJob.created_at.desc()).limit(limit).all()
+    return {
+        "success": True,
+        "data": [job_to_dict(job, include_result=False) for job in jobs],
+        "message": "获取任务列表成功"
+    }
+
+
+@router.get("/{job_id}", summary="查询后台任务状态和结果")
+def get_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    return {
+        "success": True,
+        "data": job_to_dict(_get_own_job(db, job_id, current_user.id)),
+        "message": "获取任务成功"
+    }
+
+
+@router.get("/{job_id}/events", summary="订阅后台任务进度（SSE）")
+async def job_events(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """以 text/event-stream 推送任务状态，任务结束后发送包含结果的最后一条事件并关闭连接"""
+    user_id = current_user.id
+    initial = job_to_dict(_get_own_job(db, job_id, user_id))
+
+    def load_event():
+        session = SessionLocal()
+        try:
+            return job_to_dict(_get_own_job(session, job_id, user_id))
+        finally:
+            session.close()
+
+    async def event_stream():
+        queue = job_manager.subscribe(job_id)
+        try:
+            event, last = initial, None
+            while True:
+                if event != last:
+                    yield f"event: job\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+                    last = event
+                else:
+                    yield ": keep-alive\n\n"
+                if event["status"] in TERMINAL_STATUSES:
+                    break
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_POLL_SECONDS)
+                    if event["status"] in TERMINAL_STATUSES:
+                        # 推送的事件不含结果，结束时从数据库读取完整记录
+                        event = await asyncio.to_thread(load_event)
+                except asyncio.TimeoutError:
+                    event = await asyncio.to_thread(load_event)
+        finally:
+            job_manager.unsubscribe(job_id, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
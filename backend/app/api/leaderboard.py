@@ -0,0 +1,78 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+from typing import Optional
+from database import get_db
+from app.models.user import User
+from app.services.auth_service import get_current_user
+from app.services.leaderboard_service import (
+    LeaderboardService, GLOBAL_SCOPE, category_scope, week_scope
+)
+
+router = APIRouter(prefix="/leaderboard", tags=["排行榜"])
+
+
+def _resolve_scope(scope: str, category_id: Optional[int]) -> str:
+    if scope == "global":
+        return GLOBAL_SCOPE
+    if scope == "week":
+        return week_scope()
+    if scope == "category":
+        if category_id is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="分类榜需要指定 category_id"
+            )
+        return category_scope(category_id)
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="不支持的榜单类型"
+    )
+
+
+@router.get("", summary="获取排行榜")
+async def get_leaderboard(
+    scope: str = Query("global", description="榜单类型：global / week / category"),
+    category_id: Optional[int] = None,
+    limit: int = Query(10, ge=1, le=100),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """获取排行榜前N名及当前用户名次"""
+    scope_key = _resolve_scope(scope, category_id)
+    try:
+        top = LeaderboardService.get_top(db, scope_key, limit)
+        my_rank = LeaderboardService.get_rank(db, scope_key, current_user.id)
+
+        user_ids = [user_id for user_id, _ in top]
+        usernames = dict(
+            db.query(User.id, User.username).filter(User.id.in_(user_ids)).all()
+        ) if user_ids else {}
+
+        items = []
+        previous_score = None
+        rank = 0
+        for index, (user_id, score) in enumerate(top, start=1):
+            # 同分并列
+            if score != previous_score:
+                rank = index
+                previous_score = score
+            items.append({
+                "rank": rank,
+                "user_id": user_id,
+                "username": usernames.get(user_id),
+                "score": score
+            })
+
+        return {
+            "success": True,
+            "data": {
+                "scope": scope_key,
+                "items": items,
+                "me": {"rank": my_rank[0], "score": my_rank[1]} if my_rank else None
+            }
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"获取排行榜失败: {str(e)}"
+        )
@@ -1,6 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from database import get_db
 from app.models.learning import UserProfile, LearningGoal, LearningPlan, LearningTask, LearningReminder, Achievement, LearningProgress, SkillPoint
 from app.schemas.learning import (
@@ -14,9 +15,14 @@ from app.schemas.learning import (
     LearningPlanGenerationRequest, LearningPlanGenerationResponse, LearningStatistics
 )
 from app.services.learning_plan_service import LearningPlanService
+from app.services.ai_usage_service import AIQuotaExceeded
+from app.services.background_jobs import job_manager, job_to_dict
+from app.services.activity_rollup_service import ActivityRollupService
+from app.services.streak_service import StreakService
+from app.services.report_store import ReportStore
 from app.services.auth_service import get_current_user
 from app.models.user import User
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from sqlalchemy import func
 
 router = APIRouter(prefix="/learning", tags=["学习计划"])
@@ -184,10 +190,11 @@ async def delete_learning_goal(
 @router.post("/generate-plan", response_model=LearningPlanGenerationResponse, summary="生成AI学习计划")
 async def generate_learning_plan(
     request: LearningPlanGenerationRequest,
+    async_mode: bool = Query(False, description="后台执行，返回任务ID"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """生成个性化AI学习计划"""
+    """生成个性化AI学习计划；async_mode=true 时提交后台任务并立即返回任务ID"""
     # 验证用户ID
     if request.user_id != current_user.id:
         raise HTTPException(
@@ -210,6 +217,10 @@ async def generate_learning_plan(
             detail="请先创建学习目标"
         )
     
+    if async_mode:
+        job = job_manager.submit(db, "learning_plan", current_user.id, request.dict())
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=job_to_dict(job))
+
     # 调用AI服务生成学习计划
     learning_service = LearningPlanService(db)
     result = await learning_service.generate_learning_plan(request)
@@ -450,6 +461,11 @@ async def record_learning_progress(
         **progress.dict()
     )
     db.add(db_progress)
+    ActivityRollupService(db).record_activity(
+        user_id=current_user.id,
+        study_minutes=progress.study_time or 0,
+        sessions=1
+    )
     db.commit()
     db.refresh(db_progress)
     return db_progress
@@ -479,8 +495,13 @@ async def get_learning_statistics(
     
     completion_rate = completed_tasks / total_tasks if total_tasks > 0 else 0.0
     
-    # 计算连续学习天数（简化版本）
-    current_streak = 7  # 这里可以添加更复杂的逻辑
+    # 连续学习天数读取学习日位图
+    streak_service = StreakService(db)
+    streaks = streak_service.get_streaks(current_user.id)
+    today = datetime.now().date()
+    recent_active_days = streak_service.count_active_days(
+        current_user.id, today - timedelta(days=29), today
+    )
     
     # 计算成就数量
     total_achievements = db.query(func.count(Achievement.id)).filter(
@@ -497,7 +518,9 @@ async def get_learning_statistics(
         completed_tasks=completed_tasks,
         total_tasks=total_tasks,
         completion_rate=completion_rate,
-        current_streak=current_streak,
+        current_streak=streaks["current_streak"],
+        longest_streak=streaks["longest_streak"],
+        recent_active_days=recent_active_days,
         total_achievements=total_achievements,
         total_points=total_points
     )
@@ -654,6 +677,8 @@ async def get_learning_path(
             "success": True,
             "data": learning_path
         }
+    except AIQuotaExceeded:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -680,6 +705,8 @@ async def generate_learning_report(
             "success": True,
             "data": report
         }
+    except AIQuotaExceeded:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -687,6 +714,41 @@ async def generate_learning_report(
         )
 
 
+@router.get("/reports", summary="获取每日报告历史")
+async def get_daily_reports(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    limit: int = Query(30, ge=1, le=366),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """按日期区间获取已生成的每日学习报告（按日期倒序）"""
+    reports = ReportStore(db).list_range(current_user.id, start_date, end_date, limit)
+    return {
+        "success": True,
+        "data": reports
+    }
+
+
+@router.get("/reports/{report_date}", summary="获取某天的每日报告")
+async def get_daily_report(
+    report_date: date,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """获取指定日期的每日学习报告"""
+    report = ReportStore(db).get(current_user.id, report_date)
+    if report is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="该日期的报告不存在"
+        )
+    return {
+        "success": True,
+        "data": report
+    }
+
+
 @router.get("/learning-style", summary="分析学习风格")
 async def analyze_learning_style(
     current_user: User = Depends(get_current_user),
@@ -706,6 +768,8 @@ async def analyze_learning_style(
             "success": True,
             "data": learning_style
         }
+    except AIQuotaExceeded:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -732,6 +796,8 @@ async def get_motivation_plan(
             "success": True,
             "data": motivation
         }
+    except AIQuotaExceeded:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -12,9 +12,13 @@ from app.services.question_service import (create_question, get_question,
                                            get_questions_by_category,
                                            create_category, create_exam_paper,
                                            add_question_to_exam)
+from app.utils.etag import ETagGuard, path_param_scope, static_scope, question_scope, CATEGORY_SCOPE
 
 router = APIRouter(prefix="/questions", tags=["questions"])
 
+question_etag = ETagGuard("question", path_param_scope(question_scope, "question_id"))
+categories_etag = ETagGuard("question_categories", static_scope(CATEGORY_SCOPE))
+
 
 @router.post("/", response_model=QuestionResponse)
 def create_new_question(question: QuestionCreate,
@@ -22,7 +26,7 @@ def create_new_question(question: QuestionCreate,
     return create_question(db, **question.dict())
 
 
-@router.get("/{question_id}", response_model=QuestionResponse)
+@router.get("/{question_id}", response_model=QuestionResponse, dependencies=[Depends(question_etag)])
 def read_question(question_id: int, db: Session = Depends(get_db)):
     db_question = get_question(db, question_id=question_id)
     if not db_question:
@@ -57,7 +61,7 @@ def create_new_category(category: QuestionCategoryCreate,
                            parent_id=category.parent_id)
 
 
-@router.get("/categories", response_model=list[QuestionCategoryResponse])
+@router.get("/categories", response_model=list[QuestionCategoryResponse], dependencies=[Depends(categories_etag)])
 def read_categories(db: Session = Depends(get_db)):
     return db.query(QuestionCategory).all()
 
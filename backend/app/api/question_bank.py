@@ -8,11 +8,15 @@ from app.models.user import User
 from app.services.auth_service import get_current_user
 from app.services.question_bank_service import QuestionBankService
 from app.schemas.question import QuestionResponse, QuestionCategoryResponse
+from app.utils.etag import ETagGuard, static_scope, CATEGORY_SCOPE
 
 router = APIRouter(prefix="/question-bank", tags=["question-bank"])
 
+categories_etag = ETagGuard("question_bank_categories", static_scope(CATEGORY_SCOPE))
+statistics_etag = ETagGuard("question_bank_statistics", static_scope(), per_user=True)
 
-@router.get("/categories", response_model=List[QuestionCategoryResponse])
+
+@router.get("/categories", response_model=List[QuestionCategoryResponse], dependencies=[Depends(categories_etag)])
 async def get_question_categories(
     db: Session = Depends(get_db)
 ):
@@ -158,7 +162,7 @@ async def complete_practice_session(
         raise HTTPException(status_code=400, detail=str(e))
 
 
-@router.get("/statistics")
+@router.get("/statistics", dependencies=[Depends(statistics_etag)])
 async def get_user_statistics(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
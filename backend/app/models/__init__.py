@@ -11,6 +11,13 @@ from .learning import (
     Achievement, 
     LearningProgress
 )
+from .activity import DailyUserActivity, UserActivityDays
+from .report import ReportRunProgress, DailyReport, ReportPartial
+from .job import JobLease, JobRun
+from .archive import RecordArchive
+from .question_pool import QuestionPoolItem, QuestionPoolTarget
+from .ai_usage import AIUsageDaily
+from .background_job import BackgroundJob
 
 __all__ = [
     "User",
@@ -25,5 +32,17 @@ __all__ = [
     "LearningTask",
     "LearningReminder",
     "Achievement",
-    "LearningProgress"
+    "LearningProgress",
+    "DailyUserActivity",
+    "UserActivityDays",
+    "ReportRunProgress",
+    "DailyReport",
+    "ReportPartial",
+    "JobLease",
+    "JobRun",
+    "RecordArchive",
+    "QuestionPoolItem",
+    "QuestionPoolTarget",
+    "AIUsageDaily",
+    "BackgroundJob"
 ] 
\ No newline at end of file
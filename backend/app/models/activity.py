@@ -0,0 +1,39 @@
+from sqlalchemy import Column, Integer, Float, Date, DateTime, ForeignKey, JSON, LargeBinary, UniqueConstraint
+from sqlalchemy.sql import func
+from database import Base
+
+
+class DailyUserActivity(Base):
+    """按用户按天汇总的学习活动（供仪表板与分析接口读取）"""
+    __tablename__ = "daily_user_activity"
+    __table_args__ = (
+        UniqueConstraint("user_id", "activity_date", name="uq_daily_user_activity_user_date"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    activity_date = Column(Date, nullable=False, index=True)
+    study_minutes = Column(Integer, default=0)  # 学习时长（分钟）
+    session_count = Column(Integer, default=0)  # 学习/练习次数
+    questions_answered = Column(Integer, default=0)  # 答题数
+    correct_answers = Column(Integer, default=0)  # 答对数
+    score_sum = Column(Float, default=0.0)  # 得分合计（百分制）
+    score_count = Column(Integer, default=0)  # 得分样本数
+    hourly_sessions = Column(JSON, nullable=True)  # 24小时学习次数分布
+    hourly_minutes = Column(JSON, nullable=True)  # 24小时学习时长分布
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class UserActivityDays(Base):
+    """用户学习日位图（第i位表示 start_date + i 天是否有学习记录）"""
+    __tablename__ = "user_activity_days"
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, unique=True, index=True)
+    start_date = Column(Date, nullable=False)  # 位图起始日期
+    day_bitmap = Column(LargeBinary, nullable=False, default=b"")  # 按天的学习位图
+    last_active_date = Column(Date, nullable=True)  # 最近学习日期
+    current_streak = Column(Integer, default=0)  # 截至最近学习日期的连续天数
+    longest_streak = Column(Integer, default=0)  # 历史最长连续天数
+    active_days = Column(Integer, default=0)  # 累计学习天数
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,21 @@
+from sqlalchemy import Column, Integer, String, Date, UniqueConstraint
+from database import Base
+
+
+class AIUsageDaily(Base):
+    """AI调用用量按天聚合：每天每个（服务商, 功能, 用户）一行，由进程内计数器批量写入"""
+    __tablename__ = "ai_usage_daily"
+    __table_args__ = (
+        UniqueConstraint("usage_date", "provider", "feature", "user_id", name="uq_ai_usage_daily"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    usage_date = Column(Date, nullable=False, index=True)
+    provider = Column(String(50), nullable=False)  # deepseek、openai 等；没有可用服务商时为 none
+    feature = Column(String(100), nullable=False)  # 功能名，例如 real_time_qa、generate_exam
+    user_id = Column(Integer, nullable=False, default=0, index=True)  # 0 表示定时任务等非用户请求
+    calls = Column(Integer, default=0)
+    failures = Column(Integer, default=0)
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    latency_ms = Column(Integer, default=0)  # 累计耗时，除以 calls 得平均耗时
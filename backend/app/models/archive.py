@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, String, DateTime, LargeBinary
+from sqlalchemy.sql import func
+from database import Base
+
+
+class RecordArchive(Base):
+    """清理前归档的记录：每个删除批次一行，payload 为 zlib 压缩的 JSON 行列表"""
+    __tablename__ = "record_archives"
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    table_name = Column(String(100), nullable=False, index=True)
+    min_record_id = Column(Integer, nullable=False)
+    max_record_id = Column(Integer, nullable=False)
+    row_count = Column(Integer, default=0)
+    payload = Column(LargeBinary, nullable=False)  # zlib(json[行])
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, JSON
+from database import Base
+
+
+class BackgroundJob(Base):
+    """耗时操作（AI组卷、学习计划、学习报告等）的后台任务，提交后立即返回任务ID，客户端轮询或订阅进度"""
+    __tablename__ = "background_jobs"
+
+    id = Column(String(32), primary_key=True)  # uuid4 十六进制
+    kind = Column(String(50), nullable=False)  # 任务类型，对应已注册的处理函数
+    user_id = Column(Integer, nullable=False, index=True)
+    status = Column(String(20), nullable=False, default="queued", index=True)  # queued, running, succeeded, failed
+    progress = Column(Integer, default=0)  # 0-100
+    message = Column(String(200), nullable=True)  # 当前阶段说明
+    params = Column(JSON, nullable=True)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, default=0)
+    owner = Column(String(200), nullable=True)  # 正在执行的进程
+    created_at = Column(DateTime, nullable=False, index=True)
+    started_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)  # 执行中定期更新，长时间未更新说明进程已退出
+    finished_at = Column(DateTime, nullable=True)
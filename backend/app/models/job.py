@@ -0,0 +1,29 @@
+from sqlalchemy import Column, Integer, String, DateTime, Float, Text
+from database import Base
+
+
+class JobLease(Base):
+    """定时任务租约：同一任务同一时刻只允许一个进程持有，保证集群内每个周期只执行一次"""
+    __tablename__ = "job_leases"
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    job_name = Column(String(100), nullable=False, unique=True)
+    owner = Column(String(200), nullable=True)  # 主机名:进程号:随机串，空表示未被持有
+    lease_expires_at = Column(DateTime, nullable=True)  # 持有者心跳续期，过期后其他进程可接管
+    last_run_key = Column(String(50), nullable=True)  # 最近完成的执行周期，例如 2024-01-01 / 2024-01-01T06
+
+
+class JobRun(Base):
+    """定时任务执行历史"""
+    __tablename__ = "job_runs"
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    job_name = Column(String(100), nullable=False, index=True)
+    run_key = Column(String(50), nullable=True)
+    owner = Column(String(200), nullable=True)
+    status = Column(String(20), default="running")  # running, succeeded, failed
+    started_at = Column(DateTime, nullable=False, index=True)
+    finished_at = Column(DateTime, nullable=True)
+    duration_seconds = Column(Float, nullable=True)
+    rows_processed = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
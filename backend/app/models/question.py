@@ -1,12 +1,26 @@
+import hashlib
+import re
+import unicodedata
 from datetime import datetime
 from enum import Enum
 from typing import List, Optional
 
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON, Boolean, Float
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON, Boolean, Float, event
 from sqlalchemy.orm import relationship
 
 from database import Base
 
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_question_content(content: str) -> str:
+    """去重用的题干规范化：全角转半角、合并空白、忽略大小写"""
+    return _WHITESPACE_PATTERN.sub(" ", unicodedata.normalize("NFKC", content)).strip().casefold()
+
+
+def question_content_hash(content: str) -> str:
+    return hashlib.sha256(normalize_question_content(content).encode("utf-8")).hexdigest()
+
 
 class QuestionType(str, Enum):
     SINGLE_CHOICE = "single_choice"
@@ -34,6 +48,7 @@ class Question(Base):
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     question_type = Column(String(50), nullable=False)
     content = Column(Text, nullable=False)
+    content_hash = Column(String(64), nullable=True, unique=True, index=True)  # 规范化题干的SHA-256，用于去重
     options = Column(JSON, nullable=True)  # For choice questions
     answer = Column(Text, nullable=False)
     explanation = Column(Text, nullable=True)
@@ -57,6 +72,13 @@ class Question(Base):
     user_answers = relationship("UserAnswer", back_populates="question")
 
 
+@event.listens_for(Question, "before_insert")
+def _fill_content_hash(mapper, connection, target: Question):
+    """ORM写入的题目同样计算题干哈希，重复题干由唯一索引拦截（批量写入见 question_service.upsert_questions）"""
+    if target.content_hash is None and target.content:
+        target.content_hash = question_content_hash(target.content)
+
+
 class QuestionCategory(Base):
     __tablename__ = "question_categories"
 
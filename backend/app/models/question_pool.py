@@ -0,0 +1,38 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON, Index, UniqueConstraint
+from sqlalchemy.sql import func
+from database import Base
+
+
+class QuestionPoolItem(Base):
+    """预生成题目池中的一道题，被取用后标记 consumed_at"""
+    __tablename__ = "question_pool_items"
+    __table_args__ = (
+        Index("ix_question_pool_items_key", "subject", "difficulty", "question_type", "skill", "consumed_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    subject = Column(String(100), nullable=False)
+    difficulty = Column(Integer, nullable=False)  # 1-5
+    question_type = Column(String(50), nullable=False)
+    skill = Column(String(100), nullable=False, default="")  # 空字符串表示不限技能点
+    payload = Column(JSON, nullable=False)  # 与 AIService.generate_questions 返回的题目格式一致
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    consumed_at = Column(DateTime, nullable=True)
+    claim_token = Column(String(32), nullable=True)  # 取用时写入，用于识别本次取到的题目
+
+
+class QuestionPoolTarget(Base):
+    """题目池目标库存：按 (学科, 难度, 题型, 技能点) 维持的可用题目数"""
+    __tablename__ = "question_pool_targets"
+    __table_args__ = (
+        UniqueConstraint("subject", "difficulty", "question_type", "skill", name="uq_question_pool_targets_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    subject = Column(String(100), nullable=False)
+    difficulty = Column(Integer, nullable=False)
+    question_type = Column(String(50), nullable=False)
+    skill = Column(String(100), nullable=False, default="")
+    target_count = Column(Integer, default=30)
+    miss_count = Column(Integer, default=0)  # 池中数量不足、需要现场调用AI的次数
+    last_requested_at = Column(DateTime, nullable=True)
@@ -0,0 +1,52 @@
+from sqlalchemy import Column, Integer, String, Date, DateTime, Text, ForeignKey, JSON, LargeBinary, UniqueConstraint
+from sqlalchemy.sql import func
+from database import Base
+
+
+class ReportRunProgress(Base):
+    """报告批处理进度（按批次提交，中断后从 last_user_id 之后继续）"""
+    __tablename__ = "report_run_progress"
+    __table_args__ = (
+        UniqueConstraint("job_name", "report_date", name="uq_report_run_progress_job_date"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    job_name = Column(String(50), nullable=False)  # daily_report
+    report_date = Column(Date, nullable=False)
+    status = Column(String(20), default="running")  # running, completed, failed
+    last_user_id = Column(Integer, default=0)  # 已完成批次中最大的用户ID
+    processed_count = Column(Integer, default=0)
+    failed_count = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
+    started_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class DailyReport(Base):
+    """每日学习报告（zlib压缩的紧凑JSON）"""
+    __tablename__ = "daily_reports"
+    __table_args__ = (
+        UniqueConstraint("user_id", "report_date", name="uq_daily_reports_user_date"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    report_date = Column(Date, nullable=False, index=True)
+    payload = Column(LargeBinary, nullable=False)  # zlib(json)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class ReportPartial(Base):
+    """报告的按日增量部分：当日各学科答题增量与截至当日的累计值"""
+    __tablename__ = "report_partials"
+    __table_args__ = (
+        UniqueConstraint("user_id", "partial_date", name="uq_report_partials_user_date"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    partial_date = Column(Date, nullable=False, index=True)
+    subject_delta = Column(JSON, nullable=False)  # {学科: [答题数, 答对数]}，仅当日
+    subject_totals = Column(JSON, nullable=False)  # {学科: [答题数, 答对数]}，截至当日累计
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -37,6 +37,7 @@ class User(Base):
     # beginner, intermediate, advanced
     study_level = Column(String(50), default="beginner")
     preferred_subjects = Column(String(500), nullable=True)  # JSON格式存储偏好学科
+    timezone = Column(String(50), nullable=True)  # IANA时区，如 Asia/Shanghai，为空时使用默认时区
 
     # 关系
     profile = relationship("UserProfile", back_populates="user", uselist=False)
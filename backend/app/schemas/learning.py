@@ -262,5 +262,7 @@ class LearningStatistics(BaseModel):
     total_tasks: int = Field(..., description="总任务数")
     completion_rate: float = Field(..., ge=0.0, le=1.0, description="完成率")
     current_streak: int = Field(..., description="当前连续学习天数")
+    longest_streak: int = Field(0, description="最长连续学习天数")
+    recent_active_days: int = Field(0, description="最近30天学习天数")
     total_achievements: int = Field(..., description="总成就数")
     total_points: int = Field(..., description="总点数") 
\ No newline at end of file
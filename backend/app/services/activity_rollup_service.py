@@ -0,0 +1,306 @@
+import logging
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Any
+
+from sqlalchemy import func, case, literal
+from sqlalchemy.orm import Session
+
+from app.models.activity import DailyUserActivity
+from app.models.learning import LearningProgress
+from app.models.question import UserAnswer, PracticeSession
+from app.services.streak_service import StreakService
+from app.utils.etag import mark_changed, user_scope
+from app.utils.upsert import insert_ignoring_conflicts
+
+logger = logging.getLogger(__name__)
+
+HOURS_PER_DAY = 24
+ROLLUP_FIELDS = (
+    "study_minutes", "session_count", "questions_answered",
+    "correct_answers", "score_sum", "score_count"
+)
+
+
+def to_date(value: Any) -> date:
+    """兼容不同数据库 func.date() 的返回类型"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
+
+
+def local_time(value: datetime) -> datetime:
+    """数据库中的时间为UTC（naive），换算为服务器本地时间（naive），汇总按本地日期和小时分桶"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone().replace(tzinfo=None)
+
+
+def utc_start_of(day: date) -> datetime:
+    """本地日期零点对应的UTC时间（naive），用于按本地日期筛选原始记录"""
+    return datetime.combine(day, time.min).astimezone(timezone.utc).replace(tzinfo=None)
+
+
+class ActivityRollupService:
+    """每日学习活动汇总服务：写入时增量更新，批处理任务回填"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def record_activity(
+        self,
+        user_id: int,
+        occurred_at: Optional[datetime] = None,
+        study_minutes: int = 0,
+        sessions: int = 0,
+        questions: int = 0,
+        correct: int = 0,
+        score: Optional[float] = None
+    ):
+        """记录一次学习活动（不提交事务，由调用方提交）
+
+        occurred_at 与数据库中的时间一致为UTC，按服务器本地时间的日期和小时分桶。
+        计数字段用 SQL 表达式原子累加，并发请求不会互相覆盖。
+        """
+        occurred_at = local_time(occurred_at or datetime.utcnow())
+        activity_date = occurred_at.date()
+        self._ensure_row(user_id, activity_date)
+        StreakService(self.db).mark_active(user_id, activity_date)
+
+        values = {
+            DailyUserActivity.study_minutes: func.coalesce(DailyUserActivity.study_minutes, 0) + study_minutes,
+            DailyUserActivity.session_count: func.coalesce(DailyUserActivity.session_count, 0) + sessions,
+            DailyUserActivity.questions_answered: func.coalesce(DailyUserActivity.questions_answered, 0) + questions,
+            DailyUserActivity.correct_answers: func.coalesce(DailyUserActivity.correct_answers, 0) + correct,
+        }
+        if score is not None:
+            values[DailyUserActivity.score_sum] = func.coalesce(DailyUserActivity.score_sum, 0) + score
+            values[DailyUserActivity.score_count] = func.coalesce(DailyUserActivity.score_count, 0) + 1
+        row_filter = (DailyUserActivity.user_id == user_id, DailyUserActivity.activity_date == activity_date)
+        self.db.query(DailyUserActivity).filter(*row_filter).update(values, synchronize_session=False)
+
+        if sessions or study_minutes:
+            # 上面的 UPDATE 已锁定该行，读取后回写小时分布不会与其他请求交错
+            hourly_sessions, hourly_minutes = self.db.query(
+                DailyUserActivity.hourly_sessions, DailyUserActivity.hourly_minutes
+            ).filter(*row_filter).one()
+            hourly_sessions = list(hourly_sessions or [0] * HOURS_PER_DAY)
+            hourly_minutes = list(hourly_minutes or [0] * HOURS_PER_DAY)
+            hourly_sessions[occurred_at.hour] += sessions
+            hourly_minutes[occurred_at.hour] += study_minutes
+            self.db.query(DailyUserActivity).filter(*row_filter).update({
+                DailyUserActivity.hourly_sessions: hourly_sessions,
+                DailyUserActivity.hourly_minutes: hourly_minutes
+            }, synchronize_session=False)
+
+        # 批量 UPDATE 不经过 before_flush，需自行登记数据版本
+        mark_changed(self.db, user_scope(user_id))
+
+    def _ensure_row(self, user_id: int, activity_date: date):
+        """确保汇总行存在；并发的首次写入由唯一约束去重，不会抛出 IntegrityError"""
+        self.db.execute(insert_ignoring_conflicts(self.db, DailyUserActivity), [{
+            "user_id": user_id,
+            "activity_date": activity_date,
+            "study_minutes": 0,
+            "session_count": 0,
+            "questions_answered": 0,
+            "correct_answers": 0,
+            "score_sum": 0.0,
+            "score_count": 0
+        }])
+
+    def get_daily_map(self, user_id: int, start_date: date, end_date: date) -> Dict[date, DailyUserActivity]:
+        """获取日期区间内的汇总行，按日期索引"""
+        rows = self.db.query(DailyUserActivity).filter(
+            DailyUserActivity.user_id == user_id,
+            DailyUserActivity.activity_date >= start_date,
+            DailyUserActivity.activity_date <= end_date
+        ).all()
+        return {row.activity_date: row for row in rows}
+
+    def get_recent_days(self, user_id: int, days: int, end_date: Optional[date] = None) -> List[Dict[str, Any]]:
+        """获取最近N天（含当天）的逐日数据，缺失日期补零，按日期正序"""
+        end_date = end_date or datetime.now().date()
+        start_date = end_date - timedelta(days=days - 1)
+        daily_map = self.get_daily_map(user_id, start_date, end_date)
+
+        series = []
+        for offset in range(days):
+            day = start_date + timedelta(days=offset)
+            row = daily_map.get(day)
+            series.append({
+                "date": day,
+                **{field: (getattr(row, field) or 0) if row else 0 for field in ROLLUP_FIELDS}
+            })
+        return series
+
+    def get_totals(self, user_id: int) -> Dict[str, Any]:
+        """汇总用户全部日期的累计数据"""
+        totals = self.db.query(
+            func.coalesce(func.sum(DailyUserActivity.study_minutes), 0).label('study_minutes'),
+            func.coalesce(func.sum(DailyUserActivity.session_count), 0).label('session_count'),
+            func.coalesce(func.sum(DailyUserActivity.questions_answered), 0).label('questions_answered'),
+            func.coalesce(func.sum(DailyUserActivity.correct_answers), 0).label('correct_answers'),
+            func.coalesce(func.sum(DailyUserActivity.score_sum), 0).label('score_sum'),
+            func.coalesce(func.sum(DailyUserActivity.score_count), 0).label('score_count'),
+            func.count(DailyUserActivity.id).label('active_days')
+        ).filter(DailyUserActivity.user_id == user_id).one()
+        return dict(totals._mapping)
+
+    def get_hourly_and_weekday_distribution(self, user_id: int) -> Dict[str, List[Dict[str, int]]]:
+        """根据汇总行计算按小时、按星期的学习分布"""
+        rows = self.db.query(
+            DailyUserActivity.activity_date,
+            DailyUserActivity.study_minutes,
+            DailyUserActivity.session_count,
+            DailyUserActivity.hourly_sessions,
+            DailyUserActivity.hourly_minutes
+        ).filter(DailyUserActivity.user_id == user_id).all()
+
+        hourly_sessions = [0] * HOURS_PER_DAY
+        hourly_minutes = [0] * HOURS_PER_DAY
+        weekly_sessions = [0] * 7
+        weekly_minutes = [0] * 7
+        for row in rows:
+            for hour in range(HOURS_PER_DAY):
+                hourly_sessions[hour] += (row.hourly_sessions or [0] * HOURS_PER_DAY)[hour]
+                hourly_minutes[hour] += (row.hourly_minutes or [0] * HOURS_PER_DAY)[hour]
+            # 与 extract('dow') 一致：周日为0
+            day_of_week = (row.activity_date.weekday() + 1) % 7
+            weekly_sessions[day_of_week] += row.session_count or 0
+            weekly_minutes[day_of_week] += row.study_minutes or 0
+
+        return {
+            "hourly": [
+                {"hour": hour, "session_count": hourly_sessions[hour], "total_time": hourly_minutes[hour]}
+                for hour in range(HOURS_PER_DAY) if hourly_sessions[hour] or hourly_minutes[hour]
+            ],
+            "weekly": [
+                {"day_of_week": day, "session_count": weekly_sessions[day], "total_time": weekly_minutes[day]}
+                for day in range(7) if weekly_sessions[day] or weekly_minutes[day]
+            ]
+        }
+
+    def backfill(self, start_date: date, end_date: date, user_ids: Optional[Iterable[int]] = None) -> int:
+        """从原始记录重建日期区间内的汇总行，返回写入行数
+
+        数据源与写入时的增量更新一致（学习进度、题库答题、已完成的练习会话），同样按服务器本地时间分桶。
+        考试成绩没有时间戳无法重建，已有汇总行的 score_sum/score_count 原样保留。
+        """
+        start_at = utc_start_of(start_date)
+        end_at = utc_start_of(end_date + timedelta(days=1))
+        user_ids = list(user_ids) if user_ids is not None else None
+
+        buckets: Dict[tuple, Dict[str, Any]] = defaultdict(lambda: {
+            "study_minutes": 0,
+            "session_count": 0,
+            "questions_answered": 0,
+            "correct_answers": 0,
+            "score_sum": 0.0,
+            "score_count": 0,
+            "hourly_sessions": [0] * HOURS_PER_DAY,
+            "hourly_minutes": [0] * HOURS_PER_DAY
+        })
+
+        def add_timed(rows):
+            for row in rows:
+                occurred_at = local_time(row.occurred_at)
+                bucket = buckets[(row.user_id, occurred_at.date())]
+                minutes = int(row.minutes or 0)
+                bucket["study_minutes"] += minutes
+                bucket["session_count"] += row.sessions or 0
+                bucket["questions_answered"] += row.questions or 0
+                bucket["correct_answers"] += row.correct or 0
+                if row.score is not None:
+                    bucket["score_sum"] += float(row.score)
+                    bucket["score_count"] += 1
+                if row.sessions or minutes:
+                    bucket["hourly_sessions"][occurred_at.hour] += row.sessions or 0
+                    bucket["hourly_minutes"][occurred_at.hour] += minutes
+
+        # 学习进度记录
+        add_timed(self._timed_rows(
+            LearningProgress, LearningProgress.recorded_at, start_at, end_at, user_ids,
+            minutes=LearningProgress.study_time,
+            sessions=literal(1)
+        ))
+
+        # 题库答题记录
+        add_timed(self._timed_rows(
+            UserAnswer, UserAnswer.created_at, start_at, end_at, user_ids,
+            questions=literal(1),
+            correct=case((UserAnswer.is_correct == True, 1), else_=0)
+        ))
+
+        # 已完成的练习会话
+        add_timed(self._timed_rows(
+            PracticeSession, PracticeSession.completed_at, start_at, end_at, user_ids,
+            extra_filters=[PracticeSession.is_completed == True],
+            # 与写入时一致，按单次会话取整分钟
+            minutes=PracticeSession.total_time / 60,
+            sessions=literal(1),
+            score=PracticeSession.accuracy_rate * 100
+        ))
+
+        existing_query = self.db.query(DailyUserActivity).filter(
+            DailyUserActivity.activity_date >= start_date,
+            DailyUserActivity.activity_date <= end_date
+        )
+        if user_ids is not None:
+            existing_query = existing_query.filter(DailyUserActivity.user_id.in_(user_ids))
+
+        # 考试成绩只能增量记录，保留已有行的得分；没有汇总行的日期使用练习会话的得分
+        for user_id, activity_date, score_sum, score_count in existing_query.with_entities(
+            DailyUserActivity.user_id, DailyUserActivity.activity_date,
+            DailyUserActivity.score_sum, DailyUserActivity.score_count
+        ).all():
+            bucket = buckets[(user_id, activity_date)]
+            bucket["score_sum"] = score_sum or 0.0
+            bucket["score_count"] = score_count or 0
+
+        existing_query.delete(synchronize_session=False)
+
+        self.db.bulk_insert_mappings(DailyUserActivity, [
+            {"user_id": user_id, "activity_date": activity_date, **values}
+            for (user_id, activity_date), values in buckets.items()
+        ])
+
+        # 学习日位图随汇总一起重建；只有回填区间内有汇总行的用户（已有行也在 buckets 中）学习日才可能变化
+        affected_users = {user_id for user_id, _ in buckets}
+        StreakService(self.db).rebuild(sorted(affected_users))
+        mark_changed(self.db, *(user_scope(user_id) for user_id in affected_users))
+        self.db.commit()
+
+        logger.info(f"回填每日学习汇总 {start_date} ~ {end_date}，写入 {len(buckets)} 行")
+        return len(buckets)
+
+    def _timed_rows(self, model, time_column, start_at: datetime, end_at: datetime,
+                    user_ids: Optional[List[int]], extra_filters: Optional[list] = None, **measures):
+        """逐行读取原始记录的时间和度量（本地时间分桶在 Python 中完成，不依赖数据库的时区函数）"""
+        columns = [model.user_id.label('user_id'), time_column.label('occurred_at')]
+        for name in ("minutes", "sessions", "questions", "correct", "score"):
+            if name in measures:
+                columns.append(measures[name].label(name))
+
+        query = self.db.query(*columns).filter(
+            time_column >= start_at,
+            time_column < end_at,
+            *(extra_filters or [])
+        )
+        if user_ids is not None:
+            query = query.filter(model.user_id.in_(user_ids))
+
+        # 补齐未选择的度量列，便于统一处理
+        return (_MeasureRow(row._mapping) for row in query.yield_per(1000))
+
+
+class _MeasureRow:
+    """原始记录行，缺失的度量列视为0（得分缺失视为None）"""
+
+    def __init__(self, mapping):
+        self._mapping = dict(mapping)
+
+    def __getattr__(self, name):
+        return self._mapping.get(name, None if name == "score" else 0)
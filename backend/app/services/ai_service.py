@@ -2,12 +2,20 @@ import json
 import logging
 import hashlib
 import asyncio
+import time
 from typing import List, Dict, Optional, Any
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from app.models.question import Question, QuestionCategory
 from app.models.user import User, StudySession, WrongQuestion
 from config import settings
+from app.services.prompt_registry import get_prompt, prompt_version, estimate_tokens
+from app.services.ai_usage_service import AIQuotaExceeded, usage_meter, current_user_id
+from app.services.llm_dispatcher import llm_dispatcher, current_priority
+from app.services.llm_stub import StubLLMClient, wrap_clients
+from app.services.speech_service import transcribe_stream
+from app.utils.circuit_breaker import CircuitBreaker, OPEN as CIRCUIT_OPEN
+from app.utils.semantic_cache import SemanticCache
 import os
 from functools import wraps
 import aiohttp
@@ -23,6 +31,44 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# 各AI服务商的熔断器，进程内所有AIService实例共享
+_provider_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_provider_breaker(name: str) -> CircuitBreaker:
+    breaker = _provider_breakers.get(name)
+    if breaker is None:
+        breaker = _provider_breakers.setdefault(name, CircuitBreaker(
+            name,
+            failure_rate=settings.ai_breaker_failure_rate,
+            window_seconds=settings.ai_breaker_window_seconds,
+            min_calls=settings.ai_breaker_min_calls,
+            open_seconds=settings.ai_breaker_open_seconds
+        ))
+    return breaker
+
+
+async def run_provider_probes(service: "AIService", stop_event: asyncio.Event):
+    """后台定期试探熔断中的服务商，使其在没有用户请求承担试探延迟的情况下恢复"""
+    while not stop_event.is_set():
+        try:
+            await service.probe_providers()
+        except Exception as e:
+            logger.warning(f"AI服务商健康检查失败: {e}")
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=settings.ai_breaker_probe_interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+# 实时问答的语义缓存，进程内所有AIService实例共享
+_qa_semantic_cache = SemanticCache(
+    dim=settings.qa_semantic_cache_dim,
+    threshold=settings.qa_semantic_cache_threshold,
+    max_entries=settings.qa_semantic_cache_size,
+    ttl=settings.ai_cache_ttl
+)
+
 
 def ai_fallback(func):
     """AI服务降级装饰器"""
@@ -31,6 +77,9 @@ def ai_fallback(func):
     async def wrapper(*args, **kwargs):
         try:
             return await func(*args, **kwargs)
+        except AIQuotaExceeded:
+            # 超出配额不降级，交给全局处理器返回429
+            raise
         except Exception as e:
             logger.warning(f"AI服务调用失败，使用降级方案: {e}")
             # 调用对应的降级方法
@@ -54,36 +103,19 @@ class AIService:
         self._clients = {}
         self._ai_available = False
         self._cache = {}
+        self.prompt_stats: Dict[str, Dict[str, int]] = {}  # 各提示词模板的调用次数与预估token数
         self._init_ai_clients()
 
     def _init_ai_clients(self):
         """初始化多个AI客户端"""
         try:
-            # 初始化DeepSeek客户端
-            if settings.deepseek_api_key:
-                self._clients['deepseek'] = OpenAI(
-                    api_key=settings.deepseek_api_key,
-                    base_url=settings.deepseek_base_url)
-                logger.info("DeepSeek AI客户端初始化成功")
-
-            # 初始化OpenAI客户端
-            if settings.openai_api_key:
-                self._clients['openai'] = OpenAI(
-                    api_key=settings.openai_api_key)
-                logger.info("OpenAI客户端初始化成功")
-
-            # 初始化智谱AI客户端
-            if settings.zhipu_api_key:
-                self._clients['zhipu'] = OpenAI(
-                    api_key=settings.zhipu_api_key,
-                    base_url=settings.zhipu_base_url)
-                logger.info("智谱AI客户端初始化成功")
-
-            # 初始化通义千问客户端
-            if settings.qwen_api_key:
-                self._clients['qwen'] = OpenAI(api_key=settings.qwen_api_key,
-                                               base_url=settings.qwen_base_url)
-                logger.info("通义千问客户端初始化成功")
+            if settings.llm_stub_enabled:
+                # 本地模拟服务商，走与真实服务商相同的调用路径
+                self._clients = {name: StubLLMClient(name) for name in settings.llm_stub_providers}
+                logger.info(f"使用本地模拟AI服务商: {', '.join(self._clients)}")
+            else:
+                self._init_provider_clients()
+            self._clients = wrap_clients(self._clients)
 
             self._ai_available = len(self._clients) > 0
             if not self._ai_available:
@@ -93,9 +125,36 @@ class AIService:
             logger.error(f"AI客户端初始化失败: {e}")
             self._ai_available = False
 
+    def _init_provider_clients(self):
+        # 初始化DeepSeek客户端
+        if settings.deepseek_api_key:
+            self._clients['deepseek'] = OpenAI(
+                api_key=settings.deepseek_api_key,
+                base_url=settings.deepseek_base_url)
+            logger.info("DeepSeek AI客户端初始化成功")
+
+        # 初始化OpenAI客户端
+        if settings.openai_api_key:
+            self._clients['openai'] = OpenAI(
+                api_key=settings.openai_api_key)
+            logger.info("OpenAI客户端初始化成功")
+
+        # 初始化智谱AI客户端
+        if settings.zhipu_api_key:
+            self._clients['zhipu'] = OpenAI(
+                api_key=settings.zhipu_api_key,
+                base_url=settings.zhipu_base_url)
+            logger.info("智谱AI客户端初始化成功")
+
+        # 初始化通义千问客户端
+        if settings.qwen_api_key:
+            self._clients['qwen'] = OpenAI(api_key=settings.qwen_api_key,
+                                           base_url=settings.qwen_base_url)
+            logger.info("通义千问客户端初始化成功")
+
     def _get_cache_key(self, func_name: str, **kwargs) -> str:
-        """生成缓存键"""
-        cache_data = {'func': func_name, 'kwargs': sorted(kwargs.items())}
+        """生成缓存键（包含提示词模板版本，修改提示词后旧缓存自动失效）"""
+        cache_data = {'func': func_name, 'prompt_version': prompt_version(func_name), 'kwargs': sorted(kwargs.items())}
         return hashlib.md5(json.dumps(cache_data,
                                       sort_keys=True).encode()).hexdigest()
 
@@ -117,77 +176,156 @@ class AIService:
         if settings.ai_cache_enabled:
             self._cache[cache_key] = (data, datetime.now().timestamp())
 
+    async def _call_prompt(self, name: str, **values) -> Optional[str]:
+        """按注册的提示词模板调用AI，并记录预估token数"""
+        template = get_prompt(name)
+        prompt = template.render(**values)
+        prompt_tokens = estimate_tokens(template.system) + estimate_tokens(prompt)
+        content = await self._call_ai_api(prompt, template.system or None, feature=name)
+
+        completion_tokens = estimate_tokens(content)
+        stats = self.prompt_stats.setdefault(name, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+        stats["calls"] += 1
+        stats["prompt_tokens"] += prompt_tokens
+        stats["completion_tokens"] += completion_tokens
+        logger.info(
+            f"提示词 {name}@{template.version}: 预估输入 {prompt_tokens} tokens"
+            f"（固定前缀 {template.prefix_tokens}），输出 {completion_tokens} tokens")
+        return content
+
+    def _record_usage(self, provider: str, feature: str, user_id: int, prompt_tokens: int,
+                      completion_tokens: int, started: float, success: bool):
+        """记录一次服务商调用的用量，计数达到阈值时在线程池中批量写入数据库"""
+        latency_ms = int((time.monotonic() - started) * 1000)
+        if usage_meter.record(provider, feature, user_id, prompt_tokens, completion_tokens, latency_ms, success):
+            asyncio.get_running_loop().run_in_executor(None, usage_meter.flush)
+
     async def _call_ai_api(self,
                            prompt: str,
                            system_prompt: Optional[str] = None,
                            model_preference: str = "deepseek",
-                           max_retries: int = 3) -> Optional[str]:
-        """调用AI API的通用方法，支持多模型"""
+                           max_retries: int = 3,
+                           feature: str = "other") -> Optional[str]:
+        """调用AI API的通用方法，支持多模型；按功能和当前用户计量用量并检查配额"""
         if not self._ai_available or not self._clients:
             return None
 
-        # 模型优先级：deepseek > openai > zhipu > qwen
-        model_order = ['deepseek', 'openai', 'zhipu', 'qwen']
-        if model_preference in model_order:
-            model_order.insert(0, model_preference)
+        user_id = current_user_id()
+        usage_meter.check_quota(feature, user_id)
+        estimated_prompt_tokens = estimate_tokens(system_prompt) + estimate_tokens(prompt)
 
+        # 模型优先级：deepseek > openai > zhipu > qwen > 其他（如自定义名称的模拟服务商），偏好的模型排在最前
+        model_order = [model_preference] + [
+            name for name in ('deepseek', 'openai', 'zhipu', 'qwen', *self._clients) if name != model_preference
+        ]
+        model_order = list(dict.fromkeys(model_order))
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": prompt})
+
+        # 按优先级排队获取调用名额（交互请求优先，批量任务让路）
+        priority = current_priority()
+        async with llm_dispatcher.slot(priority):
+            return await self._try_providers(
+                messages, model_order, feature, user_id, estimated_prompt_tokens, max_retries, priority)
+
+    async def _try_providers(self, messages: List[Dict[str, str]], model_order: List[str], feature: str,
+                             user_id: int, estimated_prompt_tokens: int, max_retries: int,
+                             priority: str) -> Optional[str]:
+        """按顺序尝试各服务商，跳过熔断中和额度不足的服务商"""
         for attempt in range(max_retries):
-            for model_name in model_order:
-                client = self._clients.get(model_name)
-                if not client:
+            # 跳过熔断中的服务商；全部不可用时立即返回，由调用方降级为本地生成
+            candidates = [
+                name for name in model_order
+                if name in self._clients and get_provider_breaker(name).available()
+            ]
+            if not candidates:
+                logger.warning(f"所有AI服务商均处于熔断状态，跳过调用 ({feature})")
+                return None
+            if attempt > 0:
+                await asyncio.sleep(1)
+            await llm_dispatcher.wait_for_rate(candidates, estimated_prompt_tokens, priority)
+
+            for model_name in candidates:
+                if not llm_dispatcher.take_rate(model_name, estimated_prompt_tokens, priority):
+                    continue
+                breaker = get_provider_breaker(model_name)
+                if not breaker.allow():
                     continue
+                started = time.monotonic()
                 try:
-                    messages = []
-                    if system_prompt:
-                        messages.append({
-                            "role": "system",
-                            "content": system_prompt
-                        })
-                    messages.append({"role": "user", "content": prompt})
-
-                    # 根据模型设置参数
-                    if model_name == 'deepseek':
-                        model = settings.deepseek_model
-                        max_tokens = settings.deepseek_max_tokens
-                        temperature = settings.deepseek_temperature
-                    elif model_name == 'openai':
-                        model = settings.openai_model
-                        max_tokens = settings.openai_max_tokens
-                        temperature = settings.openai_temperature
-                    else:
-                        model = getattr(settings, f'{model_name}_model',
-                                        'gpt-3.5-turbo')
-                        max_tokens = 2000
-                        temperature = 0.7
-
-                    response = client.chat.completions.create(
+                    model, max_tokens, temperature = self._chat_params(model_name)
+                    # SDK为同步调用，放到线程中执行，避免等待服务商时阻塞事件循环
+                    response = await asyncio.to_thread(
+                        self._clients[model_name].chat.completions.create,
                         model=model,
                         messages=messages,
                         max_tokens=max_tokens,
                         temperature=temperature,
                         stream=False,
                         timeout=settings.ai_service_timeout or 60)
+                    breaker.record_success()
 
                     content = response.choices[0].message.content
+                    # 优先使用服务商返回的实际用量，没有时按字符数估算
+                    usage = getattr(response, 'usage', None)
+                    completion_tokens = getattr(usage, 'completion_tokens', None) or estimate_tokens(content)
+                    llm_dispatcher.charge_tokens(model_name, completion_tokens)
+                    self._record_usage(
+                        model_name, feature, user_id,
+                        getattr(usage, 'prompt_tokens', None) or estimated_prompt_tokens,
+                        completion_tokens, started, bool(content))
                     if content:
                         logger.info(
                             f"{model_name} AI API调用成功 (尝试 {attempt + 1})")
                         return content
                 except httpx.TimeoutException as e:
+                    breaker.record_failure(f"超时: {e}")
+                    self._record_usage(model_name, feature, user_id, 0, 0, started, False)
                     logger.warning(
                         f"{model_name} AI API调用超时 (尝试 {attempt + 1}): {e}")
-                    if attempt < max_retries - 1:
-                        await asyncio.sleep(2)
-                    continue
                 except Exception as e:
+                    breaker.record_failure(str(e))
+                    self._record_usage(model_name, feature, user_id, 0, 0, started, False)
                     logger.warning(
                         f"{model_name} AI API调用失败 (尝试 {attempt + 1}): {e}")
-                    if attempt < max_retries - 1:
-                        await asyncio.sleep(1)
-                    continue
         logger.error("所有AI API调用失败，已达到最大重试次数。请检查网络、API Key 或稍后重试。")
         return None
 
+    def _chat_params(self, model_name: str):
+        """各服务商的模型名、最大token数和温度"""
+        if model_name == 'deepseek':
+            return settings.deepseek_model, settings.deepseek_max_tokens, settings.deepseek_temperature
+        if model_name == 'openai':
+            return settings.openai_model, settings.openai_max_tokens, settings.openai_temperature
+        return getattr(settings, f'{model_name}_model', 'gpt-3.5-turbo'), 2000, 0.7
+
+    async def probe_providers(self) -> Dict[str, str]:
+        """对冷却结束的熔断服务商发送极小的试探请求，成功则恢复，返回 {服务商: 状态}"""
+        for model_name, client in self._clients.items():
+            breaker = get_provider_breaker(model_name)
+            if breaker.state != CIRCUIT_OPEN or breaker.cooling_down() or not breaker.allow():
+                continue
+            started = time.monotonic()
+            try:
+                model, _, _ = self._chat_params(model_name)
+                await asyncio.to_thread(
+                    client.chat.completions.create,
+                    model=model,
+                    messages=[{"role": "user", "content": "ping"}],
+                    max_tokens=1,
+                    stream=False,
+                    timeout=settings.ai_breaker_probe_timeout)
+                breaker.record_success()
+                self._record_usage(model_name, "health_probe", 0, 1, 1, started, True)
+                logger.info(f"{model_name} 试探请求成功，恢复调用")
+            except Exception as e:
+                breaker.record_failure(str(e))
+                self._record_usage(model_name, "health_probe", 0, 0, 0, started, False)
+                logger.warning(f"{model_name} 试探请求失败，继续熔断: {e}")
+        return {name: get_provider_breaker(name).state for name in self._clients}
+
     @ai_fallback
     async def generate_questions(
             self,
@@ -210,42 +348,12 @@ class AIService:
                 "short_answer"
             ]
 
-        prompt = f"""
-        请为学科：{subject}，难度等级：{difficulty}，生成{count}道题目。
-        
-        要求：
-        1. 题目类型包括：{', '.join(question_types)}
-        2. 难度等级{difficulty}对应：1=基础，2=简单，3=中等，4=困难，5=专家
-        3. 每道题目包含：content(题目内容)、question_type(题目类型)、options(选项，仅选择题)、answer(答案)、explanation(解析)、difficulty(难度)、tags(知识点标签)
-        4. 返回JSON数组格式
-        5. 确保题目质量高，符合教育标准
-        
-        示例格式：
-        [
-            {{
-                "content": "题目内容",
-                "question_type": "single_choice",
-                "options": ["A", "B", "C", "D"],
-                "answer": "A",
-                "explanation": "详细解析",
-                "difficulty": {difficulty},
-                "tags": ["知识点1", "知识点2"]
-            }}
-        ]
-        """
-
-        system_prompt = """你是一个专业的教育AI出题助手，具有丰富的教学经验。
-        
-        出题原则：
-        1. 题目质量：确保题目准确、清晰、有教育价值
-        2. 难度适中：根据难度等级合理设置题目复杂度
-        3. 知识点覆盖：题目要覆盖相关知识点
-        4. 选项设计：选择题选项要合理，避免明显错误选项
-        5. 解析详细：提供清晰详细的解题思路和知识点说明
-        
-        请严格按照要求生成题目，确保输出格式正确。"""
-
-        content = await self._call_ai_api(prompt, system_prompt)
+        content = await self._call_prompt(
+            'generate_questions',
+            subject=subject,
+            difficulty=difficulty,
+            count=count,
+            question_types=', '.join(question_types))
         logger.warning(f"AI原始返回: {content}")
         if not content or not (content.strip().startswith('{')
                                or content.strip().startswith('[')):
@@ -284,68 +392,14 @@ class AIService:
         if cached_result:
             return cached_result
 
-        prompt = f"""
-        请对以下题目进行专业的智能评分分析：
-        
-        【题目信息】
-        题目内容：{question_content}
-        题目类型：{question_type}
-        满分：{max_score}分
-        学生水平：{student_level}
-        
-        【答案对比】
-        标准答案：{standard_answer}
-        学生答案：{student_answer}
-        
-        【评分要求】
-        请从以下维度进行详细评分：
-        1. 内容准确性（40%）：答案内容的正确程度
-        2. 逻辑完整性（25%）：解题思路和逻辑的完整性
-        3. 表达规范性（20%）：语言表达和格式规范性
-        4. 创新思维（15%）：解题方法的创新性和灵活性
-        
-        请考虑学生水平进行个性化评分，对初学者要更宽容，对高水平学生要更严格。
-        
-        【输出格式】
-        请返回JSON格式的详细评分结果，包含：
-        {{
-            "score": 得分（整数，0-{max_score}）,
-            "accuracy_score": 内容准确性得分（0-100）,
-            "logic_score": 逻辑完整性得分（0-100）,
-            "expression_score": 表达规范性得分（0-100）,
-            "creativity_score": 创新思维得分（0-100）,
-            "overall_accuracy": 总体准确度百分比（0-100）,
-            "detailed_feedback": {{
-                "strengths": ["优点1", "优点2"],
-                "weaknesses": ["不足1", "不足2"],
-                "specific_errors": ["具体错误1", "具体错误2"],
-                "improvement_suggestions": ["改进建议1", "改进建议2"]
-            }},
-            "learning_insights": {{
-                "knowledge_gaps": ["知识盲点1", "知识盲点2"],
-                "skill_development": ["技能提升建议1", "技能提升建议2"],
-                "next_steps": ["下一步学习重点1", "下一步学习重点2"]
-            }},
-            "encouragement": "个性化鼓励话语",
-            "difficulty_adjustment": "难度调整建议"
-        }}
-        
-        请确保评分客观公正，反馈具体详细，建议具有可操作性。
-        """
-
-        system_prompt = """你是一个专业的教育AI评分专家，具有丰富的教学经验和心理学背景。
-        
-        评分原则：
-        1. 客观公正：基于答案内容进行客观评分，不受主观偏见影响
-        2. 个性化：根据学生水平调整评分标准，初学者更宽容，高水平更严格
-        3. 鼓励为主：在指出不足的同时，要充分肯定学生的优点和努力
-        4. 具体详细：反馈要具体到具体的错误点和改进建议
-        5. 教育价值：评分不仅要给出分数，更要帮助学生学习和成长
-        6. 发展性：关注学生的进步潜力和发展方向
-        
-        请严格按照要求进行评分，确保输出格式正确。"""
-
-        content = await self._call_ai_api(prompt, system_prompt)
+        content = await self._call_prompt(
+            'smart_grading',
+            question_content=question_content,
+            question_type=question_type,
+            max_score=max_score,
+            student_level=student_level,
+            standard_answer=standard_answer,
+            student_answer=student_answer)
         logger.warning(f"AI原始返回: {content}")
         if not content or not (content.strip().startswith('{')
                                or content.strip().startswith('[')):
@@ -371,16 +425,12 @@ class AIService:
     async def speech_to_text(self,
                              audio_data: bytes,
                              language: str = "zh-CN") -> Dict:
-        """语音转文字功能"""
+        """语音转文字功能（整段WAV音频）；长音频应使用 speech_service 按块流式识别"""
         try:
-            # 这里可以集成各种语音识别API
-            # 目前使用模拟实现
-            return {
-                "text": "这是语音识别的示例文本",
-                "confidence": 0.95,
-                "language": language,
-                "duration": 3.5
-            }
+            async def chunks():
+                yield audio_data
+
+            return await transcribe_stream(chunks(), language)
         except Exception as e:
             logger.error(f"语音识别失败: {e}")
             return {
@@ -417,43 +467,22 @@ class AIService:
         if cached_result:
             return cached_result
 
-        prompt = f"""
-        请回答以下问题，考虑用户的学习水平：{user_level}
-        
-        问题：{question}
-        
-        {f"相关背景：{context}" if context else ""}
-        
-        请提供：
-        1. 直接答案
-        2. 详细解释
-        3. 相关知识点
-        4. 学习建议
-        5. 延伸阅读
-        
-        请用JSON格式返回：
-        {{
-            "answer": "直接答案",
-            "explanation": "详细解释",
-            "knowledge_points": ["知识点1", "知识点2"],
-            "learning_tips": ["学习建议1", "学习建议2"],
-            "related_topics": ["相关主题1", "相关主题2"],
-            "difficulty_level": "适合的学习水平"
-        }}
-        """
-
-        system_prompt = """你是一个专业的教育AI助手，具有丰富的教学经验。
-        
-        回答原则：
-        1. 准确：提供准确的信息和答案
-        2. 易懂：根据用户水平调整解释的复杂度
-        3. 全面：从多个角度提供信息和见解
-        4. 实用：提供可操作的学习建议
-        5. 鼓励：保持积极正面的学习态度
-        
-        请严格按照要求回答问题，确保输出格式正确。"""
-
-        content = await self._call_ai_api(prompt, system_prompt)
+        # 换一种问法的同一问题：在相同水平、相同背景下按相似度匹配
+        use_semantic = settings.ai_cache_enabled and settings.qa_semantic_cache_enabled
+        namespace = (prompt_version('real_time_qa'), user_level, context)
+        if use_semantic:
+            similar = _qa_semantic_cache.get(question, namespace)
+            if similar:
+                result, score = similar
+                logger.info(f"实时问答命中语义缓存（相似度 {score:.2f}）: {question}")
+                self._set_cache(cache_key, result)
+                return result
+
+        content = await self._call_prompt(
+            'real_time_qa',
+            user_level=user_level,
+            context=context or "无",
+            question=question)
         logger.warning(f"AI原始返回: {content}")
         if not content or not content.strip().startswith('```json'):
             raise ValueError(f"AI返回内容为空或非JSON格式: {content}")
@@ -462,6 +491,8 @@ class AIService:
                 result = json.loads(content[7:-3])
                 if isinstance(result, dict):
                     self._set_cache(cache_key, result)
+                    if use_semantic:
+                        _qa_semantic_cache.set(question, result, namespace)
                     return result
             except json.JSONDecodeError as e:
                 logger.warning(f"AI返回的JSON解析失败: {e}")
@@ -720,27 +751,14 @@ class AIService:
                 "essay": 2
             }
 
-        skill_part = f"\n技能点要求：{skill}" if skill else ""
-        tags_part = f"\n知识点标签：{','.join(tags)}" if tags is not None and len(
-            tags) > 0 else ""
-        prompt = f"""
-        请为{subject}学科生成一套{difficulty}星难度的{exam_type}试卷。{skill_part}{tags_part}
-        
-        题目分布要求：
-        {json.dumps(question_distribution, ensure_ascii=False, indent=2)}
-        
-        每道题目需包含：content, question_type, options, answer, explanation, difficulty, score, skill, tags
-        
-        请返回JSON格式的试卷，包含：
-        - exam_info: 试卷信息（标题、说明、总分、时长）
-        - questions: 题目数组，每题包含content, question_type, options, answer, explanation, difficulty, score, skill, tags
-        - answer_sheet: 答案页
-        - analysis: 试卷分析
-        """
-
-        system_prompt = "你是一个专业的教育AI组卷助手，请严格按照要求生成试卷。"
-
-        content = await self._call_ai_api(prompt, system_prompt)
+        content = await self._call_prompt(
+            'generate_exam',
+            subject=subject,
+            difficulty=difficulty,
+            exam_type=exam_type,
+            skill=skill or "不限",
+            tags=','.join(tags) if tags else "不限",
+            question_distribution=json.dumps(question_distribution, ensure_ascii=False, indent=2))
         logger.warning(f"AI原始返回: {content}")
         if not content or not (content.strip().startswith('{')
                                or content.strip().startswith('[')):
@@ -837,25 +855,8 @@ class AIService:
         # 获取用户学习数据
         learning_data = await self._get_user_learning_data(user_id, db)
 
-        prompt = f"""
-        基于以下学习数据，生成详细的学习分析报告：
-        
-        学习数据：
-        {json.dumps(learning_data, ensure_ascii=False, indent=2)}
-        
-        请返回JSON格式的分析报告，包含：
-        - overall_performance: 整体表现（总分、平均分、学习时长等）
-        - subject_analysis: 各学科详细分析
-        - learning_patterns: 学习模式分析
-        - strengths_weaknesses: 优势劣势分析
-        - recommendations: 个性化建议
-        - improvement_plan: 改进计划
-        - progress_trend: 进步趋势
-        """
-
-        system_prompt = "你是一个专业的教育数据分析师，请基于学习数据生成详细的分析报告。"
-
-        content = await self._call_ai_api(prompt, system_prompt)
+        content = await self._call_prompt(
+            'generate_learning_report', learning_data=json.dumps(learning_data, ensure_ascii=False, indent=2))
         logger.warning(f"AI原始返回: {content}")
         if not content or not (content.strip().startswith('{')
                                or content.strip().startswith('[')):
@@ -1025,104 +1026,12 @@ class AIService:
                                      user_answer: str, correct_answer: str,
                                      subject: str) -> Dict:
         """AI错题分析讲解"""
-        prompt = f"""
-        请对以下错题进行深入分析和个性化讲解：
-        
-        【题目信息】
-        题目：{question_content}
-        学科：{subject}
-        
-        【答案对比】
-        正确答案：{correct_answer}
-        学生答案：{user_answer}
-        
-        【分析要求】
-        请从以下维度进行详细分析：
-        
-        1. 错误诊断：
-           - 错误类型识别（概念错误、计算错误、审题错误、表达错误等）
-           - 错误原因分析（知识盲点、思维误区、粗心大意等）
-           - 错误严重程度评估
-        
-        2. 解题指导：
-           - 正确的解题思路和步骤
-           - 关键知识点梳理
-           - 解题技巧和方法
-        
-        3. 学习建议：
-           - 针对性的学习重点
-           - 类似题目的练习建议
-           - 避免同类错误的方法
-        
-        4. 个性化鼓励：
-           - 基于学生答案特点的鼓励
-           - 学习信心建设
-        
-        【输出格式】
-        请返回JSON格式的详细分析结果，包含：
-        {{
-            "error_analysis": {{
-                "error_type": "错误类型",
-                "error_severity": "错误严重程度（轻微/中等/严重）",
-                "root_cause": "根本原因分析",
-                "common_mistakes": ["常见错误1", "常见错误2"],
-                "misconceptions": ["错误认知1", "错误认知2"]
-            }},
-            "correct_solution": {{
-                "step_by_step": ["步骤1", "步骤2", "步骤3"],
-                "key_concepts": ["关键概念1", "关键概念2"],
-                "solution_tips": ["解题技巧1", "解题技巧2"],
-                "detailed_explanation": "详细解题过程"
-            }},
-            "knowledge_points": {{
-                "core_concepts": ["核心概念1", "核心概念2"],
-                "related_topics": ["相关知识点1", "相关知识点2"],
-                "prerequisites": ["前置知识1", "前置知识2"]
-            }},
-            "learning_guidance": {{
-                "focus_areas": ["重点学习领域1", "重点学习领域2"],
-                "practice_suggestions": ["练习建议1", "练习建议2"],
-                "avoidance_strategies": ["避免错误策略1", "避免错误策略2"],
-                "skill_development": ["技能提升建议1", "技能提升建议2"]
-            }},
-            "similar_questions": {{
-                "question_types": ["类似题型1", "类似题型2"],
-                "practice_recommendations": ["练习推荐1", "练习推荐2"],
-                "difficulty_progression": "难度递进建议"
-            }},
-            "personalized_encouragement": {{
-                "positive_aspects": ["积极方面1", "积极方面2"],
-                "confidence_building": "信心建设话语",
-                "motivation_message": "个性化激励信息"
-            }},
-            "difficulty_assessment": {{
-                "question_difficulty": "题目难度等级",
-                "student_readiness": "学生准备程度",
-                "recommended_approach": "建议学习方法"
-            }},
-            "improvement_plan": {{
-                "immediate_actions": ["立即行动1", "立即行动2"],
-                "short_term_goals": ["短期目标1", "短期目标2"],
-                "long_term_development": ["长期发展建议1", "长期发展建议2"]
-            }}
-        }}
-        
-        请确保分析深入透彻，建议具体可行，鼓励积极正面。
-        """
-
-        system_prompt = """你是一个专业的教育AI导师，具有丰富的教学经验和心理学背景。
-        
-        分析原则：
-        1. 诊断精准：准确识别错误类型和根本原因
-        2. 指导具体：提供可操作的解题步骤和学习建议
-        3. 鼓励为主：在指出问题的同时，充分肯定学生的努力和进步
-        4. 个性化：根据学生的具体错误，给出针对性的建议
-        5. 系统性：从知识点、解题技巧、学习策略等多角度进行分析
-        6. 发展性：不仅解决当前问题，更要帮助学生建立长期学习能力
-        
-        请严格按照要求进行分析，确保输出格式正确，内容具有教育价值。"""
-
-        content = await self._call_ai_api(prompt, system_prompt)
+        content = await self._call_prompt(
+            'analyze_wrong_question',
+            question_content=question_content,
+            subject=subject,
+            correct_answer=correct_answer,
+            user_answer=user_answer)
         logger.warning(f"AI原始返回: {content}")
         if not content or not (content.strip().startswith('{')
                                or content.strip().startswith('[')):
@@ -1275,24 +1184,8 @@ class AIService:
         # 获取用户学习数据
         learning_data = await self._get_user_learning_data(user_id, db)
 
-        prompt = f"""
-        基于以下学习数据，生成个性化的学习激励信息：
-        
-        学习数据：
-        {json.dumps(learning_data, ensure_ascii=False, indent=2)}
-        
-        请返回JSON格式的激励信息，包含：
-        - motivation_message: 激励话语
-        - achievement_highlight: 成就亮点
-        - next_goal: 下一个目标
-        - encouragement_tips: 鼓励建议
-        - reward_suggestion: 奖励建议
-        - progress_celebration: 进步庆祝
-        """
-
-        system_prompt = "你是一个专业的教育激励专家，请根据学习数据生成积极正面的激励信息。"
-
-        content = await self._call_ai_api(prompt, system_prompt)
+        content = await self._call_prompt(
+            'generate_learning_motivation', learning_data=json.dumps(learning_data, ensure_ascii=False, indent=2))
         logger.warning(f"AI原始返回: {content}")
         if not content or not (content.strip().startswith('{')
                                or content.strip().startswith('[')):
@@ -1400,25 +1293,8 @@ class AIService:
         # 获取用户学习数据
         learning_data = await self._get_user_learning_data(user_id, db)
 
-        prompt = f"""
-        基于以下学习数据，分析用户的学习风格和偏好：
-        
-        学习数据：
-        {json.dumps(learning_data, ensure_ascii=False, indent=2)}
-        
-        请返回JSON格式的学习风格分析，包含：
-        - learning_style: 学习风格类型（视觉型、听觉型、动觉型等）
-        - study_preferences: 学习偏好
-        - optimal_study_methods: 最佳学习方法
-        - learning_environment: 理想学习环境
-        - time_preferences: 时间偏好
-        - difficulty_preferences: 难度偏好
-        - feedback_preferences: 反馈偏好
-        """
-
-        system_prompt = "你是一个专业的教育心理学家，请基于学习数据识别用户的学习风格。"
-
-        content = await self._call_ai_api(prompt, system_prompt)
+        content = await self._call_prompt(
+            'identify_learning_style', learning_data=json.dumps(learning_data, ensure_ascii=False, indent=2))
         logger.warning(f"AI原始返回: {content}")
         if not content or not (content.strip().startswith('{')
                                or content.strip().startswith('[')):
@@ -1710,14 +1586,15 @@ class AIService:
             skill: str = None,
             difficulty: int = 3,
             count: int = 10,
-            question_types: List[str] = None) -> List[Dict]:
-        """AI生成题目，支持技能点（skill）"""
+            question_types: List[str] = None,
+            use_cache: bool = True) -> List[Dict]:
+        """AI生成题目，支持技能点（skill）；批量补充题目池时关闭缓存以免得到重复题目"""
         cache_key = self._get_cache_key('generate_questions_with_skill',
                                         subject=subject,
                                         skill=skill,
                                         difficulty=difficulty,
                                         count=count)
-        cached_result = self._get_from_cache(cache_key)
+        cached_result = self._get_from_cache(cache_key) if use_cache else None
         if cached_result:
             return cached_result
 
@@ -1727,46 +1604,13 @@ class AIService:
                 "short_answer"
             ]
 
-        skill_part = f"，技能点：{skill}" if skill else ""
-        prompt = f"""
-        请为学科：{subject}{skill_part}，难度等级：{difficulty}，生成{count}道题目。
-        
-        要求：
-        1. 题目类型包括：{', '.join(question_types)}
-        2. 难度等级{difficulty}对应：1=基础，2=简单，3=中等，4=困难，5=专家
-        3. 每道题目包含：content(题目内容)、question_type(题目类型)、options(选项，仅选择题)、answer(答案)、explanation(解析)、difficulty(难度)、tags(知识点标签)、skill(技能点)
-        4. 返回JSON数组格式
-        5. skill 字段为字符串或字符串数组，内容为本题考查的技能点
-        6. 确保题目质量高，符合教育标准
-        
-        示例格式：
-        [
-            {{
-                "content": "题目内容",
-                "question_type": "single_choice",
-                "options": ["A", "B", "C", "D"],
-                "answer": "A",
-                "explanation": "详细解析",
-                "difficulty": {difficulty},
-                "tags": ["知识点1", "知识点2"],
-                "skill": "技能点名称"
-            }}
-        ]
-        """
-
-        system_prompt = """你是一个专业的教育AI出题助手，具有丰富的教学经验。
-        
-        出题原则：
-        1. 题目质量：确保题目准确、清晰、有教育价值
-        2. 难度适中：根据难度等级合理设置题目复杂度
-        3. 知识点覆盖：题目要覆盖相关知识点和技能点
-        4. 选项设计：选择题选项要合理，避免明显错误选项
-        5. 解析详细：提供清晰详细的解题思路和知识点说明
-        6. skill 字段必须体现本题考查的技能点
-        
-        请严格按照要求生成题目，确保输出格式正确。"""
-
-        content = await self._call_ai_api(prompt, system_prompt)
+        content = await self._call_prompt(
+            'generate_questions_with_skill',
+            subject=subject,
+            skill=skill or "未指定",
+            difficulty=difficulty,
+            count=count,
+            question_types=', '.join(question_types))
         logger.warning(f"AI原始返回: {content}")
         if not content or not (content.strip().startswith('{')
                                or content.strip().startswith('[')):
@@ -0,0 +1,252 @@
+import contextvars
+import logging
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import SessionLocal
+from app.models.ai_usage import AIUsageDaily
+
+logger = logging.getLogger(__name__)
+
+# 当前请求的用户归属容器：中间件在请求开始时创建，get_current_user 写入用户ID。
+# 同步依赖在线程池中以上下文副本运行，重新设置变量对接口函数不可见，因此修改共享的容器
+_request_user: contextvars.ContextVar[Optional[Dict[str, int]]] = contextvars.ContextVar(
+    "ai_usage_request_user", default=None
+)
+
+# 聚合键 (日期, 服务商, 功能, 用户) -> [calls, failures, prompt_tokens, completion_tokens, latency_ms]
+UsageKey = Tuple[date, str, str, int]
+_FIELDS = ("calls", "failures", "prompt_tokens", "completion_tokens", "latency_ms")
+USAGE_GROUPS = ("usage_date", "provider", "feature", "user_id")
+# 配额计量方式 -> (数据库中的汇总表达式, 待写入数据的取值方法)；调用次数只计成功的调用，服务商故障重试不占用户配额
+_MEASURES = {
+    "tokens": (AIUsageDaily.prompt_tokens + AIUsageDaily.completion_tokens, lambda values: values[2] + values[3]),
+    "successful_calls": (AIUsageDaily.calls - AIUsageDaily.failures, lambda values: values[0] - values[1]),
+}
+
+
+def begin_request():
+    _request_user.set({})
+
+
+def set_current_user(user_id: Optional[int]):
+    holder = _request_user.get()
+    if holder is None:
+        _request_user.set({"user_id": user_id or 0})
+    else:
+        holder["user_id"] = user_id or 0
+
+
+def current_user_id() -> int:
+    """当前请求的用户ID；定时任务等非用户请求为0"""
+    holder = _request_user.get()
+    return holder.get("user_id", 0) if holder else 0
+
+
+def _seconds_until_tomorrow(now: datetime) -> int:
+    tomorrow = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return max(1, int((tomorrow - now).total_seconds()))
+
+
+class AIQuotaExceeded(Exception):
+    """超出AI用量配额"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class UsageMeter:
+    """AI用量计量：调用时只更新进程内计数器，累计到一定次数或时间后批量写入按天聚合的用量表
+
+    配额计数器在某个用户/功能当天第一次检查时从数据库加载，之后只在内存中累加；
+    多进程部署时各进程只看到自己加载之后的增量，配额为近似上限。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Dict[UsageKey, List[int]] = {}
+        self._pending_calls = 0
+        self._last_flush = time.monotonic()
+        self._day: Optional[date] = None
+        self._user_tokens: Dict[int, int] = {}
+        self._user_calls: Dict[Tuple[int, str], int] = {}
+        self._feature_tokens: Dict[str, int] = {}
+
+    def _roll_day(self, today: date):
+        if self._day != today:
+            self._day = today
+            self._user_tokens.clear()
+            self._user_calls.clear()
+            self._feature_tokens.clear()
+
+    def _counter(self, counters: Dict, key: Any, today: date, condition, match: Callable[[UsageKey], bool],
+                 measure: str) -> int:
+        """读取当天计数；首次读取时以数据库中已写入的用量加上本进程未写入的用量为初值"""
+        with self._lock:
+            self._roll_day(today)
+            if key in counters:
+                return counters[key]
+        expression, extract = _MEASURES[measure]
+        db = SessionLocal()
+        try:
+            stored = db.query(func.coalesce(func.sum(expression), 0)).filter(
+                AIUsageDaily.usage_date == today, condition
+            ).scalar()
+        finally:
+            db.close()
+        with self._lock:
+            self._roll_day(today)
+            pending = sum(
+                extract(values) for usage_key, values in self._pending.items()
+                if usage_key[0] == today and match(usage_key)
+            )
+            return counters.setdefault(key, int(stored) + pending)
+
+    def check_quota(self, feature: str, user_id: int, now: Optional[datetime] = None):
+        """调用AI之前检查配额，超出时抛出 AIQuotaExceeded"""
+        now = now or datetime.now()
+        today = now.date()
+
+        limit = settings.ai_feature_daily_token_quotas.get(feature, 0)
+        if limit and self._counter(
+            self._feature_tokens, feature, today, AIUsageDaily.feature == feature,
+            lambda key: key[2] == feature, "tokens"
+        ) >= limit:
+            raise AIQuotaExceeded(f"功能 {feature} 今日AI用量已达上限", _seconds_until_tomorrow(now))
+
+        if not user_id:
+            return
+        limit = settings.ai_user_daily_token_quota
+        if limit and self._counter(
+            self._user_tokens, user_id, today, AIUsageDaily.user_id == user_id,
+            lambda key: key[3] == user_id, "tokens"
+        ) >= limit:
+            raise AIQuotaExceeded("今日AI用量已达上限，请明天再试", _seconds_until_tomorrow(now))
+
+        limit = settings.ai_user_daily_call_quotas.get(feature, 0)
+        if limit and self._counter(
+            self._user_calls, (user_id, feature), today,
+            (AIUsageDaily.user_id == user_id) & (AIUsageDaily.feature == feature),
+            lambda key: key[3] == user_id and key[2] == feature, "successful_calls"
+        ) >= limit:
+            raise AIQuotaExceeded(f"今日该功能的使用次数已达上限（{limit}次）", _seconds_until_tomorrow(now))
+
+    def record(self, provider: str, feature: str, user_id: int, prompt_tokens: int, completion_tokens: int,
+               latency_ms: int, success: bool = True, now: Optional[datetime] = None) -> bool:
+        """记录一次服务商调用，返回是否应当写入数据库"""
+        today = (now or datetime.now()).date()
+        tokens = prompt_tokens + completion_tokens
+        with self._lock:
+            self._roll_day(today)
+            values = self._pending.setdefault((today, provider, feature, user_id or 0), [0] * len(_FIELDS))
+            for i, value in enumerate((1, 0 if success else 1, prompt_tokens, completion_tokens, latency_ms)):
+                values[i] += value
+            self._pending_calls += 1
+            # 只累加已加载的计数器，未加载的会在首次检查时从数据库和待写入数据中得到完整值
+            if user_id in self._user_tokens:
+                self._user_tokens[user_id] += tokens
+            if success and (user_id, feature) in self._user_calls:
+                self._user_calls[(user_id, feature)] += 1
+            if feature in self._feature_tokens:
+                self._feature_tokens[feature] += tokens
+            return (self._pending_calls >= settings.ai_usage_flush_calls
+                    or time.monotonic() - self._last_flush >= settings.ai_usage_flush_seconds)
+
+    def _merge_back(self, pending: Dict[UsageKey, List[int]]):
+        with self._lock:
+            for key, values in pending.items():
+                current = self._pending.setdefault(key, [0] * len(_FIELDS))
+                for i, value in enumerate(values):
+                    current[i] += value
+                self._pending_calls += values[0]
+
+    def flush(self) -> int:
+        """把待写入的用量累加到数据库，返回写入的聚合行数；失败时保留数据等待下次写入"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._pending_calls = 0
+            self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+
+        for attempt in range(2):
+            db = SessionLocal()
+            try:
+                rows = {
+                    (row.usage_date, row.provider, row.feature, row.user_id): row
+                    for row in db.query(AIUsageDaily).filter(
+                        AIUsageDaily.usage_date.in_({key[0] for key in pending}),
+                        AIUsageDaily.user_id.in_({key[3] for key in pending})
+                    )
+                }
+                for key, values in pending.items():
+                    row = rows.get(key)
+                    if row is None:
+                        usage_date, provider, feature, user_id = key
+                        db.add(AIUsageDaily(
+                            usage_date=usage_date, provider=provider, feature=feature, user_id=user_id,
+                            **dict(zip(_FIELDS, values))
+                        ))
+                        continue
+                    for name, value in zip(_FIELDS, values):
+                        setattr(row, name, (getattr(row, name) or 0) + value)
+                db.commit()
+                return len(pending)
+            except IntegrityError:
+                # 其他进程同时插入了同一聚合行，重新读取后再累加
+                db.rollback()
+                if attempt == 0:
+                    continue
+                logger.error("写入AI用量失败：聚合行冲突")
+            except Exception as e:
+                db.rollback()
+                logger.error(f"写入AI用量失败: {e}")
+                break
+            finally:
+                db.close()
+        self._merge_back(pending)
+        return 0
+
+
+usage_meter = UsageMeter()
+
+
+def get_usage_summary(
+    db: Session,
+    start_date: date,
+    end_date: date,
+    group_by: List[str],
+    user_id: Optional[int] = None,
+    limit: int = 100
+) -> List[Dict[str, Any]]:
+    """按指定维度汇总用量，按token总数降序"""
+    group_columns = [getattr(AIUsageDaily, name) for name in group_by]
+    sums = [func.sum(getattr(AIUsageDaily, name)).label(name) for name in _FIELDS]
+    total_tokens = func.sum(AIUsageDaily.prompt_tokens + AIUsageDaily.completion_tokens)
+    query = db.query(*group_columns, *sums).filter(
+        AIUsageDaily.usage_date >= start_date, AIUsageDaily.usage_date <= end_date
+    )
+    if user_id is not None:
+        query = query.filter(AIUsageDaily.user_id == user_id)
+    if group_columns:
+        query = query.group_by(*group_columns)
+    rows = query.order_by(total_tokens.desc()).limit(limit).all()
+
+    result = []
+    for row in rows:
+        item = {name: getattr(row, name) for name in group_by}
+        if "usage_date" in item:
+            item["usage_date"] = item["usage_date"].isoformat()
+        item.update({name: int(getattr(row, name) or 0) for name in _FIELDS})
+        item["total_tokens"] = item["prompt_tokens"] + item["completion_tokens"]
+        item["avg_latency_ms"] = round(item["latency_ms"] / item["calls"]) if item["calls"] else 0
+        result.append(item)
+    return result
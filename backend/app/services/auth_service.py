@@ -4,11 +4,12 @@ from typing import Optional
 from sqlalchemy.orm import Session
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-import jwt as PyJWT
 
 from app.models.user import User
-from app.utils.jwt import (verify_password, get_password_hash,
+from app.utils.jwt import (verify_password_async, get_password_hash_async,
                            create_access_token)
+from app.utils.principal_cache import decode_token, resolve_user
+from app.services.ai_usage_service import set_current_user
 from config import settings
 from database import get_db
 
@@ -19,15 +20,15 @@ class AuthService:
     def __init__(self, db: Session):
         self.db = db
 
-    def authenticate_user(self, username: str,
-                          password: str) -> Optional[User]:
+    async def authenticate_user(self, username: str,
+                                password: str) -> Optional[User]:
         user = self.db.query(User).filter(User.username == username).first()
         if not user:
             return None
         
         # 支持两种密码验证方式
         # 1. 检查哈希密码
-        if user.hashed_password and str(user.hashed_password) and verify_password(password, str(user.hashed_password)):
+        if user.hashed_password and str(user.hashed_password) and await verify_password_async(password, str(user.hashed_password)):
             return user
         
         # 2. 检查明文密码
@@ -39,11 +40,11 @@ class AuthService:
     def create_access_token_for_user(self, user: User) -> str:
         access_token_expires = timedelta(
             minutes=settings.access_token_expire_minutes)
-        return create_access_token(data={"sub": user.username},
+        return create_access_token(data={"sub": user.username, "uid": user.id},
                                    expires_delta=access_token_expires)
 
-    def create_user(self, username: str, password: str, email: str) -> User:
-        hashed_password = get_password_hash(password)
+    async def create_user(self, username: str, password: str, email: str) -> User:
+        hashed_password = await get_password_hash_async(password)
         user = User(username=username,
                     email=email,
                     password=password,  # 同时保存明文密码
@@ -61,13 +62,14 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = PyJWT.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+        payload = decode_token(token)
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
     except Exception:
         raise credentials_exception
-    user = db.query(User).filter(User.username == username).first()
+    user = resolve_user(db, username)
     if user is None:
         raise credentials_exception
+    set_current_user(user.id)
     return user
@@ -0,0 +1,326 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.orm import Session, sessionmaker
+
+from config import settings
+from database import SessionLocal
+from app.models.background_job import BackgroundJob
+from app.services.ai_usage_service import set_current_user
+from app.services.job_runner import WORKER_ID
+from app.services.llm_dispatcher import NEAR_REAL_TIME, set_priority
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+ProgressCallback = Callable[[int, Optional[str]], Awaitable[None]]
+# 处理函数：(数据库会话, 用户ID, 参数, 进度回调) -> 可JSON序列化的结果
+JobHandler = Callable[[Session, int, Dict[str, Any], ProgressCallback], Awaitable[Any]]
+JOB_HANDLERS: Dict[str, JobHandler] = {}
+
+
+class _JobSession(Session):
+    """传给处理函数的会话：commit 只刷新到数据库，处理函数的写入与任务最终状态由执行器在同一事务中提交"""
+
+    def commit(self):
+        self.flush()
+
+    def commit_job(self):
+        super().commit()
+
+
+_JobSessionLocal = sessionmaker(class_=_JobSession, **SessionLocal.kw)
+
+
+def register_job(kind: str):
+    def decorator(handler: JobHandler) -> JobHandler:
+        JOB_HANDLERS[kind] = handler
+        return handler
+    return decorator
+
+
+def job_to_dict(job: BackgroundJob, include_result: bool = True) -> Dict[str, Any]:
+    data = {
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "progress": job.progress or 0,
+        "message": job.message,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None
+    }
+    if include_result:
+        data["result"] = job.result
+    return data
+
+
+class BackgroundJobManager:
+    """后台任务：任务持久化在数据库中，由固定数量的协程执行
+
+    提交时写入 queued 状态并放入本进程队列；执行前通过条件更新认领，多进程部署时每个任务只执行一次。
+    定期扫描数据库，接手其他进程提交后未执行的任务，以及执行进程已退出（心跳超时）的任务，因此重启后任务不会丢失。
+    """
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers or settings.background_job_workers
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._sweeper()))
+        logger.info(f"后台任务执行器启动，并发数 {self.workers}")
+
+    async def stop(self):
+        """停止执行器；正在执行的任务被中断，心跳超时后由其他进程或下次启动时重新执行"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def submit(self, db: Session, kind: str, user_id: int, params: Dict[str, Any]) -> BackgroundJob:
+        """保存任务并排队，返回任务记录"""
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f"未知的任务类型: {kind}")
+        job = BackgroundJob(
+            id=uuid.uuid4().hex,
+            kind=kind,
+            user_id=user_id,
+            status="queued",
+            progress=0,
+            message="排队中",
+            params=jsonable_encoder(params),
+            created_at=datetime.now()
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        if self._queue is not None:
+            self._queue.put_nowait(job.id)
+        return job
+
+    def subscribe(self, job_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, job_id: str, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(job_id)
+        if subscribers:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[job_id]
+
+    def _publish(self, job: BackgroundJob):
+        event = job_to_dict(job, include_result=job.status in TERMINAL_STATUSES)
+        for queue in self._subscribers.get(job.id, ()):
+            queue.put_nowait(event)
+
+    def _claim(self, db: Session, job_id: str) -> Optional[BackgroundJob]:
+        """认领排队中的任务（原子条件更新），被其他进程抢先时返回None"""
+        now = datetime.now()
+        claimed = db.query(BackgroundJob).filter(
+            BackgroundJob.id == job_id, BackgroundJob.status == "queued"
+        ).update({
+            BackgroundJob.status: "running",
+            BackgroundJob.owner: WORKER_ID,
+            BackgroundJob.started_at: now,
+            BackgroundJob.heartbeat_at: now,
+            BackgroundJob.attempts: BackgroundJob.attempts + 1,
+            BackgroundJob.message: "执行中"
+        }, synchronize_session=False)
+        db.commit()
+        if claimed != 1:
+            return None
+        return db.query(BackgroundJob).filter(BackgroundJob.id == job_id).first()
+
+    async def _worker(self, index: int):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self.run(job_id)
+            except Exception as e:
+                logger.error(f"后台任务 {job_id} 执行异常: {e}")
+
+    async def run(self, job_id: str):
+        """执行单个任务：认领、调用处理函数、保存结果
+
+        任务状态使用单独的会话提交，进度更新不会提前提交处理函数尚未完成的数据；
+        处理函数的会话中 commit 只刷新不提交（处理函数内部调用的服务可能自行提交），
+        最终状态与处理函数写入的数据在同一事务中提交，提交失败时一起回滚，任务重新执行时不会重复生效。
+        """
+        db = SessionLocal()
+        work_db = _JobSessionLocal()
+        heartbeat = None
+        try:
+            job = self._claim(db, job_id)
+            if job is None:
+                return
+            attempt = job.attempts
+            set_current_user(job.user_id)
+            set_priority(NEAR_REAL_TIME)
+            self._publish(job)
+            heartbeat = asyncio.create_task(self._heartbeat(db, job))
+
+            async def report_progress(progress: int, message: Optional[str] = None):
+                job.progress = max(0, min(99, int(progress)))
+                if message:
+                    job.message = message
+                job.heartbeat_at = datetime.now()
+                self._save_status(db, job)
+                self._publish(job)
+
+            try:
+                result = await JOB_HANDLERS[job.kind](work_db, job.user_id, job.params or {}, report_progress)
+                outcome = {
+                    BackgroundJob.status: "succeeded",
+                    BackgroundJob.result: jsonable_encoder(result),
+                    BackgroundJob.progress: 100,
+                    BackgroundJob.message: "已完成"
+                }
+            except Exception as e:
+                work_db.rollback()
+                logger.error(f"后台任务 {job.kind}({job.id}) 失败: {e}")
+                outcome = {
+                    BackgroundJob.status: "failed",
+                    BackgroundJob.error: str(getattr(e, "detail", None) or e) or e.__class__.__name__,
+                    BackgroundJob.message: "执行失败"
+                }
+            heartbeat.cancel()
+            outcome[BackgroundJob.finished_at] = datetime.now()
+            # 只在本次认领仍然有效时写入；心跳超时后任务已被重新排队或接管时放弃本次结果
+            finished = work_db.query(BackgroundJob).filter(
+                BackgroundJob.id == job.id,
+                BackgroundJob.status == "running",
+                BackgroundJob.owner == WORKER_ID,
+                BackgroundJob.attempts == attempt
+            ).update(outcome, synchronize_session=False)
+            if finished != 1:
+                work_db.rollback()
+                logger.warning(f"后台任务 {job.kind}({job.id}) 已被重新排队，放弃本次结果")
+                return
+            work_db.commit_job()
+            db.refresh(job)
+            self._publish(job)
+        finally:
+            if heartbeat is not None:
+                heartbeat.cancel()
+            work_db.close()
+            db.close()
+
+    def _save_status(self, db: Session, job: BackgroundJob):
+        """保存进度和心跳；尽力而为，处理函数持有写锁（如SQLite）时跳过本次保存"""
+        try:
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"保存后台任务 {job.id} 进度失败: {e}")
+
+    async def _heartbeat(self, db: Session, job: BackgroundJob):
+        """处理函数长时间没有报告进度时也定期更新心跳，避免被误判为中断"""
+        while True:
+            await asyncio.sleep(settings.background_job_stale_seconds / 3)
+            job.heartbeat_at = datetime.now()
+            self._save_status(db, job)
+
+    def _requeue_abandoned(self) -> List[str]:
+        """找出需要本进程执行的任务：排队超时未被认领的，以及执行进程心跳超时的"""
+        now = datetime.now()
+        stale = now - timedelta(seconds=settings.background_job_stale_seconds)
+        db = SessionLocal()
+        try:
+            abandoned = db.query(BackgroundJob).filter(
+                BackgroundJob.status == "running", BackgroundJob.heartbeat_at < stale
+            ).all()
+            for job in abandoned:
+                if (job.attempts or 0) >= settings.background_job_max_attempts:
+                    job.status = "failed"
+                    job.error = "执行进程中断次数过多"
+                    job.finished_at = now
+                else:
+                    job.status = "queued"
+                    job.message = "执行中断，重新排队"
+            db.commit()
+
+            waiting = now - timedelta(seconds=settings.background_job_poll_seconds)
+            return [
+                job_id for (job_id,) in db.query(BackgroundJob.id).filter(
+                    BackgroundJob.status == "queued", BackgroundJob.created_at <= waiting
+                ).order_by(BackgroundJob.created_at).limit(self.workers * 10)
+            ]
+        finally:
+            db.close()
+
+    async def _sweeper(self):
+        while True:
+            try:
+                for job_id in await asyncio.to_thread(self._requeue_abandoned):
+                    if self._queue.qsize() < self.workers * 10:
+                        self._queue.put_nowait(job_id)
+            except Exception as e:
+                logger.warning(f"扫描后台任务失败: {e}")
+            await asyncio.sleep(settings.background_job_poll_seconds)
+
+
+job_manager = BackgroundJobManager()
+
+
+# 任务处理函数
+
+_ai_service = None
+
+
+def _get_ai_service():
+    global _ai_service
+    if _ai_service is None:
+        from app.services.ai_service import AIService
+        _ai_service = AIService()
+    return _ai_service
+
+
+@register_job("exam_generate")
+async def _generate_exam(db: Session, user_id: int, params: Dict[str, Any], progress: ProgressCallback):
+    from app.services.exam_service import generate_ai_exam
+
+    await progress(10, "正在生成试卷")
+    exam = await generate_ai_exam(db, _get_ai_service(), created_by=user_id, **params)
+    return {"id": exam.id}
+
+
+@register_job("learning_plan")
+async def _generate_learning_plan(db: Session, user_id: int, params: Dict[str, Any], progress: ProgressCallback):
+    from app.schemas.learning import LearningPlanGenerationRequest
+    from app.services.learning_plan_service import LearningPlanService
+
+    await progress(10, "正在生成学习计划")
+    return await LearningPlanService(db).generate_learning_plan(LearningPlanGenerationRequest(**params))
+
+
+@register_job("learning_report")
+async def _generate_learning_report(db: Session, user_id: int, params: Dict[str, Any], progress: ProgressCallback):
+    await progress(10, "正在生成学习报告")
+    return await _get_ai_service().generate_learning_report(user_id, db)
+
+
+@register_job("generate_questions")
+async def _generate_questions(db: Session, user_id: int, params: Dict[str, Any], progress: ProgressCallback):
+    from app.services.question_pool_service import QuestionPoolService
+
+    await progress(10, "正在生成题目")
+    return await QuestionPoolService(db, _get_ai_service()).serve(**params)
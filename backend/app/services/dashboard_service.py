@@ -0,0 +1,276 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, case, distinct
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import SessionLocal
+from app.models.exam import Exam, ExamResult
+from app.models.learning import LearningPlan, LearningTask, Achievement
+from app.models.question import Question, QuestionCategory, UserAnswer
+from app.services.activity_rollup_service import ActivityRollupService
+from app.utils.cache import TTLCache
+from app.utils.etag import QUESTION_SET_SCOPE, VersionKey, data_versions, on_versions_changed, user_scope
+
+logger = logging.getLogger(__name__)
+
+SUBJECT_ICONS = {
+    "数学": "📊",
+    "英语": "🔤",
+    "物理": "⚛️",
+    "化学": "🧪",
+    "生物": "🧬",
+    "语文": "📝",
+    "历史": "📚",
+    "地理": "🌍",
+    "政治": "🏛️"
+}
+
+_widget_cache = TTLCache(ttl=settings.dashboard_cache_ttl)
+
+
+def _home_stats(db: Session, user_id: int) -> Dict[str, Any]:
+    """首页统计"""
+    total_questions = db.query(func.count(Question.id)).scalar() or 0
+
+    completed_exams = db.query(func.count(ExamResult.id)).filter(
+        ExamResult.student_id == user_id
+    ).scalar() or 0
+
+    totals = ActivityRollupService(db).get_totals(user_id)
+    study_hours = round(totals["study_minutes"] / 60, 1)
+    avg_accuracy = totals["score_sum"] / totals["score_count"] if totals["score_count"] else 0
+
+    return {
+        "totalQuestions": total_questions,
+        "completedExams": completed_exams,
+        "studyHours": study_hours,
+        "accuracy": round(avg_accuracy, 1)
+    }
+
+
+def _recent_activity(db: Session, user_id: int) -> List[Dict[str, Any]]:
+    """最近活动（考试结果与学习任务）"""
+    # 考试结果本身没有时间戳，使用所属考试的时间
+    recent_exams = db.query(ExamResult, Exam).outerjoin(
+        Exam, ExamResult.exam_id == Exam.id
+    ).filter(
+        ExamResult.student_id == user_id
+    ).order_by(ExamResult.id.desc()).limit(5).all()
+
+    recent_tasks = db.query(LearningTask).join(
+        LearningPlan, LearningTask.plan_id == LearningPlan.id
+    ).filter(
+        LearningPlan.user_id == user_id
+    ).order_by(LearningTask.created_at.desc()).limit(5).all()
+
+    activities = []
+    for result, exam in recent_exams:
+        exam_time = exam and (exam.end_time or exam.start_time)
+        activities.append({
+            "id": result.id,
+            "type": "exam",
+            "title": exam.title if exam else "考试",
+            "score": result.score,
+            "date": exam_time.strftime("%Y-%m-%d") if exam_time else "",
+            "status": "completed"
+        })
+
+    for task in recent_tasks:
+        activities.append({
+            "id": task.id,
+            "type": "task",
+            "title": task.title,
+            "score": None,
+            "date": task.created_at.strftime("%Y-%m-%d") if task.created_at else "",
+            "status": task.status
+        })
+
+    activities.sort(key=lambda x: x["date"], reverse=True)
+    return activities[:10]
+
+
+def _subject_progress(db: Session, user_id: int) -> List[Dict[str, Any]]:
+    """各学科（题目分类）进度"""
+    subject_stats = db.query(
+        QuestionCategory.id,
+        QuestionCategory.name,
+        func.count(Question.id).label('total_questions')
+    ).join(
+        Question, Question.category_id == QuestionCategory.id
+    ).filter(
+        Question.is_active == True
+    ).group_by(QuestionCategory.id, QuestionCategory.name).all()
+
+    user_progress = db.query(
+        Question.category_id,
+        func.count(distinct(UserAnswer.question_id)).label('answered_questions'),
+        func.count(UserAnswer.id).label('total_answers'),
+        func.sum(case((UserAnswer.is_correct == True, 1), else_=0)).label('correct_answers')
+    ).join(
+        Question, UserAnswer.question_id == Question.id
+    ).filter(
+        UserAnswer.user_id == user_id
+    ).group_by(Question.category_id).all()
+
+    # 按分类索引用户进度，避免逐个线性查找
+    progress_by_category = {row.category_id: row for row in user_progress}
+
+    subjects = []
+    for subject_stat in subject_stats:
+        total_questions = subject_stat.total_questions
+        user_stat = progress_by_category.get(subject_stat.id)
+        answered_questions = user_stat.answered_questions if user_stat else 0
+        avg_score = (
+            (user_stat.correct_answers or 0) / user_stat.total_answers * 100
+            if user_stat and user_stat.total_answers else 0
+        )
+
+        progress = round((answered_questions / total_questions * 100) if total_questions > 0 else 0, 1)
+
+        if progress < 30:
+            difficulty = "hard"
+        elif progress < 70:
+            difficulty = "medium"
+        else:
+            difficulty = "easy"
+
+        subjects.append({
+            "name": subject_stat.name,
+            "questions": total_questions,
+            "icon": SUBJECT_ICONS.get(subject_stat.name, "📖"),
+            "difficulty": difficulty,
+            "progress": progress,
+            "answered": answered_questions,
+            "avgScore": round(avg_score, 1)
+        })
+
+    return subjects
+
+
+def _achievements(db: Session, user_id: int) -> Dict[str, Any]:
+    """用户成就"""
+    achievements = db.query(Achievement).filter(
+        Achievement.user_id == user_id
+    ).order_by(Achievement.earned_at, Achievement.id).all()
+
+    items = [
+        {
+            "id": achievement.id,
+            "achievement_type": achievement.achievement_type,
+            "title": achievement.title,
+            "description": achievement.description,
+            "points": achievement.points,
+            "earned_at": achievement.earned_at.isoformat() if achievement.earned_at else None
+        }
+        for achievement in achievements
+    ]
+
+    return {
+        "total": len(items),
+        "recent": items[-5:],
+        "list": items
+    }
+
+
+def _learning_trends(db: Session, user_id: int) -> List[Dict[str, Any]]:
+    """最近30天学习趋势（按日期正序）"""
+    daily_rows = ActivityRollupService(db).get_recent_days(user_id, days=30)
+
+    return [
+        {
+            "date": day["date"].strftime("%Y-%m-%d"),
+            "duration": day["study_minutes"],
+            "sessions": day["session_count"],
+            "questions": day["questions_answered"],
+            "avgScore": round(day["score_sum"] / day["score_count"], 1) if day["score_count"] else 0
+        }
+        for day in daily_rows
+    ]
+
+
+# 组件名 -> (计算函数, 缓存时间相对 dashboard_cache_ttl 的倍数)
+WIDGETS: Dict[str, tuple] = {
+    "home_stats": (_home_stats, 1),
+    "recent_activity": (_recent_activity, 0.5),
+    "subject_progress": (_subject_progress, 5),
+    "achievements": (_achievements, 5),
+    "learning_trends": (_learning_trends, 5),
+}
+
+
+def widget_ttl(name: str) -> int:
+    return max(1, int(settings.dashboard_cache_ttl * WIDGETS[name][1]))
+
+
+class DashboardService:
+    """仪表板数据服务：各组件独立计算、独立缓存"""
+
+    @staticmethod
+    def get_widget(db: Session, user_id: int, name: str) -> Any:
+        """获取单个组件数据，优先读取缓存"""
+        builder = WIDGETS[name][0]
+        cache_key = (name, user_id)
+        # 缓存时记录数据版本，其他进程提交的写入（版本计数器在Redis中共享）也能使缓存失效
+        versions = data_versions(user_scope(user_id), QUESTION_SET_SCOPE)
+        cached = _widget_cache.get(cache_key)
+        if cached is not None and versions is not None and cached[0] == versions:
+            return cached[1]
+
+        data = builder(db, user_id)
+        if versions is not None:
+            _widget_cache.set(cache_key, (versions, data), ttl=widget_ttl(name))
+        return data
+
+    @staticmethod
+    def _get_widget_in_new_session(user_id: int, name: str) -> Any:
+        """在独立数据库会话中计算组件（Session不能跨线程共享）"""
+        db = SessionLocal()
+        try:
+            return DashboardService.get_widget(db, user_id, name)
+        finally:
+            db.close()
+
+    @staticmethod
+    async def get_summary(user_id: int, widgets: Optional[List[str]] = None) -> Dict[str, Any]:
+        """并发计算所有组件，单个组件失败不影响其他组件"""
+        names = [name for name in (widgets or WIDGETS) if name in WIDGETS]
+        results = await asyncio.gather(
+            *(run_in_threadpool(DashboardService._get_widget_in_new_session, user_id, name) for name in names),
+            return_exceptions=True
+        )
+
+        summary: Dict[str, Any] = {}
+        errors: Dict[str, str] = {}
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                logger.error(f"仪表板组件 {name} 计算失败: {str(result)}")
+                summary[name] = None
+                errors[name] = str(result)
+            else:
+                summary[name] = result
+
+        if errors:
+            summary["errors"] = errors
+        return summary
+
+    @staticmethod
+    def invalidate(user_id: int, *names: str):
+        """使用户的组件缓存失效（不指定组件名时全部失效）"""
+        for name in names or WIDGETS:
+            _widget_cache.delete((name, user_id))
+
+
+@on_versions_changed
+def _invalidate_changed_widgets(session: Session, keys: Dict[VersionKey, Optional[int]]):
+    """数据提交后立即清理受影响的组件缓存，避免新ETag下返回旧数据"""
+    if QUESTION_SET_SCOPE in keys:
+        # 首页统计包含题目总数，题目集合变化影响所有用户
+        _widget_cache.clear()
+        return
+    for key in keys:
+        if key[0] == "user":
+            DashboardService.invalidate(key[1])
@@ -0,0 +1,231 @@
+import logging
+import math
+import random
+import threading
+import time
+from typing import Any, Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from config import settings
+from app.models.question import Question, QuestionCategory
+from app.utils.etag import mark_changed, question_scope
+
+logger = logging.getLogger(__name__)
+
+# 题库中难度的存储方式不统一：easy/medium/hard 或 1-5 的数字
+DIFFICULTY_LEVELS = {"easy": 2, "medium": 3, "hard": 4}
+
+
+def difficulty_level(value: Any) -> int:
+    """把题目难度换算为1-5的等级"""
+    if value is None:
+        return 3
+    text = str(value).strip().lower()
+    if text in DIFFICULTY_LEVELS:
+        return DIFFICULTY_LEVELS[text]
+    try:
+        return min(5, max(1, int(float(text))))
+    except ValueError:
+        return 3
+
+
+def _as_set(value: Any) -> FrozenSet[str]:
+    if not value:
+        return frozenset()
+    if isinstance(value, str):
+        return frozenset([value])
+    return frozenset(str(item) for item in value if item)
+
+
+class Candidate(NamedTuple):
+    id: int
+    question_type: str
+    level: int
+    tags: FrozenSet[str]
+    skills: FrozenSet[str]
+    estimated_time: int
+
+
+class QuestionIndex:
+    """候选题索引：学科（分类名或标签）-> (题型, 难度等级) -> 候选题
+
+    只加载组卷需要的列；usage 为各题使用次数，组卷后在内存中同步累加，索引重建前也能轮换选题。
+    """
+
+    def __init__(self, rows: List[Tuple], version: Tuple):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.usage: Dict[int, int] = {}
+        self._buckets: Dict[str, Dict[Tuple[str, int], List[Candidate]]] = {}
+        for question_id, question_type, difficulty, tags, skill, usage_count, estimated_time, category in rows:
+            candidate = Candidate(
+                question_id, question_type, difficulty_level(difficulty),
+                _as_set(tags), _as_set(skill), estimated_time or 2
+            )
+            self.usage[question_id] = usage_count or 0
+            for subject in candidate.tags | ({category} if category else set()):
+                self._buckets.setdefault(subject, {}).setdefault(
+                    (question_type, candidate.level), []
+                ).append(candidate)
+
+    def candidates(self, subject: str, question_type: str, level: int, tolerance: int) -> List[Candidate]:
+        buckets = self._buckets.get(subject, {})
+        result: List[Candidate] = []
+        for candidate_level in range(level - tolerance, level + tolerance + 1):
+            result.extend(buckets.get((question_type, candidate_level), ()))
+        return result
+
+
+_index: Optional[QuestionIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_question_index(db: Session) -> QuestionIndex:
+    """获取候选题索引；题目数或最大ID变化（新增/删除题目）时立即重建，编辑题目在 exam_assembly_index_ttl 内生效"""
+    global _index
+    version = tuple(db.query(func.count(Question.id), func.max(Question.id)).filter(
+        Question.is_active == True
+    ).one())
+    index = _index
+    if index is not None and index.version == version \
+            and time.monotonic() - index.built_at < settings.exam_assembly_index_ttl:
+        return index
+    with _index_lock:
+        index = _index
+        if index is None or index.version != version \
+                or time.monotonic() - index.built_at >= settings.exam_assembly_index_ttl:
+            started = time.monotonic()
+            rows = db.query(
+                Question.id, Question.question_type, Question.difficulty, Question.tags, Question.skill,
+                Question.usage_count, Question.estimated_time, QuestionCategory.name
+            ).outerjoin(QuestionCategory, Question.category_id == QuestionCategory.id).filter(
+                Question.is_active == True
+            ).all()
+            index = _index = QuestionIndex(rows, version)
+            logger.info(f"组卷候选题索引重建完成: {len(rows)} 道题，耗时 {(time.monotonic() - started) * 1000:.0f}ms")
+    return index
+
+
+def allocate_scores(question_types: List[str], total_score: int) -> List[int]:
+    """按题型分值比例把总分分配到每道题（整数，最大余数法，总和恰好等于总分）"""
+    if not question_types:
+        return []
+    if total_score < len(question_types):
+        return [1] * len(question_types)
+    weights = [settings.exam_type_score_weights.get(question_type, 5) for question_type in question_types]
+    # 先保证每题至少1分，剩余分数按比例分配
+    spare = total_score - len(question_types)
+    raw = [spare * weight / sum(weights) for weight in weights]
+    scores = [1 + int(value) for value in raw]
+    remainder = total_score - sum(scores)
+    for i in sorted(range(len(raw)), key=lambda i: raw[i] - int(raw[i]), reverse=True)[:remainder]:
+        scores[i] += 1
+    return scores
+
+
+class ExamAssembler:
+    """按 题型分布 × 难度 × 知识点标签/技能点 约束从题库选题组卷
+
+    贪心选题：每一步选择能覆盖最多未覆盖标签、与要求相关度最高、且使全卷平均难度最接近目标的题目，
+    使用次数少的题目优先并加入少量随机扰动，避免每份试卷完全相同。
+    """
+
+    # 每个题型参与打分的候选题上限（按相关度和使用次数预筛）
+    MAX_POOL_PER_QUESTION = 50
+
+    def __init__(self, db: Session, seed: Optional[int] = None):
+        self.db = db
+        self._rng = random.Random(seed)
+
+    def assemble(
+        self,
+        subject: str,
+        difficulty: int,
+        question_distribution: Dict[str, int],
+        skill: Optional[str] = None,
+        tags: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """返回 {"selected": {题型: [题目ID]}, "missing": {题型: 缺少的题数}, "estimated_time": 预估分钟数}"""
+        index = get_question_index(self.db)
+        wanted_tags = set(tags or [])
+        uncovered = set(wanted_tags)
+        level_sum, level_count = 0, 0
+        selected: Dict[str, List[int]] = {}
+        missing: Dict[str, int] = {}
+        estimated_time = 0
+
+        # 候选少的题型先选，避免被难度平衡挤占
+        pools = {
+            question_type: index.candidates(subject, question_type, difficulty, settings.exam_difficulty_tolerance)
+            for question_type, count in question_distribution.items() if count > 0
+        }
+        for question_type in sorted(pools, key=lambda name: len(pools[name]) / question_distribution[name]):
+            count = question_distribution[question_type]
+            picked = self._pick(
+                pools[question_type], count, difficulty, wanted_tags, uncovered, skill, index.usage,
+                level_sum, level_count
+            )
+            for candidate in picked:
+                level_sum += candidate.level
+                level_count += 1
+                estimated_time += candidate.estimated_time
+                uncovered -= candidate.tags
+            selected[question_type] = [candidate.id for candidate in picked]
+            if len(picked) < count:
+                missing[question_type] = count - len(picked)
+
+        return {"selected": selected, "missing": missing, "estimated_time": estimated_time}
+
+    def _pick(
+        self,
+        pool: List[Candidate],
+        count: int,
+        target: int,
+        wanted: set,
+        uncovered: set,
+        skill: Optional[str],
+        usage: Dict[int, int],
+        level_sum: int,
+        level_count: int
+    ) -> List[Candidate]:
+        uncovered = set(uncovered)
+        base = {}
+        for candidate in pool:
+            relevance = len(candidate.tags & wanted) + (2 if skill and skill in candidate.skills else 0)
+            base[candidate.id] = relevance - 0.5 * math.log1p(usage.get(candidate.id, 0)) + self._rng.random() * 0.5
+        available = sorted(pool, key=lambda candidate: base[candidate.id], reverse=True)
+        available = available[:max(count * self.MAX_POOL_PER_QUESTION, 200)]
+
+        picked: List[Candidate] = []
+        for _ in range(count):
+            if not available:
+                break
+
+            def gain(candidate: Candidate) -> float:
+                mean = (level_sum + candidate.level) / (level_count + 1)
+                return 3 * len(candidate.tags & uncovered) + base[candidate.id] - 1.5 * abs(mean - target)
+
+            best = max(available, key=gain)
+            available.remove(best)
+            picked.append(best)
+            uncovered -= best.tags
+            level_sum += best.level
+            level_count += 1
+        return picked
+
+    def mark_used(self, question_ids: List[int]):
+        """累加题目使用次数（不改变 updated_at），并同步到内存索引"""
+        if not question_ids:
+            return
+        self.db.query(Question).filter(Question.id.in_(question_ids)).update({
+            Question.usage_count: func.coalesce(Question.usage_count, 0) + 1,
+            Question.updated_at: Question.updated_at
+        }, synchronize_session=False)
+        # 批量 UPDATE 不经过 before_flush，需自行登记数据版本
+        mark_changed(self.db, *(question_scope(question_id) for question_id in question_ids))
+        index = _index
+        if index is not None:
+            for question_id in question_ids:
+                index.usage[question_id] = index.usage.get(question_id, 0) + 1
@@ -1,6 +1,18 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
 from sqlalchemy.orm import Session
+from config import settings
 from app.models.exam import Exam, ExamResult
+from app.models.question import QuestionCategory, QuestionSource
 from app.schemas.exam import ExamCreate, ExamResultCreate
+from app.services.activity_rollup_service import ActivityRollupService
+from app.services.exam_assembler import ExamAssembler, allocate_scores, difficulty_level
+from app.services.ai_usage_service import AIQuotaExceeded
+from app.services.question_service import add_questions_to_exam, upsert_questions
+
+logger = logging.getLogger(__name__)
 
 
 def create_exam(db: Session, exam: ExamCreate):
@@ -11,6 +23,199 @@ def create_exam(db: Session, exam: ExamCreate):
     return db_exam
 
 
+DEFAULT_QUESTION_DISTRIBUTION = {
+    "single_choice": 20,
+    "multiple_choice": 10,
+    "fill_blank": 5,
+    "short_answer": 3
+}
+
+
+async def generate_ai_exam(
+    db: Session,
+    ai_service,
+    subject: str,
+    difficulty: int,
+    created_by: Optional[int],
+    exam_type: Optional[str] = "comprehensive",
+    question_distribution: Optional[Dict[str, int]] = None,
+    skill: Optional[str] = None,
+    tags: Optional[List[str]] = None
+) -> Exam:
+    """组卷并保存试卷及题目，调用方负责提交或回滚
+
+    优先从题库按约束选题，只有题库不足的题型才调用AI出题补齐；关闭 exam_assembly_enabled 时整卷由AI生成。
+    """
+    question_distribution = question_distribution or DEFAULT_QUESTION_DISTRIBUTION
+    if not settings.exam_assembly_enabled:
+        return await _generate_exam_with_ai(
+            db, ai_service, subject, difficulty, created_by, exam_type, question_distribution, skill, tags
+        )
+
+    started = time.monotonic()
+    assembler = ExamAssembler(db)
+    plan = assembler.assemble(subject, difficulty, question_distribution, skill=skill, tags=tags)
+    selected = plan["selected"]
+    estimated_time = plan["estimated_time"]
+    # 先并发完成所有题型的AI出题，再统一写入题库，等待AI期间不持有写事务
+    missing = plan["missing"]
+    generated = await asyncio.gather(*(
+        _request_gap_questions(ai_service, subject, difficulty, question_type, count, skill)
+        for question_type, count in missing.items()
+    ))
+    for (question_type, count), questions_data in zip(missing.items(), generated):
+        question_ids = _save_gap_questions(
+            db, subject, difficulty, question_type, questions_data[:count], skill, tags
+        )
+        selected.setdefault(question_type, []).extend(question_ids)
+        estimated_time += 2 * len(question_ids)
+
+    ordered = [
+        (question_type, question_id)
+        for question_type in question_distribution
+        for question_id in selected.get(question_type, [])
+    ]
+    if not ordered:
+        raise ValueError("题库中没有符合条件的题目，AI出题也未成功")
+    logger.info(
+        f"组卷完成: {subject} 难度{difficulty}，共 {len(ordered)} 题，"
+        f"AI补充 {sum(plan['missing'].values())} 题，耗时 {(time.monotonic() - started) * 1000:.0f}ms"
+    )
+
+    exam = Exam(title=f"{subject}考试", duration=estimated_time, created_by=created_by)
+    db.add(exam)
+    db.flush()  # 获取exam.id
+
+    scores = allocate_scores([question_type for question_type, _ in ordered], settings.exam_total_score)
+    add_questions_to_exam(db, exam.id, [
+        {"question_id": question_id, "score": score, "sequence": i + 1}
+        for i, ((_, question_id), score) in enumerate(zip(ordered, scores))
+    ])
+    assembler.mark_used([question_id for _, question_id in ordered])
+    return exam
+
+
+async def _request_gap_questions(
+    ai_service,
+    subject: str,
+    difficulty: int,
+    question_type: str,
+    count: int,
+    skill: Optional[str]
+) -> List[Dict[str, Any]]:
+    """调用AI为题库不足的题型出题；失败时返回空列表（试卷少该题型的部分题目）"""
+    try:
+        return await ai_service.generate_questions_with_skill(
+            subject=subject,
+            skill=skill,
+            difficulty=difficulty,
+            count=count,
+            question_types=[question_type],
+            use_cache=False
+        ) or []
+    except AIQuotaExceeded:
+        raise
+    except Exception as e:
+        logger.warning(f"AI补充 {subject} {question_type} 题目失败: {e}")
+        return []
+
+
+def _save_gap_questions(
+    db: Session,
+    subject: str,
+    difficulty: int,
+    question_type: str,
+    questions_data: List[Dict[str, Any]],
+    skill: Optional[str],
+    tags: Optional[List[str]]
+) -> List[int]:
+    """AI补充的题目存入题库，返回题目ID"""
+    if not questions_data:
+        return []
+    category = db.query(QuestionCategory).filter(QuestionCategory.name == subject).first()
+    if category is None:
+        category = QuestionCategory(name=subject)
+        db.add(category)
+        db.flush()
+
+    rows = [
+        _question_row(question_data, question_type, difficulty, skill, tags, category.id)
+        for question_data in questions_data if question_data.get("content")
+    ]
+    return [question_id for question_id in upsert_questions(db, rows) if question_id is not None]
+
+
+def _question_row(
+    question_data: Dict[str, Any],
+    question_type: Optional[str],
+    difficulty: int,
+    skill: Optional[str] = None,
+    tags: Optional[List[str]] = None,
+    category_id: Optional[int] = None
+) -> Dict[str, Any]:
+    """AI返回的题目转为题库记录字段"""
+    skills = question_data.get("skill") or skill
+    question_tags = question_data.get("tags") or []
+    if isinstance(question_tags, str):
+        question_tags = [question_tags]
+    return {
+        "content": question_data["content"],
+        "question_type": question_type or question_data.get("question_type") or "short_answer",
+        "options": question_data.get("options", []),
+        "answer": str(question_data.get("answer") or ""),
+        "explanation": question_data.get("explanation"),
+        "difficulty": str(difficulty_level(question_data.get("difficulty", difficulty))),
+        "source": QuestionSource.AI_GENERATED.value,
+        "tags": list(dict.fromkeys(question_tags + (tags or []))),
+        "skill": [skills] if isinstance(skills, str) else skills,
+        "category_id": category_id
+    }
+
+
+async def _generate_exam_with_ai(
+    db: Session,
+    ai_service,
+    subject: str,
+    difficulty: int,
+    created_by: Optional[int],
+    exam_type: Optional[str],
+    question_distribution: Dict[str, int],
+    skill: Optional[str],
+    tags: Optional[List[str]]
+) -> Exam:
+    """整卷由AI生成"""
+    # 调用AI服务生成试卷
+    exam_data: Dict[str, Any] = await ai_service.generate_exam(
+        subject=subject,
+        difficulty=difficulty,
+        exam_type=exam_type,
+        question_distribution=question_distribution,
+        skill=skill,
+        tags=tags
+    )
+
+    # 创建考试记录（Exam 只有标题、创建者和时长字段）
+    exam = Exam(
+        title=exam_data.get("title", f"{subject}考试"),
+        duration=exam_data.get("time_limit", 120),
+        created_by=created_by
+    )
+    db.add(exam)
+    db.flush()  # 获取exam.id
+
+    # 批量写入题目（按题干哈希去重）和试卷题目关联
+    questions_data = [question_data for question_data in exam_data.get("questions", []) if question_data.get("content")]
+    question_ids = upsert_questions(db, [
+        _question_row(question_data, None, difficulty) for question_data in questions_data
+    ])
+    add_questions_to_exam(db, exam.id, [
+        {"question_id": question_id, "score": question_data.get("score", 5), "sequence": i + 1}
+        for i, (question_data, question_id) in enumerate(zip(questions_data, question_ids))
+        if question_id is not None
+    ])
+    return exam
+
+
 def get_exam(db: Session, exam_id: str):
     return db.query(Exam).filter(Exam.id == exam_id).first()
 
@@ -18,6 +223,14 @@ def get_exam(db: Session, exam_id: str):
 def submit_exam_result(db: Session, result: ExamResultCreate):
     db_result = ExamResult(**result.dict())
     db.add(db_result)
+    if db_result.student_id is not None and db_result.score is not None:
+        score = db_result.score
+        if db_result.total_score:
+            score = db_result.score / db_result.total_score * 100
+        ActivityRollupService(db).record_activity(
+            user_id=int(db_result.student_id),
+            score=score
+        )
     db.commit()
     db.refresh(db_result)
     return db_result
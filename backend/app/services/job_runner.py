@@ -0,0 +1,220 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from config import settings
+from database import SessionLocal
+from app.models.job import JobLease, JobRun
+
+logger = logging.getLogger(__name__)
+
+# 当前进程在租约中的身份
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# 当前线程正在执行的任务的租约状态（租约丢失时被置位）
+_current = threading.local()
+
+
+class LeaseLost(Exception):
+    """任务执行期间租约已被其他进程接管"""
+
+
+def ensure_lease():
+    """长任务在批次之间调用：租约已丢失时抛出 LeaseLost 中止执行，避免与接管的进程同时运行"""
+    lost = getattr(_current, "lease_lost", None)
+    if lost is not None and lost.is_set():
+        raise LeaseLost("任务租约已被其他进程接管，停止执行")
+
+
+class JobRunner:
+    """基于数据库租约执行定时任务并记录执行历史
+
+    多个进程同时触发同一任务时，只有抢到租约的进程执行；run_key 标识执行周期，
+    某周期完成后即使其他进程稍后触发也不会重复执行。持有者异常退出时租约过期，可由其他进程接管。
+    """
+
+    def __init__(self, lease_seconds: Optional[int] = None, owner: str = WORKER_ID):
+        self.lease_seconds = lease_seconds or settings.job_lease_seconds
+        self.owner = owner
+
+    def run(self, job_name: str, run_key: Optional[str], func: Callable[[], Optional[int]]) -> Optional[Dict[str, Any]]:
+        """获取租约后执行任务，返回执行记录；未获取到租约返回None
+
+        func 返回处理的行数；run_key 为None时（手动执行）只防止并发，不做周期去重。
+        只有成功执行才记录周期完成；续期失败时租约视为丢失，func 可通过 ensure_lease() 及时中止，
+        本次执行记录为失败。
+        """
+        if not self.acquire(job_name, run_key):
+            logger.info(f"任务 {job_name}({run_key}) 已由其他进程执行或正在执行，跳过")
+            return None
+
+        run_id = self._start_run(job_name, run_key)
+        stop_heartbeat = threading.Event()
+        lease_lost = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._heartbeat, args=(job_name, stop_heartbeat, lease_lost), daemon=True
+        )
+        heartbeat.start()
+
+        started = time.monotonic()
+        rows, error = 0, None
+        previous_lost, _current.lease_lost = getattr(_current, "lease_lost", None), lease_lost
+        try:
+            rows = func() or 0
+        except Exception as e:
+            error = str(e)
+            logger.error(f"任务 {job_name} 执行失败: {error}")
+        finally:
+            _current.lease_lost = previous_lost
+            stop_heartbeat.set()
+            heartbeat.join(timeout=5)
+            if error is None and lease_lost.is_set():
+                error = "任务租约已被其他进程接管，执行结果不计入周期"
+            record = self._finish_run(run_id, time.monotonic() - started, rows, error)
+            self.release(job_name, run_key if error is None else None)
+        return record
+
+    def acquire(self, job_name: str, run_key: Optional[str]) -> bool:
+        """抢占租约：租约空闲或已过期，且该周期尚未完成"""
+        db = SessionLocal()
+        try:
+            if not db.query(JobLease.id).filter(JobLease.job_name == job_name).first():
+                try:
+                    db.add(JobLease(job_name=job_name))
+                    db.commit()
+                except IntegrityError:
+                    # 其他进程同时创建了该任务的租约行
+                    db.rollback()
+
+            now = datetime.now()
+            query = db.query(JobLease).filter(
+                JobLease.job_name == job_name,
+                (JobLease.lease_expires_at == None) | (JobLease.lease_expires_at < now)
+            )
+            if run_key is not None:
+                query = query.filter(
+                    (JobLease.last_run_key == None) | (JobLease.last_run_key != run_key)
+                )
+            # 条件更新是原子的，受影响行数为1即抢占成功
+            acquired = query.update({
+                JobLease.owner: self.owner,
+                JobLease.lease_expires_at: now + timedelta(seconds=self.lease_seconds)
+            }, synchronize_session=False)
+            db.commit()
+            return acquired == 1
+        finally:
+            db.close()
+
+    def renew(self, job_name: str) -> bool:
+        """续期本进程持有的租约"""
+        db = SessionLocal()
+        try:
+            renewed = db.query(JobLease).filter(
+                JobLease.job_name == job_name,
+                JobLease.owner == self.owner
+            ).update({
+                JobLease.lease_expires_at: datetime.now() + timedelta(seconds=self.lease_seconds)
+            }, synchronize_session=False)
+            db.commit()
+            return renewed == 1
+        finally:
+            db.close()
+
+    def release(self, job_name: str, run_key: Optional[str]):
+        """释放租约；run_key 不为None时记录该周期已完成（仅在执行成功时传入）"""
+        db = SessionLocal()
+        try:
+            values = {JobLease.owner: None, JobLease.lease_expires_at: None}
+            if run_key is not None:
+                values[JobLease.last_run_key] = run_key
+            db.query(JobLease).filter(
+                JobLease.job_name == job_name,
+                JobLease.owner == self.owner
+            ).update(values, synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            logger.error(f"释放任务租约失败: {str(e)}")
+        finally:
+            db.close()
+
+    def _heartbeat(self, job_name: str, stop: threading.Event, lost: threading.Event):
+        """定期续期；租约被接管或持续续期失败直到租约到期时置位 lost"""
+        renewed_at = time.monotonic()
+        while not stop.wait(max(self.lease_seconds / 3, 1)):
+            try:
+                if not self.renew(job_name):
+                    logger.warning(f"任务 {job_name} 的租约已被其他进程接管")
+                    lost.set()
+                    return
+                renewed_at = time.monotonic()
+            except Exception as e:
+                logger.error(f"续期任务租约失败: {str(e)}")
+                if time.monotonic() - renewed_at >= self.lease_seconds:
+                    logger.warning(f"任务 {job_name} 的租约已过期，其他进程可能已接管")
+                    lost.set()
+                    return
+
+    def _start_run(self, job_name: str, run_key: Optional[str]) -> int:
+        db = SessionLocal()
+        try:
+            run = JobRun(
+                job_name=job_name,
+                run_key=run_key,
+                owner=self.owner,
+                status="running",
+                started_at=datetime.now()
+            )
+            db.add(run)
+            db.commit()
+            return run.id
+        finally:
+            db.close()
+
+    def _finish_run(self, run_id: int, duration: float, rows: int, error: Optional[str]) -> Dict[str, Any]:
+        db = SessionLocal()
+        try:
+            run = db.query(JobRun).filter(JobRun.id == run_id).first()
+            run.status = "failed" if error else "succeeded"
+            run.finished_at = datetime.now()
+            run.duration_seconds = round(duration, 3)
+            run.rows_processed = rows
+            run.error = error
+            db.commit()
+            return self.to_dict(run)
+        finally:
+            db.close()
+
+    @staticmethod
+    def get_history(job_name: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """获取最近的执行历史"""
+        db = SessionLocal()
+        try:
+            query = db.query(JobRun)
+            if job_name:
+                query = query.filter(JobRun.job_name == job_name)
+            runs = query.order_by(JobRun.started_at.desc(), JobRun.id.desc()).limit(limit).all()
+            return [JobRunner.to_dict(run) for run in runs]
+        finally:
+            db.close()
+
+    @staticmethod
+    def to_dict(run: JobRun) -> Dict[str, Any]:
+        return {
+            "id": run.id,
+            "job_name": run.job_name,
+            "run_key": run.run_key,
+            "owner": run.owner,
+            "status": run.status,
+            "started_at": run.started_at.isoformat() if run.started_at else None,
+            "finished_at": run.finished_at.isoformat() if run.finished_at else None,
+            "duration_seconds": run.duration_seconds,
+            "rows_processed": run.rows_processed or 0,
+            "error": run.error
+        }
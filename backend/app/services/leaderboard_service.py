@@ -0,0 +1,275 @@
+import logging
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sortedcontainers import SortedList
+from sqlalchemy import event, func, case
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import SessionLocal
+from app.models.learning import Achievement
+from app.models.question import Question, UserAnswer
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_SCOPE = "global"
+_PENDING_KEY = "leaderboard_pending_points"
+
+
+def category_scope(category_id: int) -> str:
+    """分类榜：按该分类下答对的题目计分"""
+    return f"category:{category_id}"
+
+
+def week_scope(day: Optional[date] = None) -> str:
+    """周榜：按当周获得的成就点数计分"""
+    year, week, _ = (day or datetime.now().date()).isocalendar()
+    return f"week:{year}-W{week:02d}"
+
+
+def _week_range(scope: str) -> Tuple[datetime, datetime]:
+    start = datetime.strptime(scope.split(":", 1)[1] + "-1", "%G-W%V-%u")
+    return start, start + timedelta(days=7)
+
+
+def _load_scope_scores(db: Session, scope: str) -> Dict[int, float]:
+    """从数据库汇总某个榜单的全部分数（仅在榜单首次加载时执行）"""
+    if scope.startswith("category:"):
+        category_id = int(scope.split(":", 1)[1])
+        rows = db.query(
+            UserAnswer.user_id,
+            func.sum(case((UserAnswer.is_correct == True, 1), else_=0))
+        ).join(
+            Question, UserAnswer.question_id == Question.id
+        ).filter(
+            Question.category_id == category_id
+        ).group_by(UserAnswer.user_id).all()
+    else:
+        query = db.query(Achievement.user_id, func.sum(Achievement.points))
+        if scope.startswith("week:"):
+            start, end = _week_range(scope)
+            query = query.filter(Achievement.earned_at >= start, Achievement.earned_at < end)
+        rows = query.group_by(Achievement.user_id).all()
+    return {user_id: float(score or 0) for user_id, score in rows if score}
+
+
+class _MemoryRanking:
+    """单个榜单的有序索引：按 (-分数, 用户ID) 排序，增量更新和名次查询均为 O(log n)"""
+
+    def __init__(self, scores: Dict[int, float]):
+        self.scores = dict(scores)
+        self.order = SortedList((-score, user_id) for user_id, score in self.scores.items())
+        self.loaded_at = time.monotonic()
+
+    def incr(self, user_id: int, delta: float):
+        old = self.scores.get(user_id)
+        if old is not None:
+            self.order.remove((-old, user_id))
+        new = (old or 0.0) + float(delta)
+        self.scores[user_id] = new
+        self.order.add((-new, user_id))
+
+    def top(self, limit: int) -> List[Tuple[int, float]]:
+        return [(user_id, -neg_score) for neg_score, user_id in self.order.islice(0, limit)]
+
+    def rank(self, user_id: int) -> Optional[Tuple[int, float]]:
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        # 同分用户并列，名次取第一个同分位置
+        return self.order.bisect_left((-score, float("-inf"))) + 1, score
+
+
+class _MemoryLeaderboard:
+    """进程内榜单存储
+
+    每个进程只能收到本进程提交的积分变化，榜单超过 leaderboard_reload_seconds 后从数据库重建，
+    多进程部署未配置Redis时各进程的榜单在该时间内趋于一致。
+    """
+
+    # 加载期间有积分变化时重新加载的最大次数
+    MAX_LOAD_ATTEMPTS = 3
+
+    def __init__(self):
+        self._rankings: Dict[str, _MemoryRanking] = {}
+        # 各榜单收到的积分变化次数，加载前后不一致说明加载期间有新提交，需重新加载
+        self._changes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _ranking(self, scope: str, db: Optional[Session]) -> _MemoryRanking:
+        ranking = self._rankings.get(scope)
+        if ranking is not None and time.monotonic() - ranking.loaded_at < settings.leaderboard_reload_seconds:
+            return ranking
+        for attempt in range(self.MAX_LOAD_ATTEMPTS):
+            with self._lock:
+                changes = self._changes.get(scope, 0)
+            scores = self._load(scope, db)
+            with self._lock:
+                if self._changes.get(scope, 0) == changes or attempt == self.MAX_LOAD_ATTEMPTS - 1:
+                    ranking = self._rankings[scope] = _MemoryRanking(scores)
+                    return ranking
+        return ranking
+
+    @staticmethod
+    def _load(scope: str, db: Optional[Session]) -> Dict[int, float]:
+        if db is not None:
+            return _load_scope_scores(db, scope)
+        session = SessionLocal()
+        try:
+            return _load_scope_scores(session, scope)
+        finally:
+            session.close()
+
+    def incr(self, scope: str, user_id: int, delta: float):
+        with self._lock:
+            self._changes[scope] = self._changes.get(scope, 0) + 1
+            ranking = self._rankings.get(scope)
+            # 未加载的榜单在首次读取时会从数据库汇总，无需增量
+            if ranking is not None:
+                ranking.incr(user_id, delta)
+
+    def top(self, scope: str, limit: int, db: Optional[Session] = None) -> List[Tuple[int, float]]:
+        ranking = self._ranking(scope, db)
+        with self._lock:
+            return ranking.top(limit)
+
+    def rank(self, scope: str, user_id: int, db: Optional[Session] = None) -> Optional[Tuple[int, float]]:
+        ranking = self._ranking(scope, db)
+        with self._lock:
+            return ranking.rank(user_id)
+
+
+class _RedisLeaderboard:
+    """Redis有序集合榜单存储"""
+
+    prefix = "leaderboard:"
+
+    def __init__(self, url: str):
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self._watch_error = redis.WatchError
+
+    def _key(self, scope: str) -> str:
+        return self.prefix + scope
+
+    def _expire(self, pipe, scope: str):
+        """周榜在周结束后保留 leaderboard_week_retention_weeks 周，已过期的旧周榜至少保留一个重建周期"""
+        if not scope.startswith("week:"):
+            return
+        _, end = _week_range(scope)
+        expire_at = int(max(
+            (end + timedelta(weeks=settings.leaderboard_week_retention_weeks)).timestamp(),
+            time.time() + settings.leaderboard_reload_seconds
+        ))
+        key = self._key(scope)
+        for name in (key, key + ":loaded", key + ":changes"):
+            pipe.expireat(name, expire_at)
+
+    def _ensure_loaded(self, scope: str, db: Optional[Session]):
+        """首次读取时从数据库加载；加载期间有积分变化或其他进程已完成加载时，事务因 WATCH 失败而重试"""
+        key = self._key(scope)
+        if self._client.exists(key + ":loaded"):
+            return
+        for _ in range(_MemoryLeaderboard.MAX_LOAD_ATTEMPTS):
+            with self._client.pipeline() as pipe:
+                pipe.watch(key + ":loaded", key + ":changes")
+                if pipe.exists(key + ":loaded"):
+                    return
+                scores = _MemoryLeaderboard._load(scope, db)
+                pipe.multi()
+                pipe.delete(key)
+                if scores:
+                    pipe.zadd(key, {str(user_id): score for user_id, score in scores.items()})
+                pipe.set(key + ":loaded", 1)
+                self._expire(pipe, scope)
+                try:
+                    pipe.execute()
+                    return
+                except self._watch_error:
+                    continue
+        logger.warning(f"榜单 {scope} 加载期间持续有积分变化，本次读取可能不完整")
+
+    def incr(self, scope: str, user_id: int, delta: float):
+        # 未加载时也累加：之后的加载会整体覆盖，且变化计数会使进行中的加载重试
+        pipe = self._client.pipeline()
+        pipe.incr(self._key(scope) + ":changes")
+        pipe.zincrby(self._key(scope), delta, str(user_id))
+        self._expire(pipe, scope)
+        pipe.execute()
+
+    def top(self, scope: str, limit: int, db: Optional[Session] = None) -> List[Tuple[int, float]]:
+        self._ensure_loaded(scope, db)
+        return [
+            (int(member), float(score))
+            for member, score in self._client.zrevrange(self._key(scope), 0, limit - 1, withscores=True)
+        ]
+
+    def rank(self, scope: str, user_id: int, db: Optional[Session] = None) -> Optional[Tuple[int, float]]:
+        self._ensure_loaded(scope, db)
+        score = self._client.zscore(self._key(scope), str(user_id))
+        if score is None:
+            return None
+        # 同分并列：名次 = 分数更高的人数 + 1
+        return self._client.zcount(self._key(scope), f"({score}", "+inf") + 1, float(score)
+
+
+def _create_store():
+    if settings.redis_url:
+        try:
+            return _RedisLeaderboard(settings.redis_url)
+        except Exception as e:
+            logger.warning(f"Redis榜单不可用，使用进程内榜单: {e}")
+    return _MemoryLeaderboard()
+
+
+_store = _create_store()
+
+
+class LeaderboardService:
+    """积分排行榜服务"""
+
+    @staticmethod
+    def add_points(db: Session, user_id: int, points: float, *scopes: str):
+        """登记积分变化，事务提交后写入榜单"""
+        if points:
+            pending = db.info.setdefault(_PENDING_KEY, [])
+            pending.extend((scope, user_id, points) for scope in scopes)
+
+    @staticmethod
+    def get_top(db: Session, scope: str, limit: int = 10) -> List[Tuple[int, float]]:
+        """获取榜单前N名 [(用户ID, 分数)]"""
+        return _store.top(scope, limit, db)
+
+    @staticmethod
+    def get_rank(db: Session, scope: str, user_id: int) -> Optional[Tuple[int, float]]:
+        """获取用户名次与分数，未上榜返回None"""
+        return _store.rank(scope, user_id, db)
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_achievement_points(session: Session, flush_context, instances):
+    """新增成就时登记全局榜与周榜积分"""
+    for obj in session.new:
+        if isinstance(obj, Achievement) and obj.user_id is not None and obj.points:
+            earned_on = obj.earned_at.date() if obj.earned_at else datetime.now().date()
+            LeaderboardService.add_points(session, obj.user_id, obj.points, GLOBAL_SCOPE, week_scope(earned_on))
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_pending_points(session: Session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    try:
+        for scope, user_id, points in pending:
+            _store.incr(scope, user_id, points)
+    except Exception as e:
+        logger.error(f"更新排行榜失败: {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_points(session: Session):
+    session.info.pop(_PENDING_KEY, None)
@@ -3,11 +3,12 @@ from typing import Dict, List, Any, Optional
 from sqlalchemy.orm import Session
 from sqlalchemy import func, and_, desc, case
 from app.models.user import User
-from app.models.question import Question
-from app.models.exam import Exam, ExamResult
-from app.models.learning import LearningProgress, LearningTask, UserProfile, Achievement
+from app.models.learning import LearningPlan, LearningTask, UserProfile, Achievement
+from app.models.activity import DailyUserActivity
 from app.services.ai_service import AIService
-from datetime import datetime, timedelta
+from app.services.activity_rollup_service import ActivityRollupService, ROLLUP_FIELDS
+from app.services.report_partial_service import ReportPartialService
+from datetime import date, datetime, timedelta
 import json
 
 logger = logging.getLogger(__name__)
@@ -18,69 +19,47 @@ class LearningReportService:
         self.db = db
         self.ai_service = AIService()
     
-    async def generate_daily_report(self, user_id: int) -> Dict[str, Any]:
-        """生成每日学习报告"""
+    async def generate_daily_report(self, user_id: int, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """生成每日学习报告
+
+        context 为批量预取的用户数据（见 ReportContextLoader），未提供时单独加载。
+        """
         try:
-            # 获取用户基本信息
-            user = self.db.query(User).filter(User.id == user_id).first()
-            if not user:
+            if context is None:
+                context = ReportContextLoader(self.db).load([user_id]).get(user_id)
+            if not context:
                 raise ValueError("用户不存在")
             
-            # 获取今日学习数据
-            today = datetime.now().date()
-            today_start = datetime.combine(today, datetime.min.time())
-            today_end = datetime.combine(today, datetime.max.time())
-            
-            # 今日学习时长
-            today_study_time = self.db.query(func.sum(LearningProgress.duration_minutes)).filter(
-                LearningProgress.user_id == user_id,
-                LearningProgress.created_at >= today_start,
-                LearningProgress.created_at <= today_end
-            ).scalar() or 0
-            
-            # 今日答题数量
-            today_questions = self.db.query(func.count(ExamResult.id)).filter(
-                ExamResult.user_id == user_id,
-                ExamResult.created_at >= today_start,
-                ExamResult.created_at <= today_end
-            ).scalar() or 0
-            
-            # 今日平均分数
-            today_avg_score = self.db.query(func.avg(ExamResult.score)).filter(
-                ExamResult.user_id == user_id,
-                ExamResult.created_at >= today_start,
-                ExamResult.created_at <= today_end,
-                ExamResult.status == "completed"
-            ).scalar() or 0
-            
-            # 获取本周学习趋势
-            week_trends = self._get_weekly_trends(user_id)
+            today = context["report_date"]
+            today_row = context["daily"][-1]
             
-            # 获取学科表现
-            subject_performance = self._get_subject_performance(user_id)
+            # 今日学习数据
+            today_study_time = today_row["study_minutes"]
+            today_questions = today_row["questions_answered"]
+            today_avg_score = (
+                today_row["score_sum"] / today_row["score_count"] if today_row["score_count"] else 0
+            )
             
             # 获取学习建议
-            learning_suggestions = await self._generate_learning_suggestions(user_id, today_avg_score)
-            
-            # 生成成长曲线数据
-            growth_curve = self._generate_growth_curve(user_id)
+            learning_suggestions = await self._generate_learning_suggestions(context, today_avg_score)
             
             report = {
                 "date": today.strftime("%Y-%m-%d"),
-                "user_name": user.username,
+                "user_name": context["username"],
                 "today_summary": {
                     "study_time_minutes": today_study_time,
                     "study_time_hours": round(today_study_time / 60, 1),
                     "questions_answered": today_questions,
                     "average_score": round(today_avg_score, 1),
-                    "completion_rate": self._calculate_completion_rate(user_id, today_start, today_end)
+                    "completion_rate": context["completion_rate"]
                 },
-                "weekly_trends": week_trends,
-                "subject_performance": subject_performance,
+                "weekly_trends": self._get_weekly_trends(user_id, context),
+                "subject_performance": self._get_subject_performance(context["subjects"]),
+                "monthly_summary": self._get_monthly_summary(context),
                 "learning_suggestions": learning_suggestions,
-                "growth_curve": growth_curve,
-                "achievements": self._get_recent_achievements(user_id),
-                "next_day_tasks": await self._generate_next_day_tasks(user_id)
+                "growth_curve": self._generate_growth_curve(context),
+                "achievements": context["achievements"],
+                "next_day_tasks": await self._generate_next_day_tasks(context)
             }
             
             logger.info(f"为用户 {user_id} 生成每日学习报告成功")
@@ -90,75 +69,58 @@ class LearningReportService:
             logger.error(f"生成每日学习报告失败: {str(e)}")
             return self._generate_default_report(user_id)
     
-    def _get_weekly_trends(self, user_id: int) -> Dict[str, Any]:
+    def _get_weekly_trends(self, user_id: int, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """获取本周学习趋势"""
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=7)
-        
-        # 每日学习时长
-        daily_study_time = self.db.query(
-            func.date(LearningProgress.created_at).label('date'),
-            func.sum(LearningProgress.duration_minutes).label('duration')
-        ).filter(
-            LearningProgress.user_id == user_id,
-            LearningProgress.created_at >= start_date,
-            LearningProgress.created_at <= end_date
-        ).group_by(func.date(LearningProgress.created_at)).all()
-        
-        # 每日答题数量
-        daily_questions = self.db.query(
-            func.date(ExamResult.created_at).label('date'),
-            func.count(ExamResult.id).label('count')
-        ).filter(
-            ExamResult.user_id == user_id,
-            ExamResult.created_at >= start_date,
-            ExamResult.created_at <= end_date
-        ).group_by(func.date(ExamResult.created_at)).all()
+        # 读取最近7天的每日汇总
+        if context is not None:
+            daily_rows = context["daily"][-7:]
+        else:
+            daily_rows = ActivityRollupService(self.db).get_recent_days(user_id, days=7)
         
-        # 构建趋势数据
-        trends = []
-        for i in range(7):
-            date = (end_date - timedelta(days=i)).strftime("%Y-%m-%d")
-            
-            study_data = next((d for d in daily_study_time if d.date.strftime("%Y-%m-%d") == date), None)
-            question_data = next((q for q in daily_questions if q.date.strftime("%Y-%m-%d") == date), None)
-            
-            trends.append({
-                "date": date,
-                "study_time": study_data.duration if study_data else 0,
-                "questions": question_data.count if question_data else 0
-            })
+        trends = [
+            {
+                "date": day["date"].strftime("%Y-%m-%d"),
+                "study_time": day["study_minutes"],
+                "questions": day["questions_answered"]
+            }
+            for day in daily_rows
+        ]
         
-        return {
-            "daily_data": trends[::-1],  # 按日期正序
+        weekly = {
+            "daily_data": trends,  # 按日期正序
             "total_study_time": sum(t["study_time"] for t in trends),
             "total_questions": sum(t["questions"] for t in trends),
             "avg_daily_study_time": round(sum(t["study_time"] for t in trends) / 7, 1),
             "avg_daily_questions": round(sum(t["questions"] for t in trends) / 7, 1)
         }
+        if context is not None:
+            weekly["subject_performance"] = self._get_subject_performance(context["subjects_weekly"])
+        return weekly
     
-    def _get_subject_performance(self, user_id: int) -> List[Dict[str, Any]]:
-        """获取各学科表现"""
-        # 获取用户在各学科的答题情况
-        subject_stats = self.db.query(
-            Question.subject,
-            func.count(ExamResult.id).label('total_questions'),
-            func.avg(ExamResult.score).label('avg_score'),
-            func.sum(case((ExamResult.score >= 60, 1), else_=0)).label('passed_questions')
-        ).join(ExamResult, Question.id == ExamResult.question_id).filter(
-            ExamResult.user_id == user_id,
-            ExamResult.status == "completed"
-        ).group_by(Question.subject).all()
-        
+    def _get_monthly_summary(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        """近30天汇总（由每日汇总与学科增量合并得到）"""
+        daily_rows = context["daily"]
+        score_sum = sum(day["score_sum"] for day in daily_rows)
+        score_count = sum(day["score_count"] for day in daily_rows)
+        return {
+            "total_study_time": sum(day["study_minutes"] for day in daily_rows),
+            "total_questions": sum(day["questions_answered"] for day in daily_rows),
+            "active_days": sum(1 for day in daily_rows if day["session_count"] or day["questions_answered"]),
+            "average_score": round(score_sum / score_count, 1) if score_count else 0,
+            "subject_performance": self._get_subject_performance(context["subjects_monthly"])
+        }
+    
+    def _get_subject_performance(self, subjects: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """获取各学科（题目分类）表现"""
         performance = []
-        for stat in subject_stats:
-            pass_rate = round((stat.passed_questions / stat.total_questions * 100) if stat.total_questions > 0 else 0, 1)
+        for stat in subjects:
+            average_score = stat["correct"] / stat["answered"] * 100 if stat["answered"] else 0
             performance.append({
-                "subject": stat.subject,
-                "total_questions": stat.total_questions,
-                "average_score": round(stat.avg_score, 1),
-                "pass_rate": pass_rate,
-                "performance_level": self._get_performance_level(stat.avg_score)
+                "subject": stat["subject"],
+                "total_questions": stat["answered"],
+                "average_score": round(average_score, 1),
+                "pass_rate": round(average_score, 1),
+                "performance_level": self._get_performance_level(average_score)
             })
         
         return performance
@@ -176,11 +138,10 @@ class LearningReportService:
         else:
             return "需努力"
     
-    async def _generate_learning_suggestions(self, user_id: int, today_avg_score: float) -> List[str]:
+    async def _generate_learning_suggestions(self, context: Dict[str, Any], today_avg_score: float) -> List[str]:
         """生成学习建议"""
         try:
-            # 获取用户画像
-            profile = self.db.query(UserProfile).filter(UserProfile.user_id == user_id).first()
+            profile = context["profile"]
             
             # 分析学习数据
             suggestions = []
@@ -194,10 +155,7 @@ class LearningReportService:
                 suggestions.append("今日表现优秀！建议保持学习热情，可以探索更深层的知识点")
             
             # 基于学习时长的建议
-            today_study_time = self.db.query(func.sum(LearningProgress.duration_minutes)).filter(
-                LearningProgress.user_id == user_id,
-                LearningProgress.created_at >= datetime.now().date()
-            ).scalar() or 0
+            today_study_time = context["daily"][-1]["study_minutes"]
             
             if today_study_time < 30:
                 suggestions.append("今日学习时间较短，建议增加学习时长，保持学习连续性")
@@ -205,13 +163,13 @@ class LearningReportService:
                 suggestions.append("今日学习时间充足，注意适当休息，保持学习效率")
             
             # 基于学科表现的建议
-            weak_subjects = self._get_weak_subjects(user_id)
+            weak_subjects = self._get_weak_subjects(context)
             if weak_subjects:
                 suggestions.append(f"建议重点加强{', '.join(weak_subjects)}等薄弱学科的学习")
             
             # 使用AI生成个性化建议
             if self.ai_service._ai_available:
-                ai_suggestions = await self._get_ai_suggestions(user_id, profile, today_avg_score)
+                ai_suggestions = await self._get_ai_suggestions(context["user_id"], profile, today_avg_score)
                 suggestions.extend(ai_suggestions)
             
             return suggestions[:5]  # 返回前5条建议
@@ -220,32 +178,22 @@ class LearningReportService:
             logger.error(f"生成学习建议失败: {str(e)}")
             return ["建议保持规律的学习习惯，每天坚持练习", "多关注错题分析，理解解题思路"]
     
-    def _get_weak_subjects(self, user_id: int) -> List[str]:
-        """获取薄弱学科"""
-        weak_subjects = self.db.query(Question.subject).join(ExamResult, Question.id == ExamResult.question_id).filter(
-            ExamResult.user_id == user_id,
-            ExamResult.status == "completed",
-            ExamResult.score < 60
-        ).group_by(Question.subject).having(
-            func.count(ExamResult.id) >= 3
-        ).all()
-        
-        return [subject.subject for subject in weak_subjects]
+    def _get_weak_subjects(self, context: Dict[str, Any]) -> List[str]:
+        """获取薄弱学科（正确率低于60%且至少答题3次）"""
+        return [
+            stat["subject"] for stat in context["subjects"]
+            if stat["answered"] >= 3 and stat["correct"] / stat["answered"] < 0.6
+        ]
     
     async def _get_ai_suggestions(self, user_id: int, profile: UserProfile, today_avg_score: float) -> List[str]:
         """使用AI生成个性化建议"""
         try:
-            prompt = f"""
-基于以下用户信息生成2-3条个性化的学习建议：
-
-用户学习风格：{profile.learning_style if profile else '未知'}
-今日平均分数：{today_avg_score}
-学习目标：{profile.learning_goals if profile else '未设置'}
-
-请提供具体、可操作的学习建议，每条建议不超过50字。
-"""
-            
-            response = await self.ai_service._call_ai_api(prompt)
+            response = await self.ai_service._call_prompt(
+                'learning_suggestions',
+                learning_style=profile.learning_style if profile else '未知',
+                today_avg_score=today_avg_score,
+                learning_goals=profile.learning_goals if profile else '未设置'
+            )
             if response:
                 # 简单解析AI响应
                 suggestions = [s.strip() for s in response.split('\n') if s.strip() and len(s.strip()) > 10]
@@ -256,38 +204,23 @@ class LearningReportService:
         
         return []
     
-    def _generate_growth_curve(self, user_id: int) -> Dict[str, Any]:
-        """生成成长曲线数据"""
-        # 获取最近30天的学习数据
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=30)
-        
-        # 每日学习进度
-        daily_progress = self.db.query(
-            func.date(LearningProgress.created_at).label('date'),
-            func.sum(LearningProgress.duration_minutes).label('duration'),
-            func.count(ExamResult.id).label('questions'),
-            func.avg(ExamResult.score).label('avg_score')
-        ).outerjoin(ExamResult, LearningProgress.user_id == ExamResult.user_id).filter(
-            LearningProgress.user_id == user_id,
-            LearningProgress.created_at >= start_date,
-            LearningProgress.created_at <= end_date
-        ).group_by(func.date(LearningProgress.created_at)).all()
-        
-        # 构建成长曲线
+    def _generate_growth_curve(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        """生成成长曲线数据（最近30天）"""
         growth_data = []
         cumulative_study_time = 0
         cumulative_questions = 0
         
-        for progress in daily_progress:
-            cumulative_study_time += progress.duration or 0
-            cumulative_questions += progress.questions or 0
+        for day in context["daily"]:
+            if not (day["study_minutes"] or day["questions_answered"] or day["score_count"]):
+                continue
+            cumulative_study_time += day["study_minutes"]
+            cumulative_questions += day["questions_answered"]
             
             growth_data.append({
-                "date": progress.date.strftime("%Y-%m-%d"),
-                "daily_study_time": progress.duration or 0,
-                "daily_questions": progress.questions or 0,
-                "daily_avg_score": round(progress.avg_score, 1) if progress.avg_score else 0,
+                "date": day["date"].strftime("%Y-%m-%d"),
+                "daily_study_time": day["study_minutes"],
+                "daily_questions": day["questions_answered"],
+                "daily_avg_score": round(day["score_sum"] / day["score_count"], 1) if day["score_count"] else 0,
                 "cumulative_study_time": cumulative_study_time,
                 "cumulative_questions": cumulative_questions
             })
@@ -322,30 +255,11 @@ class LearningReportService:
             "questions": round(questions_growth, 1)
         }
     
-    def _get_recent_achievements(self, user_id: int) -> List[Dict]:
-        """获取最近成就"""
-        achievements = self.db.query(Achievement).filter(
-            Achievement.user_id == user_id
-        ).order_by(Achievement.created_at.desc()).limit(5).all()
-        
-        return [
-            {
-                "id": achievement.id,
-                "title": achievement.title,
-                "description": achievement.description,
-                "achieved_at": achievement.created_at.strftime("%Y-%m-%d")
-            }
-            for achievement in achievements
-        ]
-    
-    async def _generate_next_day_tasks(self, user_id: int) -> List[Dict]:
+    async def _generate_next_day_tasks(self, context: Dict[str, Any]) -> List[Dict]:
         """生成明日学习任务"""
         try:
-            # 获取用户画像和学习目标
-            profile = self.db.query(UserProfile).filter(UserProfile.user_id == user_id).first()
-            
             # 基于薄弱学科生成任务
-            weak_subjects = self._get_weak_subjects(user_id)
+            weak_subjects = self._get_weak_subjects(context)
             tasks = []
             
             for subject in weak_subjects[:3]:  # 最多3个学科
@@ -374,23 +288,6 @@ class LearningReportService:
             logger.error(f"生成明日任务失败: {str(e)}")
             return []
     
-    def _calculate_completion_rate(self, user_id: int, start_time: datetime, end_time: datetime) -> float:
-        """计算任务完成率"""
-        total_tasks = self.db.query(func.count(LearningTask.id)).filter(
-            LearningTask.user_id == user_id,
-            LearningTask.created_at >= start_time,
-            LearningTask.created_at <= end_time
-        ).scalar() or 0
-        
-        completed_tasks = self.db.query(func.count(LearningTask.id)).filter(
-            LearningTask.user_id == user_id,
-            LearningTask.created_at >= start_time,
-            LearningTask.created_at <= end_time,
-            LearningTask.status == "completed"
-        ).scalar() or 0
-        
-        return round((completed_tasks / total_tasks * 100) if total_tasks > 0 else 0, 1)
-    
     def _generate_default_report(self, user_id: int) -> Dict[str, Any]:
         """生成默认报告"""
         return {
@@ -411,6 +308,13 @@ class LearningReportService:
                 "avg_daily_questions": 0
             },
             "subject_performance": [],
+            "monthly_summary": {
+                "total_study_time": 0,
+                "total_questions": 0,
+                "active_days": 0,
+                "average_score": 0,
+                "subject_performance": []
+            },
             "learning_suggestions": ["建议开始学习，建立良好的学习习惯"],
             "growth_curve": {
                 "daily_data": [],
@@ -420,4 +324,119 @@ class LearningReportService:
             },
             "achievements": [],
             "next_day_tasks": []
-        } 
\ No newline at end of file
+        } 
+
+class ReportContextLoader:
+    """按用户批次预取报告所需数据，每类数据一条集合查询"""
+
+    GROWTH_DAYS = 30
+    RECENT_ACHIEVEMENTS = 5
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def load(self, user_ids: List[int], report_date: Optional[date] = None) -> Dict[int, Dict[str, Any]]:
+        """返回 {用户ID: 报告上下文}，不存在的用户不包含在结果中"""
+        if not user_ids:
+            return {}
+        report_date = report_date or datetime.now().date()
+        day_start = datetime.combine(report_date, datetime.min.time())
+        day_end = day_start + timedelta(days=1)
+
+        users = self.db.query(User.id, User.username).filter(User.id.in_(user_ids)).all()
+        contexts: Dict[int, Dict[str, Any]] = {
+            user.id: {
+                "user_id": user.id,
+                "username": user.username,
+                "report_date": report_date,
+                "profile": None,
+                "daily": [],
+                "subjects": [],
+                "subjects_weekly": [],
+                "subjects_monthly": [],
+                "achievements": [],
+                "completion_rate": 0
+            }
+            for user in users
+        }
+        if not contexts:
+            return {}
+        ids = list(contexts)
+
+        # 最近30天每日汇总
+        start_date = report_date - timedelta(days=self.GROWTH_DAYS - 1)
+        rollup_rows = self.db.query(DailyUserActivity).filter(
+            DailyUserActivity.user_id.in_(ids),
+            DailyUserActivity.activity_date >= start_date,
+            DailyUserActivity.activity_date <= report_date
+        ).all()
+        rollups = {(row.user_id, row.activity_date): row for row in rollup_rows}
+        for user_id, context in contexts.items():
+            for offset in range(self.GROWTH_DAYS):
+                day = start_date + timedelta(days=offset)
+                row = rollups.get((user_id, day))
+                context["daily"].append({
+                    "date": day,
+                    **{field: (getattr(row, field) or 0) if row else 0 for field in ROLLUP_FIELDS}
+                })
+
+        # 用户画像
+        for profile in self.db.query(UserProfile).filter(UserProfile.user_id.in_(ids)).all():
+            contexts[profile.user_id]["profile"] = profile
+
+        # 各学科答题情况：只统计上次报告之后的增量，再与已存储的部分合并
+        partials = ReportPartialService(self.db).build(ids, report_date, window_days=self.GROWTH_DAYS)
+        for user_id, partial in partials.items():
+            context = contexts[user_id]
+            context["subjects"] = self._subject_list(partial["totals"])
+            context["subjects_weekly"] = self._subject_list(partial["weekly"])
+            context["subjects_monthly"] = self._subject_list(partial["monthly"])
+
+        # 每个用户最近的成就
+        ranked = self.db.query(
+            Achievement.id,
+            Achievement.user_id,
+            Achievement.title,
+            Achievement.description,
+            Achievement.earned_at,
+            func.row_number().over(
+                partition_by=Achievement.user_id,
+                order_by=(Achievement.earned_at.desc(), Achievement.id.desc())
+            ).label('position')
+        ).filter(Achievement.user_id.in_(ids)).subquery()
+        achievement_rows = self.db.query(ranked).filter(
+            ranked.c.position <= self.RECENT_ACHIEVEMENTS
+        ).order_by(ranked.c.user_id, ranked.c.position).all()
+        for row in achievement_rows:
+            contexts[row.user_id]["achievements"].append({
+                "id": row.id,
+                "title": row.title,
+                "description": row.description,
+                "achieved_at": row.earned_at.strftime("%Y-%m-%d") if row.earned_at else None
+            })
+
+        # 当日任务完成率
+        task_rows = self.db.query(
+            LearningPlan.user_id,
+            func.count(LearningTask.id).label('total'),
+            func.sum(case((LearningTask.status == "completed", 1), else_=0)).label('completed')
+        ).join(
+            LearningPlan, LearningTask.plan_id == LearningPlan.id
+        ).filter(
+            LearningPlan.user_id.in_(ids),
+            LearningTask.created_at >= day_start,
+            LearningTask.created_at < day_end
+        ).group_by(LearningPlan.user_id).all()
+        for row in task_rows:
+            contexts[row.user_id]["completion_rate"] = round(
+                (row.completed or 0) / row.total * 100 if row.total else 0, 1
+            )
+
+        return contexts
+
+    @staticmethod
+    def _subject_list(counts: Dict[str, List[int]]) -> List[Dict[str, Any]]:
+        return [
+            {"subject": subject, "answered": answered, "correct": correct}
+            for subject, (answered, correct) in sorted(counts.items())
+        ]
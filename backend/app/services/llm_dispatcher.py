@@ -0,0 +1,217 @@
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from config import settings
+from app.utils.rate_limit import RedisTokenBucketLimiter, TokenBucketLimiter
+
+logger = logging.getLogger(__name__)
+
+# 调用优先级：交互请求（实时问答、评分）> 准实时（后台任务）> 批量（定时任务）
+INTERACTIVE = "interactive"
+NEAR_REAL_TIME = "near_real_time"
+BATCH = "batch"
+PRIORITY_CLASSES = (INTERACTIVE, NEAR_REAL_TIME, BATCH)
+
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+def set_priority(priority: str):
+    """设置当前上下文（线程/任务）后续AI调用的优先级"""
+    _priority.set(priority)
+
+
+@contextmanager
+def llm_priority(priority: str):
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+Waiter = Tuple[asyncio.AbstractEventLoop, asyncio.Future]
+
+
+def _create_limiter(kind: str, per_minute: int) -> TokenBucketLimiter:
+    """服务商额度令牌桶，配置了Redis时在多进程间共享"""
+    if settings.redis_url:
+        try:
+            return RedisTokenBucketLimiter(settings.redis_url, f"llm:rate:{kind}:", per_minute, per_minute / 60)
+        except Exception as e:
+            logger.warning(f"Redis限流不可用，使用进程内额度: {e}")
+    return TokenBucketLimiter(per_minute, per_minute / 60)
+
+
+class LLMDispatcher:
+    """进程内AI调用调度：限制总并发，按优先级加权轮询分配名额，并按服务商RPM/TPM额度限速
+
+    有交互请求排队时不再放行批量请求，批量请求最多占用 llm_batch_max_share 的并发名额，
+    服务商额度也为交互请求预留一部分。定时任务在独立线程的事件循环中运行，因此用线程锁保护状态，
+    并通过 call_soon_threadsafe 唤醒等待者。
+
+    并发名额和优先级排队只在进程内有效：定时任务由 worker.py 独立进程执行（scheduler_enabled=False）时，
+    批量调用不会为Web进程排队中的交互请求让出并发名额。配置 redis_url 后服务商RPM/TPM额度在各进程间共享，
+    批量调用仍只能使用预留部分之外的额度，交互请求的额度不会被定时任务进程耗尽；
+    未配置时每个进程各自按完整额度限速，多进程部署应相应调低 llm_provider_rate_limits。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {name: 0 for name in PRIORITY_CLASSES}
+        self._waiting: Dict[str, Deque[Waiter]] = {name: deque() for name in PRIORITY_CLASSES}
+        self._credit = {name: 0 for name in PRIORITY_CLASSES}
+        self._limiters: Dict[str, Tuple[Optional[TokenBucketLimiter], Optional[TokenBucketLimiter]]] = {}
+
+    # 并发名额
+
+    def _batch_cap(self) -> int:
+        return max(1, int(settings.llm_max_concurrency * settings.llm_batch_max_share))
+
+    def _eligible(self) -> List[str]:
+        """可以放行的排队类别：有交互请求排队时批量请求让路，批量请求不超过并发上限比例"""
+        eligible = [name for name in PRIORITY_CLASSES if self._waiting[name]]
+        if BATCH in eligible and (self._waiting[INTERACTIVE] or self._in_flight[BATCH] >= self._batch_cap()):
+            eligible.remove(BATCH)
+        return eligible
+
+    def _pick(self, eligible: List[str]) -> str:
+        """平滑加权轮询"""
+        weights = settings.llm_priority_weights
+        for name in eligible:
+            self._credit[name] += weights.get(name, 1)
+        chosen = max(eligible, key=lambda name: self._credit[name])
+        self._credit[chosen] -= sum(weights.get(name, 1) for name in eligible)
+        return chosen
+
+    def _dispatch(self):
+        """有空闲名额时唤醒排队者（需持有锁）"""
+        while sum(self._in_flight.values()) < settings.llm_max_concurrency:
+            eligible = self._eligible()
+            if not eligible:
+                return
+            name = self._pick(eligible)
+            loop, future = self._waiting[name].popleft()
+            try:
+                loop.call_soon_threadsafe(self._grant, future, name)
+            except RuntimeError:
+                # 等待者所在的事件循环已关闭
+                continue
+            self._in_flight[name] += 1
+
+    def _grant(self, future: asyncio.Future, name: str):
+        if future.done():
+            # 等待者在被唤醒前已取消，归还名额
+            self.release(name)
+        else:
+            future.set_result(None)
+
+    async def acquire(self, priority: str):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            # 没有人排队且有名额时直接放行，否则排队保证公平
+            if not any(self._waiting.values()) and sum(self._in_flight.values()) < settings.llm_max_concurrency \
+                    and (priority != BATCH or self._in_flight[BATCH] < self._batch_cap()):
+                self._in_flight[priority] += 1
+                return
+            future = loop.create_future()
+            waiter = (loop, future)
+            self._waiting[priority].append(waiter)
+            self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                queued = waiter in self._waiting[priority]
+                if queued:
+                    self._waiting[priority].remove(waiter)
+            # 已分配名额但任务在恢复前被取消（未来对象已有结果，_grant 不会归还）
+            if not queued and future.done() and not future.cancelled():
+                self.release(priority)
+            raise
+
+    def release(self, priority: str):
+        with self._lock:
+            self._in_flight[priority] -= 1
+            self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority: Optional[str] = None):
+        priority = priority or current_priority()
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    # 服务商额度
+
+    def _get_limiters(self, provider: str) -> Tuple[Optional[TokenBucketLimiter], Optional[TokenBucketLimiter]]:
+        limiters = self._limiters.get(provider)
+        if limiters is None:
+            limits = settings.llm_provider_rate_limits.get(provider, {})
+            rpm, tpm = limits.get("rpm"), limits.get("tpm")
+            limiters = self._limiters.setdefault(provider, (
+                _create_limiter("rpm", rpm) if rpm else None,
+                _create_limiter("tpm", tpm) if tpm else None
+            ))
+        return limiters
+
+    def _rate_wait(self, provider: str, tokens: int, priority: str) -> int:
+        """距离该服务商额度足够还需等待的秒数；批量请求需要在预留额度之外还有余量"""
+        wait = 0
+        for limiter, cost in zip(self._get_limiters(provider), (1, tokens)):
+            if limiter is None:
+                continue
+            reserve = limiter.capacity * settings.llm_batch_rate_reserve if priority == BATCH else 0
+            wait = max(wait, limiter.retry_after(provider, min(cost + reserve, limiter.capacity)))
+        return wait
+
+    async def wait_for_rate(self, providers: List[str], tokens: int, priority: Optional[str] = None):
+        """所有服务商额度都不足时，等待最早恢复的一个（最多 llm_rate_max_wait 秒）"""
+        priority = priority or current_priority()
+        deadline = time.monotonic() + settings.llm_rate_max_wait
+        while providers:
+            wait = min(self._rate_wait(provider, tokens, priority) for provider in providers)
+            remaining = deadline - time.monotonic()
+            if wait <= 0 or remaining <= 0:
+                return
+            await asyncio.sleep(min(wait, remaining))
+
+    def take_rate(self, provider: str, tokens: int, priority: Optional[str] = None) -> bool:
+        """占用一次请求和预估的输入token额度，额度不足时返回False"""
+        priority = priority or current_priority()
+        if self._rate_wait(provider, tokens, priority) > 0:
+            return False
+        requests, token_bucket = self._get_limiters(provider)
+        if requests is not None:
+            requests.consume(provider, 1)
+        if token_bucket is not None:
+            token_bucket.consume(provider, tokens)
+        return True
+
+    def charge_tokens(self, provider: str, tokens: int):
+        """响应返回后按实际输出token补扣额度"""
+        token_bucket = self._get_limiters(provider)[1]
+        if token_bucket is not None and tokens > 0:
+            token_bucket.consume(provider, tokens)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_concurrency": settings.llm_max_concurrency,
+                "in_flight": dict(self._in_flight),
+                "waiting": {name: len(queue) for name, queue in self._waiting.items()}
+            }
+
+
+llm_dispatcher = LLMDispatcher()
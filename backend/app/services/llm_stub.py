@@ -0,0 +1,485 @@
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+from config import settings
+from app.services.prompt_registry import PROMPTS, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+Messages = List[Dict[str, str]]
+
+
+class StubProviderError(Exception):
+    """模拟服务商返回的错误"""
+
+    def __init__(self, message: str, status_code: int = 500):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def request_key(messages: Messages) -> str:
+    """请求指纹：只取消息内容，不含服务商和模型，录制的响应可由任一服务商回放"""
+    return hashlib.sha256(json.dumps(messages, ensure_ascii=False, sort_keys=True).encode()).hexdigest()
+
+
+def _completion(content: str, model: str, prompt_tokens: int, completion_tokens: int) -> SimpleNamespace:
+    """构造与 OpenAI SDK 返回值属性一致的对象"""
+    return SimpleNamespace(
+        id=f"chatcmpl-{uuid.uuid4().hex[:24]}",
+        object="chat.completion",
+        created=int(time.time()),
+        model=model,
+        choices=[SimpleNamespace(
+            index=0,
+            message=SimpleNamespace(role="assistant", content=content),
+            finish_reason="stop"
+        )],
+        usage=SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens
+        )
+    )
+
+
+def completion_to_dict(completion: SimpleNamespace) -> Dict[str, Any]:
+    return {
+        "id": completion.id,
+        "object": completion.object,
+        "created": completion.created,
+        "model": completion.model,
+        "choices": [{
+            "index": choice.index,
+            "message": {"role": choice.message.role, "content": choice.message.content},
+            "finish_reason": choice.finish_reason
+        } for choice in completion.choices],
+        "usage": vars(completion.usage)
+    }
+
+
+class _ChatClient(ABC):
+    """提供 client.chat.completions.create(...) 调用方式，可直接替换 OpenAI 客户端"""
+
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    @abstractmethod
+    def create(self, *, model: str, messages: Messages, **kwargs) -> SimpleNamespace:
+        ...
+
+
+# 默认响应：没有匹配的预设内容时按提示词模板返回，格式与对应方法的解析逻辑一致
+
+def _requested_count(text: str, limit: int = 50) -> int:
+    match = re.search(r"题目数量：\s*(\d+)", text)
+    return min(int(match.group(1)), limit) if match else 1
+
+
+def _stub_question(index: int, **extra) -> Dict[str, Any]:
+    return {
+        "content": f"模拟题目 {index + 1}",
+        "question_type": "single_choice",
+        "options": ["A. 选项一", "B. 选项二", "C. 选项三", "D. 选项四"],
+        "answer": "A",
+        "explanation": "模拟解析",
+        "difficulty": 3,
+        "tags": ["模拟"],
+        **extra
+    }
+
+
+def _stub_question_list(text: str) -> List[Dict[str, Any]]:
+    return [_stub_question(i) for i in range(_requested_count(text))]
+
+
+def _stub_question_list_with_skill(text: str) -> List[Dict[str, Any]]:
+    match = re.search(r"技能点：\s*(\S+)", text)
+    skill = match.group(1) if match else "模拟技能点"
+    return [_stub_question(i, skill=skill) for i in range(_requested_count(text))]
+
+
+def _stub_question_bank(text: str) -> Dict[str, Any]:
+    return {"questions": [{
+        "title": f"模拟题目 {i + 1}",
+        "content": f"模拟题目 {i + 1} 的内容",
+        "type": "choice",
+        "options": ["A", "B", "C", "D"],
+        "answer": "A",
+        "explanation": "模拟解析",
+        "difficulty": 3,
+        "tags": ["模拟"]
+    } for i in range(_requested_count(text))]}
+
+
+def _stub_grading(text: str) -> Dict[str, Any]:
+    match = re.search(r"满分：\s*(\d+)", text)
+    max_score = int(match.group(1)) if match else 10
+    return {
+        "score": round(max_score * 0.8),
+        "accuracy_score": 80,
+        "logic_score": 80,
+        "expression_score": 80,
+        "creativity_score": 70,
+        "overall_accuracy": 80,
+        "detailed_feedback": {
+            "strengths": ["模拟优点"],
+            "weaknesses": ["模拟不足"],
+            "specific_errors": [],
+            "improvement_suggestions": ["模拟改进建议"]
+        },
+        "learning_insights": {
+            "knowledge_gaps": ["模拟知识盲点"],
+            "skill_development": ["模拟技能提升建议"],
+            "next_steps": ["模拟学习重点"]
+        },
+        "encouragement": "模拟鼓励话语",
+        "difficulty_adjustment": "保持当前难度"
+    }
+
+
+def _stub_answer(text: str) -> str:
+    # real_time_qa 只解析 ```json 代码块
+    return "```json\n" + json.dumps({
+        "answer": "模拟答案",
+        "explanation": "模拟解释",
+        "knowledge_points": ["模拟知识点"],
+        "learning_tips": ["模拟学习建议"],
+        "related_topics": ["模拟相关主题"],
+        "difficulty_level": "intermediate"
+    }, ensure_ascii=False) + "\n```"
+
+
+def _stub_exam(text: str) -> Dict[str, Any]:
+    questions = [_stub_question(i, score=10, skill="模拟技能点") for i in range(5)]
+    return {
+        "exam_info": {"title": "模拟试卷", "description": "模拟试卷说明", "total_score": 50, "duration": 60},
+        "questions": questions,
+        "answer_sheet": [{"index": i + 1, "answer": question["answer"]} for i, question in enumerate(questions)],
+        "analysis": "模拟试卷分析"
+    }
+
+
+def _stub_learning_report(text: str) -> Dict[str, Any]:
+    return {
+        "overall_performance": {"total_score": 0, "average_score": 0, "study_time": 0},
+        "subject_analysis": {},
+        "learning_patterns": "模拟学习模式分析",
+        "strengths_weaknesses": {"strengths": ["模拟优势"], "weaknesses": ["模拟劣势"]},
+        "recommendations": ["模拟建议"],
+        "improvement_plan": ["模拟改进计划"],
+        "progress_trend": "稳定"
+    }
+
+
+def _stub_wrong_analysis(text: str) -> Dict[str, Any]:
+    return {
+        "error_analysis": {
+            "error_type": "概念错误",
+            "error_severity": "中等",
+            "root_cause": "模拟原因分析",
+            "common_mistakes": ["模拟常见错误"],
+            "misconceptions": ["模拟错误认知"]
+        },
+        "correct_solution": {
+            "step_by_step": ["模拟步骤1", "模拟步骤2"],
+            "key_concepts": ["模拟关键概念"],
+            "solution_tips": ["模拟解题技巧"],
+            "detailed_explanation": "模拟解题过程"
+        },
+        "knowledge_points": {"core_concepts": ["模拟核心概念"], "related_topics": [], "prerequisites": []},
+        "learning_guidance": {
+            "focus_areas": ["模拟学习重点"],
+            "practice_suggestions": ["模拟练习建议"],
+            "avoidance_strategies": [],
+            "skill_development": []
+        },
+        "similar_questions": {"question_types": [], "practice_recommendations": [], "difficulty_progression": "循序渐进"},
+        "personalized_encouragement": {
+            "positive_aspects": ["模拟积极方面"],
+            "confidence_building": "模拟信心建设话语",
+            "motivation_message": "模拟激励信息"
+        },
+        "difficulty_assessment": {
+            "question_difficulty": "中等",
+            "student_readiness": "基本具备",
+            "recommended_approach": "模拟学习方法"
+        },
+        "improvement_plan": {"immediate_actions": [], "short_term_goals": [], "long_term_development": []}
+    }
+
+
+def _stub_motivation(text: str) -> Dict[str, Any]:
+    return {
+        "motivation_message": "模拟激励话语",
+        "achievement_highlight": "模拟成就亮点",
+        "next_goal": "模拟下一个目标",
+        "encouragement_tips": ["模拟鼓励建议"],
+        "reward_suggestion": "模拟奖励建议",
+        "progress_celebration": "模拟进步庆祝"
+    }
+
+
+def _stub_learning_style(text: str) -> Dict[str, Any]:
+    return {
+        "learning_style": "视觉型",
+        "study_preferences": ["模拟学习偏好"],
+        "optimal_study_methods": ["模拟学习方法"],
+        "learning_environment": "安静的环境",
+        "time_preferences": "上午",
+        "difficulty_preferences": "循序渐进",
+        "feedback_preferences": "及时反馈"
+    }
+
+
+def _stub_suggestions(text: str) -> str:
+    return "1. 每天固定时间复习当天的错题，巩固薄弱知识点\n2. 每周完成一套综合练习，检验阶段性学习效果"
+
+
+# 提示词名 -> 根据提示词文本生成默认响应（JSON对象或字符串）
+DEFAULT_RESPONSES: Dict[str, Callable[[str], Any]] = {
+    "generate_questions": _stub_question_list,
+    "generate_questions_with_skill": _stub_question_list_with_skill,
+    "smart_grading": _stub_grading,
+    "real_time_qa": _stub_answer,
+    "personalized_questions": _stub_question_bank,
+    "subject_questions": _stub_question_bank,
+    "generate_exam": _stub_exam,
+    "generate_learning_report": _stub_learning_report,
+    "analyze_wrong_question": _stub_wrong_analysis,
+    "generate_learning_motivation": _stub_motivation,
+    "identify_learning_style": _stub_learning_style,
+    "learning_suggestions": _stub_suggestions,
+}
+
+
+class StubLLMClient(_ChatClient):
+    """本地模拟服务商：按配置的延迟分布、错误率返回预设内容，不发出网络请求
+
+    同一请求第N次调用的随机结果由 (种子, 服务商, 请求指纹, N) 决定，相同的压测脚本每次运行结果一致；
+    只记录最近 MAX_TRACKED_REQUESTS 个请求指纹的调用次数，更早的指纹再次出现时重新计数。
+    """
+
+    MAX_TRACKED_REQUESTS = 10000
+
+    def __init__(self, provider: str, seed: Optional[int] = None, responses_file: Optional[str] = None):
+        super().__init__()
+        self.provider = provider
+        self.seed = settings.llm_stub_seed if seed is None else seed
+        self._rules = self._load_rules(responses_file or settings.llm_stub_responses_file)
+        self._calls: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _load_rules(path: Optional[str]) -> List[Dict[str, Any]]:
+        """预设响应文件：[{"match": "正则表达式", "content": 字符串或JSON对象}]，按顺序匹配提示词"""
+        if not path:
+            return []
+        with open(path, encoding="utf-8") as f:
+            rules = json.load(f)
+        for rule in rules:
+            rule["pattern"] = re.compile(rule.get("match", ""), re.S)
+        return rules
+
+    def _rng(self, key: str) -> random.Random:
+        with self._lock:
+            count = self._calls.pop(key, 0)
+            self._calls[key] = count + 1
+            while len(self._calls) > self.MAX_TRACKED_REQUESTS:
+                self._calls.popitem(last=False)
+        digest = hashlib.sha256(f"{self.seed}:{self.provider}:{key}:{count}".encode()).digest()
+        return random.Random(int.from_bytes(digest[:8], "big"))
+
+    @staticmethod
+    def sample_latency(rng: random.Random) -> float:
+        """按配置的分布取样延迟（秒）：fixed / uniform / lognormal"""
+        median = settings.llm_stub_latency_ms / 1000
+        spread = settings.llm_stub_latency_spread
+        distribution = settings.llm_stub_latency_distribution
+        if distribution == "uniform":
+            latency = rng.uniform(median * (1 - spread), median * (1 + spread))
+        elif distribution == "lognormal":
+            latency = median * math.exp(rng.gauss(0, spread))
+        else:
+            latency = median
+        return max(0.0, latency)
+
+    def _content(self, messages: Messages) -> str:
+        text = "\n".join(message["content"] for message in messages)
+        for rule in self._rules:
+            if rule["pattern"].search(text):
+                content = rule["content"]
+                return content if isinstance(content, str) else json.dumps(content, ensure_ascii=False)
+        return self._default_content(text)
+
+    @staticmethod
+    def _default_content(text: str) -> str:
+        """没有匹配的预设内容时：按提示词模板的固定说明识别请求，返回该方法能解析的内容；其余返回一段文本"""
+        for name, build in DEFAULT_RESPONSES.items():
+            template = PROMPTS.get(name)
+            if template is not None and template.instructions in text:
+                content = build(text)
+                return content if isinstance(content, str) else json.dumps(content, ensure_ascii=False)
+        return "这是本地模拟服务商返回的回答。"
+
+    def plan(self, messages: Messages) -> Dict[str, Any]:
+        """决定本次调用的延迟和结果（不等待），HTTP 模拟服务和进程内客户端共用"""
+        rng = self._rng(request_key(messages))
+        latency = self.sample_latency(rng)
+        roll = rng.random()
+        if roll < settings.llm_stub_timeout_rate:
+            return {"latency": latency, "outcome": "timeout"}
+        if roll < settings.llm_stub_timeout_rate + settings.llm_stub_error_rate:
+            status_code = rng.choice((429, 500, 503))
+            return {"latency": latency, "outcome": "error", "status_code": status_code}
+        return {"latency": latency, "outcome": "ok", "content": self._content(messages)}
+
+    def create(self, *, model: str, messages: Messages, timeout: Optional[float] = None, **kwargs) -> SimpleNamespace:
+        plan = self.plan(messages)
+        if plan["outcome"] == "timeout":
+            time.sleep(timeout or settings.ai_service_timeout)
+            raise httpx.ReadTimeout(f"模拟服务商 {self.provider} 响应超时")
+        time.sleep(plan["latency"])
+        if plan["outcome"] == "error":
+            raise StubProviderError(f"模拟服务商 {self.provider} 返回错误 {plan['status_code']}", plan["status_code"])
+        content = plan["content"]
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+        return _completion(content, model, prompt_tokens, estimate_tokens(content))
+
+
+class LLMRecording:
+    """录制的服务商响应，JSONL 文件，每行一次请求"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[entry["key"]] = entry
+
+    def providers(self) -> List[str]:
+        return sorted({entry["provider"] for entry in self._entries.values()})
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._entries.get(key)
+
+    def add(self, entry: Dict[str, Any]):
+        with self._lock:
+            self._entries[entry["key"]] = entry
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+class RecordReplayClient(_ChatClient):
+    """录制/回放：record 模式调用真实客户端并保存响应；replay 模式按请求指纹返回录制的响应
+
+    回放未命中时，有真实客户端则透传调用，否则抛出错误（按服务商失败处理）。
+    """
+
+    def __init__(self, provider: str, inner: Optional[Any], mode: str, recording: LLMRecording):
+        super().__init__()
+        self.provider = provider
+        self.inner = inner
+        self.mode = mode
+        self.recording = recording
+
+    def create(self, *, model: str, messages: Messages, **kwargs) -> SimpleNamespace:
+        key = request_key(messages)
+        if self.mode == "replay":
+            entry = self.recording.get(key)
+            if entry is not None:
+                if settings.llm_replay_latency:
+                    time.sleep(entry.get("latency_ms", 0) / 1000)
+                return _completion(entry["content"], entry.get("model", model),
+                                   entry.get("prompt_tokens", 0), entry.get("completion_tokens", 0))
+            if self.inner is None:
+                raise StubProviderError(f"回放记录中没有该请求（{key[:12]}）", 404)
+            return self.inner.chat.completions.create(model=model, messages=messages, **kwargs)
+
+        started = time.monotonic()
+        response = self.inner.chat.completions.create(model=model, messages=messages, **kwargs)
+        content = response.choices[0].message.content
+        if content:
+            usage = getattr(response, "usage", None)
+            self.recording.add({
+                "key": key,
+                "provider": self.provider,
+                "model": model,
+                "messages": messages,
+                "content": content,
+                "prompt_tokens": getattr(usage, "prompt_tokens", None) or 0,
+                "completion_tokens": getattr(usage, "completion_tokens", None) or 0,
+                "latency_ms": int((time.monotonic() - started) * 1000),
+                "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S")
+            })
+        return response
+
+
+def wrap_clients(clients: Dict[str, Any]) -> Dict[str, Any]:
+    """按 llm_record_mode 为各服务商客户端加上录制/回放；回放模式下录制过的服务商即使未配置 Key 也可用"""
+    mode = settings.llm_record_mode
+    if mode not in ("record", "replay"):
+        return clients
+    recording = LLMRecording(settings.llm_record_file)
+    names = list(clients)
+    if mode == "replay":
+        names += [name for name in recording.providers() if name not in clients]
+    logger.info(f"AI调用{'录制' if mode == 'record' else '回放'}模式: {settings.llm_record_file}")
+    return {name: RecordReplayClient(name, clients.get(name), mode, recording) for name in names}
+
+
+def create_stub_app():
+    """兼容 OpenAI chat-completions 协议的模拟服务，可将各服务商 base_url 指向它，压测时走完整的 SDK 和网络路径：
+
+        uvicorn app.services.llm_stub:create_stub_app --factory --port 8900
+    """
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse
+
+    app = FastAPI(title="LLM Stub")
+    clients: Dict[str, StubLLMClient] = {}
+
+    @app.post("/v1/chat/completions")
+    @app.post("/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "stub")
+        if model not in clients:
+            clients[model] = StubLLMClient(model)
+        client = clients[model]
+        plan = client.plan(body.get("messages", []))
+        if plan["outcome"] == "timeout":
+            # 不返回响应，由客户端超时
+            await asyncio.sleep(settings.ai_service_timeout * 2)
+        await asyncio.sleep(plan["latency"])
+        if plan["outcome"] != "ok":
+            return JSONResponse(status_code=plan.get("status_code", 504), content={
+                "error": {"message": "模拟服务商错误", "type": "stub_error", "code": plan.get("status_code", 504)}
+            })
+        prompt_tokens = sum(estimate_tokens(message.get("content")) for message in body.get("messages", []))
+        return completion_to_dict(_completion(
+            plan["content"], model, prompt_tokens, estimate_tokens(plan["content"])
+        ))
+
+    return app
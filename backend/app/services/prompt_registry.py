@@ -0,0 +1,522 @@
+import hashlib
+import math
+import re
+import string
+import textwrap
+from typing import Any, Dict, List, Optional, Tuple
+
+_CJK_PATTERN = re.compile(r"[　-〿㐀-䶿一-鿿＀-￯]")
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """粗略估算token数：中日韩字符按1个计，其余字符按4个约1个计"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+class PromptTemplate:
+    """提示词模板：固定的说明在前、变量在后，便于模型服务复用相同前缀的缓存
+
+    system 与 instructions 不含变量；variables 为 str.format 风格的模板，创建时预先解析。
+    """
+
+    def __init__(self, name: str, system: str, instructions: str, variables: str):
+        self.name = name
+        self.system = textwrap.dedent(system).strip()
+        self.instructions = textwrap.dedent(instructions).strip()
+        self.variables = textwrap.dedent(variables).strip()
+        self._pieces: List[Tuple[str, Optional[str]]] = [
+            (literal, field) for literal, field, _, _ in string.Formatter().parse(self.variables)
+        ]
+        self.fields = {field for _, field in self._pieces if field}
+        self.version = hashlib.sha256(
+            "\x00".join((self.system, self.instructions, self.variables)).encode("utf-8")
+        ).hexdigest()[:12]
+        self.prefix_tokens = estimate_tokens(self.system) + estimate_tokens(self.instructions)
+
+    def render(self, **values: Any) -> str:
+        """生成用户消息：固定说明 + 变量部分"""
+        missing = self.fields - values.keys()
+        if missing:
+            raise KeyError(f"提示词 {self.name} 缺少变量: {', '.join(sorted(missing))}")
+        parts = []
+        for literal, field in self._pieces:
+            parts.append(literal)
+            if field:
+                value = values[field]
+                parts.append(value if isinstance(value, str) else str(value))
+        return f"{self.instructions}\n\n{''.join(parts)}"
+
+
+PROMPTS: Dict[str, PromptTemplate] = {}
+
+
+def register_prompt(name: str, system: str, instructions: str, variables: str) -> PromptTemplate:
+    template = PromptTemplate(name, system, instructions, variables)
+    PROMPTS[name] = template
+    return template
+
+
+def get_prompt(name: str) -> PromptTemplate:
+    return PROMPTS[name]
+
+
+def prompt_version(name: str) -> Optional[str]:
+    """模板版本（内容哈希），用于缓存键；未注册的名称返回None"""
+    template = PROMPTS.get(name)
+    return template.version if template else None
+
+
+_QUESTION_SYSTEM = """
+    你是一个专业的教育AI出题助手，具有丰富的教学经验。
+
+    出题原则：
+    1. 题目质量：确保题目准确、清晰、有教育价值
+    2. 难度适中：根据难度等级合理设置题目复杂度
+    3. 知识点覆盖：题目要覆盖相关知识点
+    4. 选项设计：选择题选项要合理，避免明显错误选项
+    5. 解析详细：提供清晰详细的解题思路和知识点说明
+
+    请严格按照要求生成题目，确保输出格式正确。
+"""
+
+register_prompt(
+    "generate_questions",
+    system=_QUESTION_SYSTEM,
+    instructions="""
+        请按本消息末尾给出的学科、难度等级、数量和题型生成题目。
+
+        要求：
+        1. 难度等级对应：1=基础，2=简单，3=中等，4=困难，5=专家
+        2. 每道题目包含：content(题目内容)、question_type(题目类型)、options(选项，仅选择题)、answer(答案)、explanation(解析)、difficulty(难度)、tags(知识点标签)
+        3. 返回JSON数组格式
+        4. 确保题目质量高，符合教育标准
+
+        示例格式：
+        [
+            {
+                "content": "题目内容",
+                "question_type": "single_choice",
+                "options": ["A", "B", "C", "D"],
+                "answer": "A",
+                "explanation": "详细解析",
+                "difficulty": 3,
+                "tags": ["知识点1", "知识点2"]
+            }
+        ]
+    """,
+    variables="""
+        学科：{subject}
+        难度等级：{difficulty}
+        题目数量：{count}
+        题目类型：{question_types}
+    """
+)
+
+register_prompt(
+    "generate_questions_with_skill",
+    system=_QUESTION_SYSTEM + """
+    补充原则：skill 字段必须体现本题考查的技能点。
+    """,
+    instructions="""
+        请按本消息末尾给出的学科、技能点、难度等级、数量和题型生成题目。
+
+        要求：
+        1. 难度等级对应：1=基础，2=简单，3=中等，4=困难，5=专家
+        2. 每道题目包含：content(题目内容)、question_type(题目类型)、options(选项，仅选择题)、answer(答案)、explanation(解析)、difficulty(难度)、tags(知识点标签)、skill(技能点)
+        3. 返回JSON数组格式
+        4. skill 字段为字符串或字符串数组，内容为本题考查的技能点；未指定技能点时按学科常见技能点填写
+        5. 确保题目质量高，符合教育标准
+
+        示例格式：
+        [
+            {
+                "content": "题目内容",
+                "question_type": "single_choice",
+                "options": ["A", "B", "C", "D"],
+                "answer": "A",
+                "explanation": "详细解析",
+                "difficulty": 3,
+                "tags": ["知识点1", "知识点2"],
+                "skill": "技能点名称"
+            }
+        ]
+    """,
+    variables="""
+        学科：{subject}
+        技能点：{skill}
+        难度等级：{difficulty}
+        题目数量：{count}
+        题目类型：{question_types}
+    """
+)
+
+register_prompt(
+    "smart_grading",
+    system="""
+        你是一个专业的教育AI评分专家，具有丰富的教学经验和心理学背景。
+
+        评分原则：
+        1. 客观公正：基于答案内容进行客观评分，不受主观偏见影响
+        2. 个性化：根据学生水平调整评分标准，初学者更宽容，高水平更严格
+        3. 鼓励为主：在指出不足的同时，要充分肯定学生的优点和努力
+        4. 具体详细：反馈要具体到具体的错误点和改进建议
+        5. 教育价值：评分不仅要给出分数，更要帮助学生学习和成长
+        6. 发展性：关注学生的进步潜力和发展方向
+
+        请严格按照要求进行评分，确保输出格式正确。
+    """,
+    instructions="""
+        请对本消息末尾给出的题目和学生答案进行专业的智能评分分析。
+
+        【评分要求】
+        请从以下维度进行详细评分：
+        1. 内容准确性（40%）：答案内容的正确程度
+        2. 逻辑完整性（25%）：解题思路和逻辑的完整性
+        3. 表达规范性（20%）：语言表达和格式规范性
+        4. 创新思维（15%）：解题方法的创新性和灵活性
+
+        请考虑学生水平进行个性化评分，对初学者要更宽容，对高水平学生要更严格。
+
+        【输出格式】
+        请返回JSON格式的详细评分结果，包含：
+        {
+            "score": 得分（整数，0到满分）,
+            "accuracy_score": 内容准确性得分（0-100）,
+            "logic_score": 逻辑完整性得分（0-100）,
+            "expression_score": 表达规范性得分（0-100）,
+            "creativity_score": 创新思维得分（0-100）,
+            "overall_accuracy": 总体准确度百分比（0-100）,
+            "detailed_feedback": {
+                "strengths": ["优点1", "优点2"],
+                "weaknesses": ["不足1", "不足2"],
+                "specific_errors": ["具体错误1", "具体错误2"],
+                "improvement_suggestions": ["改进建议1", "改进建议2"]
+            },
+            "learning_insights": {
+                "knowledge_gaps": ["知识盲点1", "知识盲点2"],
+                "skill_development": ["技能提升建议1", "技能提升建议2"],
+                "next_steps": ["下一步学习重点1", "下一步学习重点2"]
+            },
+            "encouragement": "个性化鼓励话语",
+            "difficulty_adjustment": "难度调整建议"
+        }
+
+        请确保评分客观公正，反馈具体详细，建议具有可操作性。
+    """,
+    variables="""
+        【题目信息】
+        题目内容：{question_content}
+        题目类型：{question_type}
+        满分：{max_score}分
+        学生水平：{student_level}
+
+        【答案对比】
+        标准答案：{standard_answer}
+        学生答案：{student_answer}
+    """
+)
+
+register_prompt(
+    "real_time_qa",
+    system="""
+        你是一个专业的教育AI助手，具有丰富的教学经验。
+
+        回答原则：
+        1. 准确：提供准确的信息和答案
+        2. 易懂：根据用户水平调整解释的复杂度
+        3. 全面：从多个角度提供信息和见解
+        4. 实用：提供可操作的学习建议
+        5. 鼓励：保持积极正面的学习态度
+
+        请严格按照要求回答问题，确保输出格式正确。
+    """,
+    instructions="""
+        请回答本消息末尾给出的问题，并考虑用户的学习水平。
+
+        请提供：
+        1. 直接答案
+        2. 详细解释
+        3. 相关知识点
+        4. 学习建议
+        5. 延伸阅读
+
+        请用JSON格式返回：
+        {
+            "answer": "直接答案",
+            "explanation": "详细解释",
+            "knowledge_points": ["知识点1", "知识点2"],
+            "learning_tips": ["学习建议1", "学习建议2"],
+            "related_topics": ["相关主题1", "相关主题2"],
+            "difficulty_level": "适合的学习水平"
+        }
+    """,
+    variables="""
+        用户学习水平：{user_level}
+        相关背景：{context}
+        问题：{question}
+    """
+)
+
+register_prompt(
+    "personalized_questions",
+    system="",
+    instructions="""
+        请按本消息末尾给出的科目、数量和用户学习情况生成高质量的题目。
+
+        题目要求：
+        - 包含选择题、填空题、简答题等多种类型
+        - 难度分布合理，符合用户水平
+        - 内容贴近实际应用
+        - 提供详细解析
+
+        请以JSON格式返回，格式如下：
+        {
+            "questions": [
+                {
+                    "title": "题目标题",
+                    "content": "题目内容",
+                    "type": "choice|fill|essay",
+                    "options": ["A", "B", "C", "D"],
+                    "answer": "正确答案",
+                    "explanation": "详细解析",
+                    "difficulty": 1-5,
+                    "tags": ["知识点标签"]
+                }
+            ]
+        }
+    """,
+    variables="""
+        科目：{subject}
+        题目数量：{count}
+        用户学习风格：{learning_style}
+        偏好难度：{preferred_difficulty}
+        学习频率：{study_frequency}
+    """
+)
+
+register_prompt(
+    "subject_questions",
+    system="",
+    instructions="""
+        请按本消息末尾给出的科目、难度和数量生成题目，要求：
+
+        1. 题目类型多样化（选择题、填空题、简答题）
+        2. 内容覆盖该科目的核心知识点
+        3. 难度适中，适合指定难度水平的学生
+        4. 提供详细的解析和答案
+
+        请以JSON格式返回题目数据。
+    """,
+    variables="""
+        科目：{subject}
+        难度：{difficulty}
+        题目数量：{count}
+    """
+)
+
+register_prompt(
+    "generate_exam",
+    system="你是一个专业的教育AI组卷助手，请严格按照要求生成试卷。",
+    instructions="""
+        请按本消息末尾给出的学科、难度、试卷类型和题目分布生成一套试卷；给出技能点或知识点标签时，题目需围绕其出题。
+
+        每道题目需包含：content, question_type, options, answer, explanation, difficulty, score, skill, tags
+
+        请返回JSON格式的试卷，包含：
+        - exam_info: 试卷信息（标题、说明、总分、时长）
+        - questions: 题目数组，每题包含content, question_type, options, answer, explanation, difficulty, score, skill, tags
+        - answer_sheet: 答案页
+        - analysis: 试卷分析
+    """,
+    variables="""
+        学科：{subject}
+        难度：{difficulty}星
+        试卷类型：{exam_type}
+        技能点要求：{skill}
+        知识点标签：{tags}
+        题目分布要求：
+        {question_distribution}
+    """
+)
+
+register_prompt(
+    "generate_learning_report",
+    system="你是一个专业的教育数据分析师，请基于学习数据生成详细的分析报告。",
+    instructions="""
+        基于本消息末尾给出的学习数据，生成详细的学习分析报告。
+
+        请返回JSON格式的分析报告，包含：
+        - overall_performance: 整体表现（总分、平均分、学习时长等）
+        - subject_analysis: 各学科详细分析
+        - learning_patterns: 学习模式分析
+        - strengths_weaknesses: 优势劣势分析
+        - recommendations: 个性化建议
+        - improvement_plan: 改进计划
+        - progress_trend: 进步趋势
+    """,
+    variables="""
+        学习数据：
+        {learning_data}
+    """
+)
+
+register_prompt(
+    "analyze_wrong_question",
+    system="""
+        你是一个专业的教育AI导师，具有丰富的教学经验和心理学背景。
+
+        分析原则：
+        1. 诊断精准：准确识别错误类型和根本原因
+        2. 指导具体：提供可操作的解题步骤和学习建议
+        3. 鼓励为主：在指出问题的同时，充分肯定学生的努力和进步
+        4. 个性化：根据学生的具体错误，给出针对性的建议
+        5. 系统性：从知识点、解题技巧、学习策略等多角度进行分析
+        6. 发展性：不仅解决当前问题，更要帮助学生建立长期学习能力
+
+        请严格按照要求进行分析，确保输出格式正确，内容具有教育价值。
+    """,
+    instructions="""
+        请对本消息末尾给出的错题进行深入分析和个性化讲解。
+
+        【分析要求】
+        请从以下维度进行详细分析：
+
+        1. 错误诊断：
+           - 错误类型识别（概念错误、计算错误、审题错误、表达错误等）
+           - 错误原因分析（知识盲点、思维误区、粗心大意等）
+           - 错误严重程度评估
+
+        2. 解题指导：
+           - 正确的解题思路和步骤
+           - 关键知识点梳理
+           - 解题技巧和方法
+
+        3. 学习建议：
+           - 针对性的学习重点
+           - 类似题目的练习建议
+           - 避免同类错误的方法
+
+        4. 个性化鼓励：
+           - 基于学生答案特点的鼓励
+           - 学习信心建设
+
+        【输出格式】
+        请返回JSON格式的详细分析结果，包含：
+        {
+            "error_analysis": {
+                "error_type": "错误类型",
+                "error_severity": "错误严重程度（轻微/中等/严重）",
+                "root_cause": "根本原因分析",
+                "common_mistakes": ["常见错误1", "常见错误2"],
+                "misconceptions": ["错误认知1", "错误认知2"]
+            },
+            "correct_solution": {
+                "step_by_step": ["步骤1", "步骤2", "步骤3"],
+                "key_concepts": ["关键概念1", "关键概念2"],
+                "solution_tips": ["解题技巧1", "解题技巧2"],
+                "detailed_explanation": "详细解题过程"
+            },
+            "knowledge_points": {
+                "core_concepts": ["核心概念1", "核心概念2"],
+                "related_topics": ["相关知识点1", "相关知识点2"],
+                "prerequisites": ["前置知识1", "前置知识2"]
+            },
+            "learning_guidance": {
+                "focus_areas": ["重点学习领域1", "重点学习领域2"],
+                "practice_suggestions": ["练习建议1", "练习建议2"],
+                "avoidance_strategies": ["避免错误策略1", "避免错误策略2"],
+                "skill_development": ["技能提升建议1", "技能提升建议2"]
+            },
+            "similar_questions": {
+                "question_types": ["类似题型1", "类似题型2"],
+                "practice_recommendations": ["练习推荐1", "练习推荐2"],
+                "difficulty_progression": "难度递进建议"
+            },
+            "personalized_encouragement": {
+                "positive_aspects": ["积极方面1", "积极方面2"],
+                "confidence_building": "信心建设话语",
+                "motivation_message": "个性化激励信息"
+            },
+            "difficulty_assessment": {
+                "question_difficulty": "题目难度等级",
+                "student_readiness": "学生准备程度",
+                "recommended_approach": "建议学习方法"
+            },
+            "improvement_plan": {
+                "immediate_actions": ["立即行动1", "立即行动2"],
+                "short_term_goals": ["短期目标1", "短期目标2"],
+                "long_term_development": ["长期发展建议1", "长期发展建议2"]
+            }
+        }
+
+        请确保分析深入透彻，建议具体可行，鼓励积极正面。
+    """,
+    variables="""
+        【题目信息】
+        题目：{question_content}
+        学科：{subject}
+
+        【答案对比】
+        正确答案：{correct_answer}
+        学生答案：{user_answer}
+    """
+)
+
+register_prompt(
+    "generate_learning_motivation",
+    system="你是一个专业的教育激励专家，请根据学习数据生成积极正面的激励信息。",
+    instructions="""
+        基于本消息末尾给出的学习数据，生成个性化的学习激励信息。
+
+        请返回JSON格式的激励信息，包含：
+        - motivation_message: 激励话语
+        - achievement_highlight: 成就亮点
+        - next_goal: 下一个目标
+        - encouragement_tips: 鼓励建议
+        - reward_suggestion: 奖励建议
+        - progress_celebration: 进步庆祝
+    """,
+    variables="""
+        学习数据：
+        {learning_data}
+    """
+)
+
+register_prompt(
+    "identify_learning_style",
+    system="你是一个专业的教育心理学家，请基于学习数据识别用户的学习风格。",
+    instructions="""
+        基于本消息末尾给出的学习数据，分析用户的学习风格和偏好。
+
+        请返回JSON格式的学习风格分析，包含：
+        - learning_style: 学习风格类型（视觉型、听觉型、动觉型等）
+        - study_preferences: 学习偏好
+        - optimal_study_methods: 最佳学习方法
+        - learning_environment: 理想学习环境
+        - time_preferences: 时间偏好
+        - difficulty_preferences: 难度偏好
+        - feedback_preferences: 反馈偏好
+    """,
+    variables="""
+        学习数据：
+        {learning_data}
+    """
+)
+
+register_prompt(
+    "learning_suggestions",
+    system="",
+    instructions="""
+        基于本消息末尾给出的用户信息生成2-3条个性化的学习建议。
+
+        请提供具体、可操作的学习建议，每条建议单独一行，不超过50字。
+    """,
+    variables="""
+        用户学习风格：{learning_style}
+        今日平均分数：{today_avg_score}
+        学习目标：{learning_goals}
+    """
+)
@@ -1,15 +1,53 @@
 from datetime import datetime
 from typing import List, Optional, Dict, Any
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func, desc
+from sqlalchemy import and_, or_, func, desc, case, event
 import random
+import threading
 
 from app.models.question import (
     Question, QuestionCategory, UserAnswer, PracticeSession, 
-    PracticeSessionQuestion, KnowledgePoint, QuestionDifficulty, QuestionSource
+    PracticeSessionQuestion, KnowledgePoint, QuestionDifficulty, QuestionSource,
+    QuestionType
 )
 from app.models.user import User
 from app.schemas.question import QuestionCreate, QuestionUpdate
+from app.services.activity_rollup_service import ActivityRollupService
+from app.services.leaderboard_service import LeaderboardService, category_scope
+from app.utils.cache import TTLCache
+from app.utils.etag import VersionKey, data_versions, on_versions_changed, user_scope
+from config import settings
+
+# 用户练习统计快照缓存：user_id -> 统计计数器（含构建时的数据版本）
+_user_stats_cache = TTLCache(ttl=settings.stats_cache_ttl)
+_user_stats_lock = threading.Lock()
+_STATS_UPDATES_KEY = "user_stats_updates"
+
+
+@on_versions_changed
+def _sync_stats_snapshots(session: Session, versions: Dict[VersionKey, Optional[int]]):
+    """事务提交后同步统计快照：快照恰好停在本次提交之前的版本时应用登记的增量，否则丢弃等待重建"""
+    updates = session.info.pop(_STATS_UPDATES_KEY, {})
+    for key, version in versions.items():
+        if key[0] != "user":
+            continue
+        user_id = key[1]
+        with _user_stats_lock:
+            snapshot = _user_stats_cache.get(user_id)
+            if snapshot is None:
+                continue
+            pending = updates.get(user_id)
+            if pending and version is not None and snapshot["version"] == (version - 1,):
+                for apply in pending:
+                    apply(snapshot)
+                snapshot["version"] = (version,)
+            else:
+                _user_stats_cache.delete(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_stats_updates(session: Session):
+    session.info.pop(_STATS_UPDATES_KEY, None)
 
 
 class QuestionBankService:
@@ -218,8 +256,9 @@ class QuestionBankService:
             session_question.answered_at = datetime.utcnow()
         
         # 记录用户答题历史
+        user_id = session_question.session.user_id
         user_answer_record = UserAnswer(
-            user_id=session_question.session.user_id,
+            user_id=user_id,
             question_id=question_id,
             answer=user_answer,
             is_correct=is_correct,
@@ -241,6 +280,15 @@ class QuestionBankService:
             ).count()
             question.success_rate = correct_answers / total_answers if total_answers > 0 else 0
         
+        ActivityRollupService(db).record_activity(
+            user_id=user_id,
+            questions=1,
+            correct=1 if is_correct else 0
+        )
+        if is_correct and question.category_id:
+            LeaderboardService.add_points(db, user_id, 1, category_scope(question.category_id))
+        
+        QuestionBankService._queue_answer_stats(db, user_id, question, is_correct, time_spent)
         db.commit()
         
         return {
@@ -276,6 +324,8 @@ class QuestionBankService:
         if not session:
             raise ValueError("练习会话不存在")
         
+        was_completed = session.is_completed
+        
         # 计算正确数量和准确率
         session_questions = db.query(PracticeSessionQuestion).filter(
             PracticeSessionQuestion.session_id == session_id,
@@ -291,6 +341,16 @@ class QuestionBankService:
         session.completed_at = datetime.utcnow()
         session.is_completed = True
         
+        if not was_completed:
+            ActivityRollupService(db).record_activity(
+                user_id=session.user_id,
+                occurred_at=session.completed_at,
+                study_minutes=total_time // 60,
+                sessions=1,
+                score=session.accuracy_rate * 100
+            )
+            QuestionBankService._queue_session_stats(db, session.user_id)
+        
         db.commit()
         db.refresh(session)
         return session
@@ -300,51 +360,114 @@ class QuestionBankService:
         db: Session,
         user_id: int
     ) -> Dict[str, Any]:
-        """获取用户练习统计"""
-        # 总答题数
-        total_answers = db.query(UserAnswer).filter(
-            UserAnswer.user_id == user_id
-        ).count()
-        
-        # 正确答题数
-        correct_answers = db.query(UserAnswer).filter(
-            UserAnswer.user_id == user_id,
-            UserAnswer.is_correct == True
-        ).count()
-        
-        # 总练习时间
-        total_time = db.query(func.sum(UserAnswer.time_spent)).filter(
-            UserAnswer.user_id == user_id
-        ).scalar() or 0
+        """获取用户练习统计（优先读取缓存快照，数据版本变化后重建）"""
+        version = data_versions(user_scope(user_id))
+        snapshot = _user_stats_cache.get(user_id)
+        if snapshot is None or version is None or snapshot["version"] != version:
+            snapshot = QuestionBankService._build_stats_snapshot(db, user_id)
+            snapshot["version"] = version
+            # 构建期间有新的提交时不缓存，避免之后重复应用该提交的增量
+            if version is not None and data_versions(user_scope(user_id)) == version:
+                _user_stats_cache.set(user_id, snapshot)
         
-        # 练习会话数
-        session_count = db.query(PracticeSession).filter(
+        with _user_stats_lock:
+            return QuestionBankService._render_stats(snapshot)
+    
+    @staticmethod
+    def _build_stats_snapshot(db: Session, user_id: int) -> Dict[str, Any]:
+        """通过一次分组聚合查询构建用户统计快照"""
+        session_count = db.query(func.count(PracticeSession.id)).filter(
             PracticeSession.user_id == user_id,
             PracticeSession.is_completed == True
-        ).count()
+        ).scalar_subquery()
         
-        # 按分类统计
-        category_stats = db.query(
+        rows = db.query(
+            Question.category_id,
             QuestionCategory.name,
             func.count(UserAnswer.id).label('total'),
-            func.sum(func.case([(UserAnswer.is_correct == True, 1)], else_=0)).label('correct')
-        ).join(Question).join(UserAnswer).filter(
+            func.sum(case((UserAnswer.is_correct == True, 1), else_=0)).label('correct'),
+            func.coalesce(func.sum(UserAnswer.time_spent), 0).label('time_spent'),
+            session_count.label('session_count')
+        ).select_from(UserAnswer).join(
+            Question, Question.id == UserAnswer.question_id
+        ).outerjoin(
+            QuestionCategory, QuestionCategory.id == Question.category_id
+        ).filter(
             UserAnswer.user_id == user_id
-        ).group_by(QuestionCategory.id, QuestionCategory.name).all()
+        ).group_by(Question.category_id, QuestionCategory.name).all()
+        
+        snapshot = {
+            "total_answers": 0,
+            "correct_answers": 0,
+            "total_time_seconds": 0,
+            "session_count": rows[0].session_count if rows else 0,
+            "categories": {}
+        }
+        for row in rows:
+            snapshot["total_answers"] += row.total
+            snapshot["correct_answers"] += row.correct or 0
+            snapshot["total_time_seconds"] += row.time_spent or 0
+            if row.category_id is not None and row.name is not None:
+                snapshot["categories"][row.category_id] = {
+                    "name": row.name,
+                    "total": row.total,
+                    "correct": row.correct or 0
+                }
+        
+        # 没有答题记录时分组结果为空，单独补查会话数
+        if not rows:
+            snapshot["session_count"] = db.query(func.count(PracticeSession.id)).filter(
+                PracticeSession.user_id == user_id,
+                PracticeSession.is_completed == True
+            ).scalar() or 0
+        
+        return snapshot
+    
+    @staticmethod
+    def _queue_answer_stats(db: Session, user_id: int, question: Question, is_correct: bool, time_spent: int):
+        """登记答题对统计快照的增量，事务提交后应用"""
+        category = question.category if question.category_id is not None else None
+        category_info = (category.id, category.name) if category is not None else None
+        
+        def apply(snapshot: Dict[str, Any]):
+            snapshot["total_answers"] += 1
+            snapshot["correct_answers"] += 1 if is_correct else 0
+            snapshot["total_time_seconds"] += time_spent or 0
+            if category_info is not None:
+                stat = snapshot["categories"].setdefault(
+                    category_info[0], {"name": category_info[1], "total": 0, "correct": 0}
+                )
+                stat["total"] += 1
+                stat["correct"] += 1 if is_correct else 0
+        
+        db.info.setdefault(_STATS_UPDATES_KEY, {}).setdefault(user_id, []).append(apply)
+    
+    @staticmethod
+    def _queue_session_stats(db: Session, user_id: int):
+        """登记练习会话完成对统计快照的增量，事务提交后应用"""
+        def apply(snapshot: Dict[str, Any]):
+            snapshot["session_count"] += 1
         
+        db.info.setdefault(_STATS_UPDATES_KEY, {}).setdefault(user_id, []).append(apply)
+    
+    @staticmethod
+    def _render_stats(snapshot: Dict[str, Any]) -> Dict[str, Any]:
+        """将统计快照转换为接口返回格式"""
+        total_answers = snapshot["total_answers"]
+        correct_answers = snapshot["correct_answers"]
         return {
             "total_answers": total_answers,
             "correct_answers": correct_answers,
             "accuracy_rate": correct_answers / total_answers if total_answers > 0 else 0,
-            "total_time_minutes": total_time // 60,
-            "session_count": session_count,
+            "total_time_minutes": snapshot["total_time_seconds"] // 60,
+            "session_count": snapshot["session_count"],
             "category_stats": [
                 {
-                    "category": stat.name,
-                    "total": stat.total,
-                    "correct": stat.correct,
-                    "accuracy": stat.correct / stat.total if stat.total > 0 else 0
+                    "category": stat["name"],
+                    "total": stat["total"],
+                    "correct": stat["correct"],
+                    "accuracy": stat["correct"] / stat["total"] if stat["total"] > 0 else 0
                 }
-                for stat in category_stats
+                for stat in snapshot["categories"].values()
             ]
-        } 
\ No newline at end of file
+        }
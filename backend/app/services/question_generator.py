@@ -6,11 +6,16 @@ from app.models.question import Question
 from app.models.user import User
 from app.models.learning import UserProfile, LearningProgress
 from app.services.ai_service import AIService
+from app.services.question_pool_service import QuestionPoolService
+from app.services.question_service import upsert_questions
 from datetime import datetime, timedelta
 import json
 
 logger = logging.getLogger(__name__)
 
+# 用户画像中的偏好难度 -> 题目难度等级（1-5）
+DIFFICULTY_LEVELS = {"easy": 2, "medium": 3, "hard": 4}
+
 
 class QuestionGenerator:
     def __init__(self, db: Session):
@@ -18,42 +23,45 @@ class QuestionGenerator:
         self.ai_service = AIService()
     
     async def generate_questions_for_user(self, user_id: int, subject: str, count: int = 10) -> List[Dict]:
-        """为用户生成个性化题目"""
+        """为用户生成个性化题目（优先从预生成题目池取题，不足时现场调用AI）"""
         try:
             # 获取用户画像和学习历史
             user_profile = self.db.query(UserProfile).filter(UserProfile.user_id == user_id).first()
             learning_history = self.db.query(LearningProgress).filter(
                 LearningProgress.user_id == user_id
-            ).order_by(LearningProgress.created_at.desc()).limit(50).all()
+            ).order_by(LearningProgress.recorded_at.desc()).limit(50).all()
             
             # 分析用户学习偏好和薄弱点
             user_analysis = self._analyze_user_learning_pattern(user_profile, learning_history)
             
-            # 生成题目
-            questions = await self._generate_questions_by_ai(subject, user_analysis, count)
-            
-            # 保存到数据库
-            saved_questions = []
-            for q_data in questions:
-                question = Question(
-                    title=q_data["title"],
-                    content=q_data["content"],
-                    answer=q_data["answer"],
-                    explanation=q_data["explanation"],
-                    subject=subject,
-                    difficulty=q_data["difficulty"],
-                    question_type=q_data["type"],
-                    options=json.dumps(q_data.get("options", []), ensure_ascii=False),
-                    tags=json.dumps(q_data.get("tags", []), ensure_ascii=False),
-                    created_by=user_id
-                )
-                self.db.add(question)
-                saved_questions.append(question)
+            # 从题目池取题，不足部分再按用户画像生成
+            difficulty = DIFFICULTY_LEVELS.get(user_analysis["preferred_difficulty"], 3)
+            questions = QuestionPoolService(self.db, self.ai_service).take(subject, difficulty, count)
+            self.db.commit()
+            if len(questions) < count:
+                questions += await self._generate_questions_by_ai(subject, user_analysis, count - len(questions))
             
+            # 保存到数据库（按题干去重，已有的题目直接复用）
+            rows = [{
+                "content": q_data.get("content"),
+                "question_type": q_data.get("question_type") or q_data.get("type"),
+                "options": q_data.get("options"),
+                "answer": q_data.get("answer"),
+                "explanation": q_data.get("explanation"),
+                "difficulty": q_data.get("difficulty", difficulty),
+                "tags": q_data.get("tags"),
+                "skill": q_data.get("skill"),
+                "source": "ai_generated",
+                "created_by": user_id
+            } for q_data in questions if q_data.get("content")]
+            question_ids = upsert_questions(self.db, rows)
             self.db.commit()
-            logger.info(f"为用户 {user_id} 生成了 {len(saved_questions)} 道 {subject} 题目")
+            logger.info(f"为用户 {user_id} 生成了 {len(rows)} 道 {subject} 题目")
             
-            return [{"id": q.id, "title": q.title, "difficulty": q.difficulty} for q in saved_questions]
+            return [
+                {"id": question_id, "content": row["content"], "difficulty": row["difficulty"]}
+                for row, question_id in zip(rows, question_ids) if question_id is not None
+            ]
             
         except Exception as e:
             logger.error(f"生成题目失败: {str(e)}")
@@ -77,7 +85,10 @@ class QuestionGenerator:
         # 分析学习历史
         if learning_history:
             # 分析学习频率
-            recent_sessions = [h for h in learning_history if h.created_at > datetime.now() - timedelta(days=7)]
+            recent_sessions = [
+                h for h in learning_history
+                if h.recorded_at and h.recorded_at.replace(tzinfo=None) > datetime.now() - timedelta(days=7)
+            ]
             if len(recent_sessions) >= 5:
                 analysis["study_frequency"] = "high"
             elif len(recent_sessions) >= 2:
@@ -90,11 +101,15 @@ class QuestionGenerator:
     async def _generate_questions_by_ai(self, subject: str, user_analysis: Dict, count: int) -> List[Dict]:
         """使用AI生成题目"""
         try:
-            # 构建AI提示词
-            prompt = self._build_question_generation_prompt(subject, user_analysis, count)
-            
-            # 调用AI服务
-            response = await self.ai_service._call_ai_api(prompt)
+            # 调用AI服务（按提示词模板）
+            response = await self.ai_service._call_prompt(
+                "personalized_questions",
+                subject=subject,
+                count=count,
+                learning_style=user_analysis['learning_style'],
+                preferred_difficulty=user_analysis['preferred_difficulty'],
+                study_frequency=user_analysis['study_frequency']
+            )
             
             # 解析AI响应
             if response:
@@ -109,39 +124,6 @@ class QuestionGenerator:
             # 返回模拟数据
             return self._generate_mock_questions(subject, count)
     
-    def _build_question_generation_prompt(self, subject: str, user_analysis: Dict, count: int) -> str:
-        """构建题目生成提示词"""
-        prompt = f"""
-请为{subject}科目生成{count}道高质量的题目，要求：
-
-1. 用户学习风格：{user_analysis['learning_style']}
-2. 偏好难度：{user_analysis['preferred_difficulty']}
-3. 学习频率：{user_analysis['study_frequency']}
-
-题目要求：
-- 包含选择题、填空题、简答题等多种类型
-- 难度分布合理，符合用户水平
-- 内容贴近实际应用
-- 提供详细解析
-
-请以JSON格式返回，格式如下：
-{{
-    "questions": [
-        {{
-            "title": "题目标题",
-            "content": "题目内容",
-            "type": "choice|fill|essay",
-            "options": ["A", "B", "C", "D"],
-            "answer": "正确答案",
-            "explanation": "详细解析",
-            "difficulty": 1-5,
-            "tags": ["知识点标签"]
-        }}
-    ]
-}}
-"""
-        return prompt
-    
     def _parse_ai_response(self, response: str, count: int) -> List[Dict]:
         """解析AI响应"""
         try:
@@ -213,28 +195,30 @@ class QuestionGenerator:
                         difficulty=difficulty,
                         count=count_per_skill
                     )
-                    for q_data in questions:
-                        question = Question(
-                            content=q_data.get("content"),
-                            question_type=q_data.get("question_type"),
-                            options=q_data.get("options"),
-                            answer=q_data.get("answer"),
-                            explanation=q_data.get("explanation"),
-                            difficulty=q_data.get("difficulty", difficulty),
-                            tags=q_data.get("tags"),
-                            skill=q_data.get("skill"),
-                            source="ai_generated",
-                            is_active=True
-                        )
-                        self.db.add(question)
-                        total_generated += 1
+                    rows = [{
+                        "content": q_data.get("content"),
+                        "question_type": q_data.get("question_type"),
+                        "options": q_data.get("options"),
+                        "answer": q_data.get("answer"),
+                        "explanation": q_data.get("explanation"),
+                        "difficulty": q_data.get("difficulty", difficulty),
+                        "tags": q_data.get("tags"),
+                        "skill": q_data.get("skill"),
+                        "source": "ai_generated"
+                    } for q_data in questions if q_data.get("content")]
+                    upsert_questions(self.db, rows)
                     self.db.commit()
+                    total_generated += len(rows)
                 except Exception as e:
                     logger.error(f"生成题目失败: tag={tag}, skill={skill}, 错误: {e}")
                     self.db.rollback()
         logger.info(f"批量生成题目完成，共生成 {total_generated} 道题目")
         return total_generated
 
+    async def refill_question_pool(self) -> int:
+        """低峰时段补充预生成题目池"""
+        return await QuestionPoolService(self.db, self.ai_service).refill()
+
     async def generate_daily_questions(self) -> dict:
         """为所有标签和技能点批量生成每日题目"""
         # 示例：假设标签和技能点列表可从数据库或配置获取
@@ -246,20 +230,10 @@ class QuestionGenerator:
     async def generate_subject_questions(self, subject: str, difficulty: str = "medium", count: int = 20) -> List[Dict]:
         """为特定学科生成题目"""
         try:
-            # 构建学科特定的提示词
-            prompt = f"""
-请为{subject}科目生成{count}道{difficulty}难度的题目，要求：
-
-1. 题目类型多样化（选择题、填空题、简答题）
-2. 内容覆盖{subject}的核心知识点
-3. 难度适中，适合{difficulty}水平的学生
-4. 提供详细的解析和答案
-
-请以JSON格式返回题目数据。
-"""
-            
-            # 调用AI生成
-            response = await self.ai_service._call_ai_api(prompt)
+            # 调用AI生成（按提示词模板）
+            response = await self.ai_service._call_prompt(
+                "subject_questions", subject=subject, difficulty=difficulty, count=count
+            )
             if response:
                 questions = self._parse_ai_response(response, count)
             else:
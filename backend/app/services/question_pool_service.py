@@ -0,0 +1,239 @@
+import logging
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from config import settings
+from app.models.question_pool import QuestionPoolItem, QuestionPoolTarget
+from app.services.ai_service import AIService
+from app.utils.upsert import insert_ignoring_conflicts
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUESTION_TYPES = ["single_choice", "multiple_choice", "fill_blank", "short_answer"]
+
+
+def split_count(count: int, question_types: List[str]) -> Dict[str, int]:
+    """题数按题型平均分配，余数依次分给靠前的题型"""
+    question_types = list(dict.fromkeys(question_types))
+    share, extra = divmod(max(count, 0), len(question_types))
+    return {
+        question_type: share + (1 if i < extra else 0)
+        for i, question_type in enumerate(question_types)
+    }
+
+
+class QuestionPoolService:
+    """预生成题目池：出题请求直接从池中取题，库存在低峰时段由定时任务批量补充"""
+
+    def __init__(self, db: Session, ai_service: Optional[AIService] = None):
+        self.db = db
+        self.ai_service = ai_service or AIService()
+
+    def take(
+        self,
+        subject: str,
+        difficulty: int,
+        count: int,
+        question_types: Optional[List[str]] = None,
+        skill: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """按题型比例从池中取出最多count道题（取出即标记已使用），并登记该组合的需求；不提交事务
+
+        某题型库存不足时不用其他题型补位，缺少的部分由 fill_missing 按题型现场生成。
+        """
+        question_types = question_types or DEFAULT_QUESTION_TYPES
+        skill = skill or ""
+        quotas = split_count(count, question_types)
+
+        taken: List[QuestionPoolItem] = []
+        for question_type, quota in quotas.items():
+            taken.extend(self._claim(subject, difficulty, question_type, skill, quota))
+
+        taken_counts = Counter(item.question_type for item in taken)
+        self._record_demand(subject, difficulty, list(quotas), skill, missed={
+            question_type for question_type, quota in quotas.items() if taken_counts[question_type] < quota
+        })
+        return [item.payload for item in taken]
+
+    def _claim(self, subject: str, difficulty: int, question_type: str, skill: str, count: int) -> List[QuestionPoolItem]:
+        """认领某一题型最多count道未使用的题目"""
+        pool_filter = (
+            QuestionPoolItem.subject == subject,
+            QuestionPoolItem.difficulty == difficulty,
+            QuestionPoolItem.question_type == question_type,
+            QuestionPoolItem.skill == skill,
+            QuestionPoolItem.consumed_at == None
+        )
+        taken: List[QuestionPoolItem] = []
+        # 并发请求可能选中同一批题目，条件更新只认领仍未被使用的题目，不足时再选一次
+        for _ in range(2):
+            missing = count - len(taken)
+            if missing <= 0:
+                break
+            candidate_ids = [
+                item_id for (item_id,) in self.db.query(QuestionPoolItem.id).filter(
+                    *pool_filter
+                ).order_by(QuestionPoolItem.id).limit(missing).all()
+            ]
+            if not candidate_ids:
+                break
+            token = uuid.uuid4().hex
+            self.db.query(QuestionPoolItem).filter(
+                QuestionPoolItem.id.in_(candidate_ids),
+                QuestionPoolItem.consumed_at == None
+            ).update({
+                QuestionPoolItem.consumed_at: datetime.now(),
+                QuestionPoolItem.claim_token: token
+            }, synchronize_session=False)
+            taken.extend(
+                self.db.query(QuestionPoolItem).filter(QuestionPoolItem.claim_token == token).all()
+            )
+        return taken
+
+    async def fill_missing(
+        self,
+        questions: List[Dict[str, Any]],
+        subject: str,
+        difficulty: int,
+        count: int,
+        question_types: Optional[List[str]] = None,
+        skill: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """现场调用AI补齐从池中取出的题目，只生成数量不足的题型"""
+        missing = count - len(questions)
+        if missing <= 0:
+            return questions
+        quotas = split_count(count, question_types or DEFAULT_QUESTION_TYPES)
+        taken = Counter(question.get("question_type") for question in questions)
+        short_types = [question_type for question_type, quota in quotas.items() if taken[question_type] < quota]
+        logger.info(f"题目池不足: {subject}/{difficulty}/{skill or '-'}，现场生成 {missing} 道 {','.join(short_types)}")
+        if skill:
+            generated = await self.ai_service.generate_questions_with_skill(
+                subject=subject, skill=skill, difficulty=difficulty,
+                count=missing, question_types=short_types
+            )
+        else:
+            generated = await self.ai_service.generate_questions(
+                subject=subject, difficulty=difficulty,
+                count=missing, question_types=short_types
+            )
+        return questions + generated
+
+    async def serve(
+        self,
+        subject: str,
+        difficulty: int,
+        count: int,
+        question_types: Optional[List[str]] = None,
+        skill: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """优先从池中取题，不足部分现场调用AI生成；调用方负责提交"""
+        questions = self.take(subject, difficulty, count, question_types, skill) if settings.question_pool_enabled else []
+        return await self.fill_missing(questions, subject, difficulty, count, question_types, skill)
+
+    def _record_demand(self, subject: str, difficulty: int, question_types: List[str], skill: str, missed: Set[str]):
+        """登记组合的最近请求时间，库存不足的题型累加缺货次数；新组合按默认目标库存加入补充计划
+
+        并发请求同时创建相同组合的目标时，唯一约束冲突的行直接跳过，不影响调用方的事务。
+        """
+        now = datetime.now()
+        self.db.execute(insert_ignoring_conflicts(self.db, QuestionPoolTarget), [
+            {
+                "subject": subject,
+                "difficulty": difficulty,
+                "question_type": question_type,
+                "skill": skill,
+                "target_count": settings.question_pool_default_target,
+                "miss_count": 0
+            }
+            for question_type in question_types
+        ])
+        key_filter = (
+            QuestionPoolTarget.subject == subject,
+            QuestionPoolTarget.difficulty == difficulty,
+            QuestionPoolTarget.skill == skill
+        )
+        self.db.query(QuestionPoolTarget).filter(
+            *key_filter, QuestionPoolTarget.question_type.in_(question_types)
+        ).update({QuestionPoolTarget.last_requested_at: now}, synchronize_session=False)
+        if missed:
+            self.db.query(QuestionPoolTarget).filter(
+                *key_filter, QuestionPoolTarget.question_type.in_(missed)
+            ).update({
+                QuestionPoolTarget.miss_count: func.coalesce(QuestionPoolTarget.miss_count, 0) + 1
+            }, synchronize_session=False)
+
+    def inventory(self) -> Dict[tuple, int]:
+        """各组合的可用库存 {(学科, 难度, 题型, 技能点): 数量}"""
+        rows = self.db.query(
+            QuestionPoolItem.subject,
+            QuestionPoolItem.difficulty,
+            QuestionPoolItem.question_type,
+            QuestionPoolItem.skill,
+            func.count(QuestionPoolItem.id)
+        ).filter(
+            QuestionPoolItem.consumed_at == None
+        ).group_by(
+            QuestionPoolItem.subject,
+            QuestionPoolItem.difficulty,
+            QuestionPoolItem.question_type,
+            QuestionPoolItem.skill
+        ).all()
+        return {(subject, difficulty, question_type, skill): count for subject, difficulty, question_type, skill, count in rows}
+
+    async def refill(self) -> int:
+        """把近期有需求的组合补充到目标库存，返回新增题目数（由定时任务在低峰时段执行）"""
+        if not self.ai_service._ai_available:
+            logger.info("未配置AI服务，跳过题目池补充")
+            return 0
+
+        active_since = datetime.now() - timedelta(days=settings.question_pool_idle_days)
+        targets = self.db.query(QuestionPoolTarget).filter(
+            QuestionPoolTarget.last_requested_at >= active_since
+        ).order_by(QuestionPoolTarget.miss_count.desc()).all()
+        inventory = self.inventory()
+
+        added = 0
+        batch_size = max(settings.question_pool_batch_size, 1)
+        for target in targets:
+            key = (target.subject, target.difficulty, target.question_type, target.skill)
+            deficit = (target.target_count or 0) - inventory.get(key, 0)
+            # AI每批返回数量可能不足，尝试次数按缺口计算，避免无限循环
+            attempts = -(-deficit // batch_size)
+            while deficit > 0 and attempts > 0:
+                attempts -= 1
+                try:
+                    questions = await self.ai_service.generate_questions_with_skill(
+                        subject=target.subject,
+                        skill=target.skill or None,
+                        difficulty=target.difficulty,
+                        count=min(deficit, batch_size),
+                        question_types=[target.question_type],
+                        use_cache=False
+                    )
+                except Exception as e:
+                    logger.error(f"补充题目池失败: {key}, 错误: {e}")
+                    break
+                if not questions:
+                    break
+                self.db.bulk_insert_mappings(QuestionPoolItem, [
+                    {
+                        "subject": target.subject,
+                        "difficulty": target.difficulty,
+                        "question_type": target.question_type,
+                        "skill": target.skill,
+                        "payload": question
+                    }
+                    for question in questions[:deficit]
+                ])
+                self.db.commit()
+                added += min(len(questions), deficit)
+                deficit -= len(questions)
+
+        logger.info(f"题目池补充完成，新增 {added} 道题目")
+        return added
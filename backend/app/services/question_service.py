@@ -1,9 +1,67 @@
 from datetime import datetime
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 
-from app.models.question import Question, QuestionType, QuestionCategory, ExamQuestion, ExamPaper
+from app.models.question import (
+    Question, QuestionType, QuestionCategory, ExamQuestion, ExamPaper, question_content_hash
+)
+from app.utils.etag import QUESTION_SET_SCOPE, exam_scope, mark_changed
+from app.utils.upsert import insert_ignoring_conflicts
+
+# 批量写入时每条语句的最大行数 / IN 条件的最大参数数
+_BATCH_SIZE = 500
+_QUESTION_FIELDS = (
+    "question_type", "content", "options", "answer", "explanation", "difficulty",
+    "source", "tags", "skill", "category_id", "created_by"
+)
+
+
+def _question_ids_by_hash(db: Session, hashes: List[str]) -> Dict[str, int]:
+    ids: Dict[str, int] = {}
+    for start in range(0, len(hashes), _BATCH_SIZE):
+        ids.update(db.query(Question.content_hash, Question.id).filter(
+            Question.content_hash.in_(hashes[start:start + _BATCH_SIZE])
+        ).all())
+    return ids
+
+
+def upsert_questions(db: Session, questions: List[Dict[str, Any]]) -> List[Optional[int]]:
+    """按规范化题干哈希批量写入题目，已存在的题目保留原记录，返回与输入顺序对应的题目ID
+
+    查询已有哈希、批量插入新题目（executemany，冲突跳过）、查询新题目ID，共最多三条语句。
+    """
+    hashes = [question_content_hash(question["content"]) for question in questions]
+    ids = _question_ids_by_hash(db, list(dict.fromkeys(hashes)))
+    now = datetime.utcnow()
+    new_rows: Dict[str, Dict[str, Any]] = {}
+    for content_hash, question in zip(hashes, questions):
+        if content_hash not in ids and content_hash not in new_rows:
+            new_rows[content_hash] = {
+                **{field: question.get(field) for field in _QUESTION_FIELDS},
+                "content_hash": content_hash,
+                "created_at": now,
+                "updated_at": now
+            }
+    if new_rows:
+        rows = list(new_rows.values())
+        statement = insert_ignoring_conflicts(db, Question)
+        for start in range(0, len(rows), _BATCH_SIZE):
+            db.execute(statement, rows[start:start + _BATCH_SIZE])
+        # Core 写入不经过 before_flush，需自行登记题目集合的数据版本
+        mark_changed(db, QUESTION_SET_SCOPE)
+        ids.update(_question_ids_by_hash(db, list(new_rows)))
+    return [ids.get(content_hash) for content_hash in hashes]
+
+
+def add_questions_to_exam(db: Session, exam_id: int, links: List[Dict[str, Any]]):
+    """批量写入试卷题目关联，links 为 [{"question_id", "score", "sequence"}]"""
+    rows = [{"exam_id": exam_id, **link} for link in links]
+    for start in range(0, len(rows), _BATCH_SIZE):
+        db.execute(insert(ExamQuestion), rows[start:start + _BATCH_SIZE])
+    if rows:
+        mark_changed(db, exam_scope(exam_id))
 
 
 def create_question(db: Session,
@@ -14,19 +72,18 @@ def create_question(db: Session,
                     explanation: Optional[str] = None,
                     difficulty: int = 1,
                     category_id: Optional[int] = None) -> Question:
-    db_question = Question(question_type=question_type,
-                           content=content,
-                           options=options,
-                           answer=answer,
-                           explanation=explanation,
-                           difficulty=difficulty,
-                           category_id=category_id,
-                           created_at=datetime.utcnow(),
-                           updated_at=datetime.utcnow())
-    db.add(db_question)
+    """创建题目；规范化后题干相同的题目已存在时返回已有题目"""
+    question_id = upsert_questions(db, [{
+        "question_type": question_type,
+        "content": content,
+        "options": options,
+        "answer": answer,
+        "explanation": explanation,
+        "difficulty": difficulty,
+        "category_id": category_id
+    }])[0]
     db.commit()
-    db.refresh(db_question)
-    return db_question
+    return get_question(db, question_id)
 
 
 def get_question(db: Session, question_id: int) -> Optional[Question]:
@@ -0,0 +1,175 @@
+import logging
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models.question import Question, QuestionCategory, UserAnswer
+from app.models.report import ReportPartial
+from app.models.user import User
+from app.services.user_job_scheduler import user_zone
+
+logger = logging.getLogger(__name__)
+
+SubjectCounts = Dict[str, List[int]]
+
+
+def merge_subject_counts(*partials: SubjectCounts) -> SubjectCounts:
+    """合并多个 {学科: [答题数, 答对数]}"""
+    merged: Dict[str, List[int]] = defaultdict(lambda: [0, 0])
+    for partial in partials:
+        for subject, (answered, correct) in (partial or {}).items():
+            merged[subject][0] += answered
+            merged[subject][1] += correct
+    return dict(merged)
+
+
+class ReportPartialService:
+    """报告增量计算：只统计上次报告之后的新答题，累计值与窗口值由已存储的部分合并得到"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def build(
+        self, user_ids: List[int], report_date: date, window_days: int = 30, now: Optional[datetime] = None
+    ) -> Dict[int, Dict[str, Any]]:
+        """为一批用户生成报告日的增量部分并写入会话（不提交事务）
+
+        答题按用户所在时区的日期分组；只存储已经结束的日期，报告日当天尚未结束时当天增量只参与本次计算，
+        下次生成时从上一个已结束的日期之后重新统计，报告生成之后的答题不会遗漏。
+        返回 {用户ID: {"totals": 截至报告日累计, "weekly": 近7天合并, "monthly": 近window_days天合并}}
+        """
+        if not user_ids:
+            return {}
+
+        now = now or datetime.now(timezone.utc)
+        zones = {
+            user_id: user_zone(tz_name)
+            for user_id, tz_name in self.db.query(User.id, User.timezone).filter(User.id.in_(user_ids)).all()
+        }
+        previous = self._latest_before(user_ids, report_date)
+        deltas = self._daily_deltas(user_ids, report_date, previous, zones)
+
+        window_start = report_date - timedelta(days=window_days - 1)
+        window_rows = self.db.query(
+            ReportPartial.user_id, ReportPartial.partial_date, ReportPartial.subject_delta
+        ).filter(
+            ReportPartial.user_id.in_(user_ids),
+            ReportPartial.partial_date >= window_start,
+            ReportPartial.partial_date < report_date
+        ).all()
+        window_deltas: Dict[int, Dict[date, SubjectCounts]] = defaultdict(dict)
+        for row in window_rows:
+            window_deltas[row.user_id][row.partial_date] = row.subject_delta or {}
+
+        # 重新生成同一天的报告时覆盖当天的部分
+        self.db.query(ReportPartial).filter(
+            ReportPartial.user_id.in_(user_ids),
+            ReportPartial.partial_date == report_date
+        ).delete(synchronize_session=False)
+
+        new_rows = []
+        results: Dict[int, Dict[str, Any]] = {}
+        for user_id in user_ids:
+            prev = previous.get(user_id)
+            totals = dict(prev.subject_totals) if prev else {}
+            user_deltas = deltas.get(user_id, {})
+            # 最后一个已结束的日期总是存储一条（可能为空），作为下次增量统计的起点
+            local_today = now.astimezone(zones.get(user_id) or user_zone(None)).date()
+            last_complete = min(report_date, local_today - timedelta(days=1))
+            if prev is None or last_complete > prev.partial_date:
+                user_deltas.setdefault(last_complete, {})
+
+            for day in sorted(user_deltas):
+                totals = merge_subject_counts(totals, user_deltas[day])
+                if day <= last_complete:
+                    new_rows.append({
+                        "user_id": user_id,
+                        "partial_date": day,
+                        "subject_delta": user_deltas[day],
+                        "subject_totals": totals
+                    })
+                if day >= window_start:
+                    window_deltas[user_id][day] = user_deltas[day]
+
+            user_window = window_deltas.get(user_id, {})
+            results[user_id] = {
+                "totals": totals,
+                "weekly": merge_subject_counts(*(
+                    delta for day, delta in user_window.items() if day > report_date - timedelta(days=7)
+                )),
+                "monthly": merge_subject_counts(*user_window.values())
+            }
+
+        if new_rows:
+            self.db.bulk_insert_mappings(ReportPartial, new_rows)
+        return results
+
+    def _latest_before(self, user_ids: List[int], report_date: date) -> Dict[int, ReportPartial]:
+        """每个用户在报告日之前最近的一条部分"""
+        ranked = self.db.query(
+            ReportPartial.id,
+            func.row_number().over(
+                partition_by=ReportPartial.user_id,
+                order_by=ReportPartial.partial_date.desc()
+            ).label('position')
+        ).filter(
+            ReportPartial.user_id.in_(user_ids),
+            ReportPartial.partial_date < report_date
+        ).subquery()
+        rows = self.db.query(ReportPartial).join(
+            ranked, ReportPartial.id == ranked.c.id
+        ).filter(ranked.c.position == 1).all()
+        return {row.user_id: row for row in rows}
+
+    def _daily_deltas(
+        self,
+        user_ids: List[int],
+        report_date: date,
+        previous: Dict[int, ReportPartial],
+        zones: Dict[int, ZoneInfo]
+    ) -> Dict[int, Dict[date, SubjectCounts]]:
+        """统计上次部分之后到报告日的逐日答题增量（按用户本地日期）；首次生成的用户统计全部历史"""
+        # created_at 为UTC，与本地日期最多相差一天：数据库按放宽一天的范围筛选，再按各用户的本地日期精确过滤
+        upper_bound = datetime.combine(report_date + timedelta(days=2), time.min)
+        continuing = [user_id for user_id in user_ids if user_id in previous]
+        bootstrapping = [user_id for user_id in user_ids if user_id not in previous]
+
+        deltas: Dict[int, Dict[date, SubjectCounts]] = defaultdict(lambda: defaultdict(dict))
+        for group, lower_bound in (
+            (continuing, min((previous[u].partial_date for u in continuing), default=None)),
+            (bootstrapping, None)
+        ):
+            if not group:
+                continue
+            query = self.db.query(
+                UserAnswer.user_id,
+                UserAnswer.created_at,
+                UserAnswer.is_correct,
+                QuestionCategory.name.label('subject')
+            ).join(
+                Question, UserAnswer.question_id == Question.id
+            ).join(
+                QuestionCategory, Question.category_id == QuestionCategory.id
+            ).filter(
+                UserAnswer.user_id.in_(group),
+                UserAnswer.created_at < upper_bound
+            )
+            if lower_bound is not None:
+                query = query.filter(UserAnswer.created_at >= datetime.combine(lower_bound, time.min))
+
+            for row in query.yield_per(1000):
+                zone = zones.get(row.user_id) or user_zone(None)
+                day = row.created_at.replace(tzinfo=timezone.utc).astimezone(zone).date()
+                prev = previous.get(row.user_id)
+                # 批内各用户的起点不同，按各自上次的日期过滤
+                if day > report_date or (prev is not None and day <= prev.partial_date):
+                    continue
+                counts = deltas[row.user_id][day].setdefault(row.subject, [0, 0])
+                counts[0] += 1
+                counts[1] += 1 if row.is_correct else 0
+
+        return {user_id: dict(days) for user_id, days in deltas.items()}
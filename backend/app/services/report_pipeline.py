@@ -0,0 +1,232 @@
+import asyncio
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import SessionLocal
+from app.models.report import ReportRunProgress, DailyReport
+from app.models.user import User
+from app.services.job_runner import ensure_lease
+from app.services.learning_report_service import LearningReportService, ReportContextLoader
+from app.services.report_store import ReportStore
+
+logger = logging.getLogger(__name__)
+
+
+async def _generate_chunk_reports(
+    db: Session, user_ids: List[int], report_date: date, concurrency: int
+) -> Tuple[List[Tuple[int, Dict[str, Any]]], int]:
+    """为一批用户并发生成报告，返回 (成功的报告, 失败数)"""
+    contexts = ReportContextLoader(db).load(user_ids, report_date)
+    report_service = LearningReportService(db)
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def generate(user_id: int):
+        async with semaphore:
+            return user_id, await report_service.generate_daily_report(user_id, contexts[user_id])
+
+    results = await asyncio.gather(
+        *(generate(user_id) for user_id in user_ids if user_id in contexts),
+        return_exceptions=True
+    )
+
+    reports = []
+    failed = len(user_ids) - len(contexts)
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error(f"生成报告失败: {str(result)}")
+            failed += 1
+        else:
+            reports.append(result)
+    return reports, failed
+
+
+def run_report_chunk(user_ids: List[int], report_date: date, concurrency: int) -> Tuple[int, int]:
+    """生成并存储一批用户的报告，返回 (成功数, 失败数)；可在子进程中执行"""
+    db = SessionLocal()
+    try:
+        reports, failed = asyncio.run(_generate_chunk_reports(db, user_ids, report_date, concurrency))
+        ReportStore(db).save_batch(report_date, reports)
+        return len(reports), failed
+    finally:
+        db.close()
+
+
+def _reported_users(report_date: date, user_ids: List[int]) -> set:
+    db = SessionLocal()
+    try:
+        return {
+            user_id for (user_id,) in db.query(DailyReport.user_id).filter(
+                DailyReport.report_date == report_date,
+                DailyReport.user_id.in_(user_ids)
+            ).all()
+        }
+    finally:
+        db.close()
+
+
+def generate_missing_reports(
+    report_date: date, user_ids: List[int], concurrency: Optional[int] = None
+) -> Tuple[int, List[int]]:
+    """为尚未生成当日报告的用户生成报告，返回 (成功数, 仍未生成报告的用户ID)（供按用户分散调度使用）"""
+    done = _reported_users(report_date, user_ids)
+    missing = [user_id for user_id in user_ids if user_id not in done]
+    if not missing:
+        return 0, []
+    succeeded, failed = run_report_chunk(missing, report_date, concurrency or settings.report_concurrency)
+    if not failed:
+        return succeeded, []
+    logger.warning(f"{report_date} 有 {failed} 个用户的报告生成失败")
+    done = _reported_users(report_date, missing)
+    return succeeded, [user_id for user_id in missing if user_id not in done]
+
+
+class DailyReportPipeline:
+    """每日报告批处理：按用户ID分批流式读取，批内并发生成，逐批记录进度"""
+
+    JOB_NAME = "daily_report"
+
+    def __init__(
+        self,
+        chunk_size: Optional[int] = None,
+        concurrency: Optional[int] = None,
+        process_workers: Optional[int] = None
+    ):
+        self.chunk_size = chunk_size or settings.report_chunk_size
+        self.concurrency = concurrency or settings.report_concurrency
+        self.process_workers = settings.report_process_workers if process_workers is None else process_workers
+
+    def run(self, report_date: Optional[date] = None, restart: bool = False) -> Dict[str, Any]:
+        """执行（或从上次中断处继续执行）某天的报告任务"""
+        report_date = report_date or datetime.now().date()
+        progress = self._start(report_date, restart)
+        if progress["status"] == "completed":
+            logger.info(f"{report_date} 的每日报告已完成，跳过")
+            return progress
+
+        if progress["last_user_id"]:
+            logger.info(f"从用户ID {progress['last_user_id']} 之后继续生成 {report_date} 的报告")
+
+        try:
+            chunks = self._iter_user_chunks(progress["last_user_id"])
+            if self.process_workers > 0:
+                outcomes = self._run_in_processes(chunks, report_date)
+            else:
+                outcomes = (
+                    (chunk, run_report_chunk(chunk, report_date, self.concurrency)) for chunk in chunks
+                )
+
+            for chunk, (succeeded, failed) in outcomes:
+                ensure_lease()
+                progress = self._record_chunk(report_date, chunk[-1], succeeded, failed)
+                logger.info(
+                    f"报告批次完成: 用户ID至 {chunk[-1]}，成功 {succeeded}，失败 {failed}"
+                )
+
+            progress = self._finish(report_date, "completed")
+        except Exception as e:
+            logger.error(f"每日报告任务中断: {str(e)}")
+            progress = self._finish(report_date, "failed", str(e))
+
+        return progress
+
+    def _run_in_processes(self, chunks: Iterator[List[int]], report_date: date):
+        """按顺序产出各批结果；同时在途的批次数受限，保证进度只在连续完成后推进"""
+        max_in_flight = self.process_workers * 2
+        with ProcessPoolExecutor(max_workers=self.process_workers) as executor:
+            in_flight = deque()
+            for chunk in chunks:
+                in_flight.append((chunk, executor.submit(run_report_chunk, chunk, report_date, self.concurrency)))
+                if len(in_flight) >= max_in_flight:
+                    chunk_done, future = in_flight.popleft()
+                    yield chunk_done, future.result()
+            while in_flight:
+                chunk_done, future = in_flight.popleft()
+                yield chunk_done, future.result()
+
+    def _iter_user_chunks(self, after_user_id: int) -> Iterator[List[int]]:
+        """按主键分页读取活跃用户ID"""
+        last_id = after_user_id or 0
+        while True:
+            db = SessionLocal()
+            try:
+                user_ids = [
+                    user_id for (user_id,) in db.query(User.id).filter(
+                        User.is_active == True,
+                        User.id > last_id
+                    ).order_by(User.id).limit(self.chunk_size).all()
+                ]
+            finally:
+                db.close()
+            if not user_ids:
+                return
+            yield user_ids
+            last_id = user_ids[-1]
+
+    def _start(self, report_date: date, restart: bool) -> Dict[str, Any]:
+        db = SessionLocal()
+        try:
+            progress = self._get_progress(db, report_date)
+            if progress is None:
+                progress = ReportRunProgress(job_name=self.JOB_NAME, report_date=report_date)
+                db.add(progress)
+            elif restart:
+                progress.last_user_id = 0
+                progress.processed_count = 0
+                progress.failed_count = 0
+            elif progress.status == "completed":
+                return self._to_dict(progress)
+
+            progress.status = "running"
+            progress.error = None
+            progress.finished_at = None
+            db.commit()
+            return self._to_dict(progress)
+        finally:
+            db.close()
+
+    def _record_chunk(self, report_date: date, last_user_id: int, succeeded: int, failed: int) -> Dict[str, Any]:
+        db = SessionLocal()
+        try:
+            progress = self._get_progress(db, report_date)
+            progress.last_user_id = last_user_id
+            progress.processed_count = (progress.processed_count or 0) + succeeded
+            progress.failed_count = (progress.failed_count or 0) + failed
+            db.commit()
+            return self._to_dict(progress)
+        finally:
+            db.close()
+
+    def _finish(self, report_date: date, status: str, error: Optional[str] = None) -> Dict[str, Any]:
+        db = SessionLocal()
+        try:
+            progress = self._get_progress(db, report_date)
+            progress.status = status
+            progress.error = error
+            progress.finished_at = datetime.now()
+            db.commit()
+            return self._to_dict(progress)
+        finally:
+            db.close()
+
+    def _get_progress(self, db: Session, report_date: date) -> Optional[ReportRunProgress]:
+        return db.query(ReportRunProgress).filter(
+            ReportRunProgress.job_name == self.JOB_NAME,
+            ReportRunProgress.report_date == report_date
+        ).first()
+
+    @staticmethod
+    def _to_dict(progress: ReportRunProgress) -> Dict[str, Any]:
+        return {
+            "report_date": str(progress.report_date),
+            "status": progress.status,
+            "last_user_id": progress.last_user_id or 0,
+            "processed": progress.processed_count or 0,
+            "failed": progress.failed_count or 0,
+            "error": progress.error
+        }
@@ -0,0 +1,68 @@
+import json
+import logging
+import zlib
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.models.report import DailyReport
+
+logger = logging.getLogger(__name__)
+
+
+def _encode(report: Dict[str, Any]) -> bytes:
+    return zlib.compress(
+        json.dumps(report, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+    )
+
+
+def _decode(payload: bytes) -> Dict[str, Any]:
+    return json.loads(zlib.decompress(payload).decode("utf-8"))
+
+
+class ReportStore:
+    """每日报告存储：一行一份报告，按 (用户, 日期) 唯一"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def save_batch(self, report_date: date, reports: List[Tuple[int, Dict[str, Any]]]) -> int:
+        """批量写入同一天的报告，已存在的报告会被覆盖"""
+        if not reports:
+            return 0
+        user_ids = [user_id for user_id, _ in reports]
+        self.db.query(DailyReport).filter(
+            DailyReport.report_date == report_date,
+            DailyReport.user_id.in_(user_ids)
+        ).delete(synchronize_session=False)
+        self.db.bulk_insert_mappings(DailyReport, [
+            {"user_id": user_id, "report_date": report_date, "payload": _encode(report)}
+            for user_id, report in reports
+        ])
+        self.db.commit()
+        return len(reports)
+
+    def get(self, user_id: int, report_date: date) -> Optional[Dict[str, Any]]:
+        """获取某天的报告"""
+        row = self.db.query(DailyReport.payload).filter(
+            DailyReport.user_id == user_id,
+            DailyReport.report_date == report_date
+        ).first()
+        return _decode(row.payload) if row else None
+
+    def list_range(
+        self,
+        user_id: int,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        limit: int = 30
+    ) -> List[Dict[str, Any]]:
+        """按日期倒序获取区间内的报告"""
+        query = self.db.query(DailyReport.payload).filter(DailyReport.user_id == user_id)
+        if start_date:
+            query = query.filter(DailyReport.report_date >= start_date)
+        if end_date:
+            query = query.filter(DailyReport.report_date <= end_date)
+        rows = query.order_by(DailyReport.report_date.desc()).limit(limit).all()
+        return [_decode(row.payload) for row in rows]
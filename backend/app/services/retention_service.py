@@ -0,0 +1,160 @@
+import json
+import logging
+import time
+import zlib
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import SessionLocal
+from app.models.archive import RecordArchive
+from app.models.background_job import BackgroundJob
+from app.models.job import JobRun
+from app.models.learning import LearningProgress
+from app.models.user import User
+from app.services.background_jobs import TERMINAL_STATUSES
+from app.services.job_runner import ensure_lease
+from app.utils.etag import mark_changed, user_scope
+from app.utils.principal_cache import invalidate_all
+
+logger = logging.getLogger(__name__)
+
+# 清理策略名 -> (模型, 时间列名, 保留天数配置名, 是否归档, 附加条件)
+RETENTION_POLICIES = {
+    "learning_progress": (LearningProgress, "recorded_at", "retention_learning_progress_days", True, None),
+    "job_runs": (JobRun, "started_at", "retention_job_run_days", False, None),
+    # 排队或执行中的任务即使创建较早也不能删除
+    "background_jobs": (
+        BackgroundJob, "created_at", "retention_background_job_days", False,
+        BackgroundJob.status.in_(TERMINAL_STATUSES)
+    ),
+}
+
+
+def _row_to_dict(row: Any) -> Dict[str, Any]:
+    return {column.key: getattr(row, column.key) for column in inspect(row).mapper.column_attrs}
+
+
+def _in_peak_hours(now: datetime) -> bool:
+    start, end = (int(hour) for hour in settings.retention_peak_hours.split("-"))
+    if start <= end:
+        return start <= now.hour < end
+    return now.hour >= start or now.hour < end
+
+
+class RetentionService:
+    """数据保留：按主键范围分批删除/归档、分批集合更新，批次之间短暂休眠，避免长时间持有写锁"""
+
+    def __init__(
+        self,
+        batch_size: Optional[int] = None,
+        sleep_seconds: Optional[float] = None,
+        archive: Optional[bool] = None,
+        max_batches: Optional[int] = None
+    ):
+        self.batch_size = batch_size or settings.retention_batch_size
+        self.sleep_seconds = settings.retention_batch_sleep if sleep_seconds is None else sleep_seconds
+        self.archive = settings.retention_archive_enabled if archive is None else archive
+        self.max_batches = max_batches
+
+    def _batch_limit(self, now: datetime) -> Optional[int]:
+        """高峰时段限制批次数，剩余部分留到低峰时段继续"""
+        if self.max_batches is not None:
+            return self.max_batches
+        return settings.retention_peak_max_batches if _in_peak_hours(now) else None
+
+    def _walk(self, model, condition, action: Callable[[Session, List[int]], int], now: datetime) -> int:
+        """按主键顺序分批找出满足条件的行，每批单独提交"""
+        limit = self._batch_limit(now)
+        last_id = None
+        total = batches = 0
+        while limit is None or batches < limit:
+            ensure_lease()
+            db = SessionLocal()
+            try:
+                query = db.query(model.id).filter(condition)
+                if last_id is not None:
+                    query = query.filter(model.id > last_id)
+                ids = [row_id for (row_id,) in query.order_by(model.id).limit(self.batch_size).all()]
+                if not ids:
+                    break
+                total += action(db, ids)
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+
+            last_id = ids[-1]
+            batches += 1
+            if len(ids) < self.batch_size:
+                break
+            time.sleep(self.sleep_seconds)
+        return total
+
+    def purge(self, name: str, now: Optional[datetime] = None) -> int:
+        """按保留策略清理过期记录，返回删除行数"""
+        model, column_name, days_setting, archive, extra_condition = RETENTION_POLICIES[name]
+        now = now or datetime.now()
+        column = getattr(model, column_name)
+        cutoff = now - timedelta(days=getattr(settings, days_setting))
+        condition = column < cutoff
+        if extra_condition is not None:
+            condition = condition & extra_condition
+
+        def delete_batch(db: Session, ids: List[int]) -> int:
+            # 条件限定在本批主键范围内，只锁定这一段
+            in_range = (model.id >= ids[0], model.id <= ids[-1], condition)
+            if archive and self.archive:
+                rows = db.query(model).filter(*in_range).order_by(model.id).all()
+                if not rows:
+                    return 0
+                db.add(RecordArchive(
+                    table_name=model.__tablename__,
+                    min_record_id=rows[0].id,
+                    max_record_id=rows[-1].id,
+                    row_count=len(rows),
+                    payload=zlib.compress(json.dumps(
+                        [_row_to_dict(row) for row in rows],
+                        ensure_ascii=False, separators=(",", ":"), default=str
+                    ).encode("utf-8"))
+                ))
+            if hasattr(model, "user_id"):
+                # 批量删除不经过 before_flush，需自行登记受影响用户的数据版本
+                mark_changed(db, *(user_scope(user_id) for (user_id,) in db.query(model.user_id).filter(
+                    *in_range
+                ).distinct()))
+            return db.query(model).filter(*in_range).delete(synchronize_session=False)
+
+        deleted = self._walk(model, condition, delete_batch, now)
+        if deleted:
+            logger.info(f"清理了 {deleted} 条 {model.__tablename__} 旧记录")
+        return deleted
+
+    def deactivate_inactive_users(self, now: Optional[datetime] = None) -> int:
+        """将长期未登录的用户标记为非活跃（分批集合更新，不加载用户对象）"""
+        now = now or datetime.now()
+        cutoff = now - timedelta(days=settings.retention_inactive_user_days)
+        condition = (User.last_login < cutoff) & (User.is_active == True)
+
+        def update_batch(db: Session, ids: List[int]) -> int:
+            return db.query(User).filter(
+                User.id >= ids[0], User.id <= ids[-1], condition
+            ).update({User.is_active: False}, synchronize_session=False)
+
+        updated = self._walk(User, condition, update_batch, now)
+        if updated:
+            # 集合更新不经过ORM事件，需要手动清除用户缓存
+            invalidate_all()
+            logger.info(f"将 {updated} 个用户标记为非活跃")
+        return updated
+
+    def run_all(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """执行全部保留策略，返回 {策略名: 处理行数}"""
+        result = {name: self.purge(name, now) for name in RETENTION_POLICIES}
+        result["inactive_users"] = self.deactivate_inactive_users(now)
+        return result
@@ -1,23 +1,43 @@
 import asyncio
 import logging
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from sqlalchemy.orm import Session
+from config import settings
 from database import get_db
-from app.models.user import User
 from app.services.question_generator import QuestionGenerator
 from app.services.learning_report_service import LearningReportService
+from app.services.report_pipeline import DailyReportPipeline, generate_missing_reports
+from app.services.report_store import ReportStore
+from app.services.activity_rollup_service import ActivityRollupService
+from app.services.job_runner import JobRunner, WORKER_ID
+from app.services.retention_service import RetentionService
+from app.services.user_job_scheduler import PerUserJobScheduler
+from app.services.llm_dispatcher import BATCH, llm_priority, set_priority
 from datetime import datetime, timedelta
 import schedule
-import time
 import threading
 
 logger = logging.getLogger(__name__)
 
 
 class SchedulerService:
+    # 任务名 -> (执行方法名, 执行周期 daily/hourly, 每日执行时间)
+    # 每日报告按用户本地时间分散生成，见 report_scheduler
+    JOBS = {
+        "daily_question_generation": ("_daily_question_generation", "daily", "06:00"),
+        "daily_activity_backfill": ("_daily_activity_backfill", "daily", "02:30"),
+        "question_pool_refill": ("_question_pool_refill", "daily", settings.question_pool_refill_time),
+        "hourly_cleanup": ("_hourly_cleanup", "hourly", None),
+    }
+
     def __init__(self):
         self.running = False
         self.scheduler_thread = None
+        self.job_runner = JobRunner()
+        self.report_scheduler = PerUserJobScheduler(
+            "user_daily_report", generate_missing_reports, job_runner=self.job_runner
+        )
+        self._stop_event = threading.Event()
     
     def start(self):
         """启动定时任务服务"""
@@ -26,149 +46,132 @@ class SchedulerService:
             return
         
         self.running = True
+        self._stop_event.clear()
         
-        # 设置定时任务
-        schedule.every().day.at("06:00").do(self._daily_question_generation)
-        schedule.every().day.at("20:00").do(self._daily_report_generation)
-        schedule.every().hour.do(self._hourly_cleanup)
+        # 设置定时任务（每个进程都会触发，由数据库租约保证集群内每个周期只执行一次）
+        for job_name, (_, period, at) in self.JOBS.items():
+            if period == "daily":
+                schedule.every().day.at(at).do(self._run_job, job_name)
+            else:
+                schedule.every().hour.do(self._run_job, job_name)
         
         # 启动调度器线程
         self.scheduler_thread = threading.Thread(target=self._run_scheduler, daemon=True)
         self.scheduler_thread.start()
         
-        logger.info("定时任务服务启动成功")
+        logger.info(f"定时任务服务启动成功: {WORKER_ID}")
     
     def stop(self):
         """停止定时任务服务"""
         self.running = False
+        self._stop_event.set()
         if self.scheduler_thread:
             self.scheduler_thread.join(timeout=5)
+        schedule.clear()
         logger.info("定时任务服务已停止")
     
     def _run_scheduler(self):
         """运行调度器"""
+        # 定时任务的AI调用为批量优先级，给交互请求让路
+        set_priority(BATCH)
         while self.running:
             try:
                 schedule.run_pending()
-                time.sleep(60)  # 每分钟检查一次
+                self.report_scheduler.tick()
             except Exception as e:
                 logger.error(f"调度器运行错误: {str(e)}")
-                time.sleep(60)
+            self._stop_event.wait(settings.scheduler_poll_seconds)
+    
+    @staticmethod
+    def _run_key(period: str, now: Optional[datetime] = None) -> str:
+        """执行周期标识：每日任务按日期，每小时任务按小时"""
+        now = now or datetime.now()
+        return now.strftime("%Y-%m-%d") if period == "daily" else now.strftime("%Y-%m-%dT%H")
+    
+    def _run_job(self, job_name: str) -> Optional[Dict[str, Any]]:
+        """获取租约后执行任务并记录执行历史"""
+        method_name, period, _ = self.JOBS[job_name]
+        return self.job_runner.run(job_name, self._run_key(period), getattr(self, method_name))
     
-    def _daily_question_generation(self):
-        """每日题目生成任务"""
+    def get_run_history(self, job_name: str = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """获取任务执行历史"""
+        return JobRunner.get_history(job_name, limit)
+    
+    def _daily_question_generation(self) -> int:
+        """每日题目生成任务，返回生成的题目数"""
+        logger.info("开始执行每日题目生成任务")
+        
+        # 创建数据库会话
+        db = next(get_db())
+        
+        # 创建题目生成器
+        generator = QuestionGenerator(db)
+        
+        # 异步执行题目生成
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        
         try:
-            logger.info("开始执行每日题目生成任务")
-            
-            # 创建数据库会话
-            db = next(get_db())
-            
-            # 创建题目生成器
-            generator = QuestionGenerator(db)
-            
-            # 异步执行题目生成
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            try:
-                result = loop.run_until_complete(generator.generate_daily_questions())
-                logger.info(f"每日题目生成完成: {result}")
-            finally:
-                loop.close()
-                db.close()
-                
-        except Exception as e:
-            logger.error(f"每日题目生成任务失败: {str(e)}")
+            result = loop.run_until_complete(generator.generate_daily_questions())
+            logger.info(f"每日题目生成完成: {result}")
+        finally:
+            loop.close()
+            db.close()
+        
+        return result.get("total_generated", 0)
     
-    def _daily_report_generation(self):
-        """每日学习报告生成任务"""
+    def _question_pool_refill(self) -> int:
+        """题目池补充任务，返回新增的题目数"""
+        logger.info("开始执行题目池补充任务")
+        
+        db = next(get_db())
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        
         try:
-            logger.info("开始执行每日学习报告生成任务")
-            
-            # 创建数据库会话
-            db = next(get_db())
-            
-            # 获取所有活跃用户
-            users = db.query(User).filter(User.is_active == True).all()
-            
-            # 创建报告服务
-            report_service = LearningReportService(db)
-            
-            # 异步执行报告生成
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            try:
-                for user in users:
-                    try:
-                        report = loop.run_until_complete(report_service.generate_daily_report(user.id))
-                        logger.info(f"为用户 {user.username} 生成每日报告成功")
-                        
-                        # 这里可以添加报告存储或发送逻辑
-                        self._store_daily_report(user.id, report)
-                        
-                    except Exception as e:
-                        logger.error(f"为用户 {user.username} 生成报告失败: {str(e)}")
-                        continue
-                        
-            finally:
-                loop.close()
-                db.close()
-                
-            logger.info("每日学习报告生成任务完成")
-            
-        except Exception as e:
-            logger.error(f"每日学习报告生成任务失败: {str(e)}")
+            added = loop.run_until_complete(QuestionGenerator(db).refill_question_pool())
+        finally:
+            loop.close()
+            db.close()
+        
+        return added
     
-    def _hourly_cleanup(self):
-        """每小时清理任务"""
+    def _daily_activity_backfill(self) -> int:
+        """每日学习汇总回填任务（对账前一天的增量汇总），返回回填的行数"""
+        logger.info("开始执行每日学习汇总回填任务")
+        
+        db = next(get_db())
+        
         try:
-            logger.info("开始执行每小时清理任务")
-            
-            # 创建数据库会话
-            db = next(get_db())
-            
-            try:
-                # 清理过期的缓存数据
-                self._cleanup_expired_cache(db)
-                
-                # 清理过期的学习记录
-                self._cleanup_old_learning_records(db)
-                
-                # 更新用户活跃状态
-                self._update_user_activity_status(db)
-                
-            finally:
-                db.close()
-                
-            logger.info("每小时清理任务完成")
-            
-        except Exception as e:
-            logger.error(f"每小时清理任务失败: {str(e)}")
+            yesterday = datetime.now().date() - timedelta(days=1)
+            rows = ActivityRollupService(db).backfill(yesterday, yesterday)
+            logger.info(f"每日学习汇总回填完成: {rows} 行")
+        finally:
+            db.close()
+        
+        return rows
     
-    def _store_daily_report(self, user_id: int, report: Dict[str, Any]):
-        """存储每日报告"""
+    def _hourly_cleanup(self) -> int:
+        """每小时清理任务，返回清理和更新的记录总数"""
+        logger.info("开始执行每小时清理任务")
+        
+        # 创建数据库会话
+        db = next(get_db())
+        
         try:
-            # 这里可以实现报告存储逻辑
-            # 例如：存储到数据库、发送邮件、推送到消息队列等
-            
-            # 示例：存储到文件系统
-            import json
-            import os
+            # 清理过期的缓存数据
+            rows = self._cleanup_expired_cache(db)
             
-            reports_dir = "reports/daily"
-            os.makedirs(reports_dir, exist_ok=True)
+            # 分批清理过期记录并更新用户活跃状态
+            rows += sum(RetentionService().run_all().values())
             
-            filename = f"{reports_dir}/user_{user_id}_{report['date']}.json"
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(report, f, ensure_ascii=False, indent=2)
-            
-            logger.info(f"每日报告已存储: {filename}")
-            
-        except Exception as e:
-            logger.error(f"存储每日报告失败: {str(e)}")
+        finally:
+            db.close()
+        
+        logger.info("每小时清理任务完成")
+        return rows
     
-    def _cleanup_expired_cache(self, db: Session):
+    def _cleanup_expired_cache(self, db: Session) -> int:
         """清理过期缓存"""
         try:
             # 这里可以清理AI服务缓存、用户会话缓存等
@@ -190,72 +193,37 @@ class SchedulerService:
             
             if expired_keys:
                 logger.info(f"清理了 {len(expired_keys)} 个过期缓存")
+            return len(expired_keys)
                 
         except Exception as e:
             logger.error(f"清理过期缓存失败: {str(e)}")
-    
-    def _cleanup_old_learning_records(self, db: Session):
-        """清理旧的学习记录"""
-        try:
-            from app.models.learning import LearningProgress
-            
-            # 删除超过90天的学习记录
-            cutoff_date = datetime.now() - timedelta(days=90)
-            
-            deleted_count = db.query(LearningProgress).filter(
-                LearningProgress.created_at < cutoff_date
-            ).delete()
-            
-            db.commit()
-            
-            if deleted_count > 0:
-                logger.info(f"清理了 {deleted_count} 条旧学习记录")
-                
-        except Exception as e:
-            logger.error(f"清理旧学习记录失败: {str(e)}")
-            db.rollback()
-    
-    def _update_user_activity_status(self, db: Session):
-        """更新用户活跃状态"""
-        try:
-            # 将超过30天未登录的用户标记为非活跃
-            cutoff_date = datetime.now() - timedelta(days=30)
-            
-            inactive_users = db.query(User).filter(
-                User.last_login < cutoff_date,
-                User.is_active == True
-            ).all()
-            
-            for user in inactive_users:
-                user.is_active = False
-            
-            db.commit()
-            
-            if inactive_users:
-                logger.info(f"将 {len(inactive_users)} 个用户标记为非活跃")
-                
-        except Exception as e:
-            logger.error(f"更新用户活跃状态失败: {str(e)}")
-            db.rollback()
+            return 0
     
     def run_manual_task(self, task_name: str, **kwargs) -> Dict[str, Any]:
         """手动执行任务"""
         try:
             logger.info(f"手动执行任务: {task_name}")
-            
-            if task_name == "generate_questions":
-                return self._manual_question_generation(**kwargs)
-            elif task_name == "generate_reports":
-                return self._manual_report_generation(**kwargs)
-            elif task_name == "cleanup":
-                return self._manual_cleanup(**kwargs)
-            else:
-                return {"success": False, "error": f"未知任务: {task_name}"}
+            with llm_priority(BATCH):
+                return self._run_manual_task(task_name, **kwargs)
                 
         except Exception as e:
             logger.error(f"手动执行任务失败: {str(e)}")
             return {"success": False, "error": str(e)}
     
+    def _run_manual_task(self, task_name: str, **kwargs) -> Dict[str, Any]:
+        if task_name == "generate_questions":
+            return self._manual_question_generation(**kwargs)
+        elif task_name == "generate_reports":
+            return self._manual_report_generation(**kwargs)
+        elif task_name == "cleanup":
+            return self._manual_cleanup(**kwargs)
+        elif task_name == "backfill_activity":
+            return self._manual_activity_backfill(**kwargs)
+        elif task_name == "refill_question_pool":
+            return {"success": True, "result": {"added": self._question_pool_refill()}}
+        else:
+            return {"success": False, "error": f"未知任务: {task_name}"}
+    
     def _manual_question_generation(self, subject: str = None, user_id: int = None) -> Dict[str, Any]:
         """手动生成题目"""
         try:
@@ -304,20 +272,11 @@ class SchedulerService:
                 if user_id:
                     # 为特定用户生成报告
                     report = loop.run_until_complete(report_service.generate_daily_report(user_id))
+                    ReportStore(db).save_batch(datetime.now().date(), [(user_id, report)])
                     result = {"user_id": user_id, "report": report}
                 else:
-                    # 为所有用户生成报告
-                    users = db.query(User).filter(User.is_active == True).all()
-                    reports = []
-                    
-                    for user in users:
-                        try:
-                            report = loop.run_until_complete(report_service.generate_daily_report(user.id))
-                            reports.append({"user_id": user.id, "username": user.username})
-                        except Exception as e:
-                            logger.error(f"为用户 {user.username} 生成报告失败: {str(e)}")
-                    
-                    result = {"total_users": len(users), "successful_reports": len(reports)}
+                    # 为所有用户重新生成报告
+                    result = DailyReportPipeline().run(restart=True)
                 
             finally:
                 loop.close()
@@ -328,17 +287,37 @@ class SchedulerService:
         except Exception as e:
             return {"success": False, "error": str(e)}
     
+    def _manual_activity_backfill(self, days: int = 30, user_id: int = None) -> Dict[str, Any]:
+        """手动回填每日学习汇总"""
+        try:
+            db = next(get_db())
+            
+            try:
+                end_date = datetime.now().date()
+                start_date = end_date - timedelta(days=days - 1)
+                rows = ActivityRollupService(db).backfill(
+                    start_date, end_date, user_ids=[user_id] if user_id else None
+                )
+                result = {"start_date": str(start_date), "end_date": str(end_date), "rows": rows}
+                
+            finally:
+                db.close()
+            
+            return {"success": True, "result": result}
+            
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+    
     def _manual_cleanup(self) -> Dict[str, Any]:
         """手动清理"""
         try:
             db = next(get_db())
             
             try:
-                self._cleanup_expired_cache(db)
-                self._cleanup_old_learning_records(db)
-                self._update_user_activity_status(db)
+                expired = self._cleanup_expired_cache(db)
+                retention = RetentionService().run_all()
                 
-                result = {"message": "清理任务完成"}
+                result = {"message": "清理任务完成", "expired_cache": expired, **retention}
                 
             finally:
                 db.close()
@@ -0,0 +1,270 @@
+import asyncio
+import io
+import logging
+import math
+import struct
+import wave
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Type
+
+import numpy as np
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# WAV 文件头（含 fmt 和 data 块头）最多缓存的字节数
+MAX_HEADER_BYTES = 64 * 1024
+AUDIO_FORMATS = ("wav", "pcm")
+
+
+class AudioRejected(Exception):
+    """音频格式不支持或超出大小/时长限制"""
+
+    def __init__(self, message: str, too_large: bool = False):
+        super().__init__(message)
+        self.message = message
+        self.too_large = too_large
+
+
+def size_limit_message() -> str:
+    limit = settings.max_file_size
+    if limit >= 1024 * 1024:
+        return f"音频大小超过 {round(limit / (1024 * 1024), 1):g}MB"
+    return f"音频大小超过 {round(limit / 1024):g}KB"
+
+
+# 识别后端
+
+class SpeechRecognizer(ABC):
+    """识别后端接口：按顺序接收单声道 float32 音频块（采样率为 speech_sample_rate），可返回部分识别结果"""
+
+    def __init__(self, language: str, sample_rate: int):
+        self.language = language
+        self.sample_rate = sample_rate
+
+    @abstractmethod
+    def accept(self, samples: np.ndarray) -> Optional[str]:
+        """送入一段音频，返回当前的部分识别文本（没有新结果时返回None）"""
+
+    @abstractmethod
+    def finish(self) -> Dict[str, Any]:
+        """音频结束，返回最终结果 {"text", "confidence"}"""
+
+
+RECOGNIZERS: Dict[str, Type[SpeechRecognizer]] = {}
+
+
+def register_recognizer(name: str) -> Callable[[Type[SpeechRecognizer]], Type[SpeechRecognizer]]:
+    def decorator(recognizer: Type[SpeechRecognizer]) -> Type[SpeechRecognizer]:
+        RECOGNIZERS[name] = recognizer
+        return recognizer
+    return decorator
+
+
+@register_recognizer("mock")
+class MockRecognizer(SpeechRecognizer):
+    """模拟识别：按已接收的有声音频时长逐步输出示例文本"""
+
+    SAMPLE_TEXT = "这是语音识别的示例文本"
+    SECONDS_PER_CHAR = 0.3
+
+    def __init__(self, language: str, sample_rate: int):
+        super().__init__(language, sample_rate)
+        self._voiced_samples = 0
+        self._emitted = 0
+
+    def accept(self, samples: np.ndarray) -> Optional[str]:
+        self._voiced_samples += int(np.count_nonzero(np.abs(samples) > 0.01))
+        chars = min(len(self.SAMPLE_TEXT), int(self._voiced_samples / self.sample_rate / self.SECONDS_PER_CHAR))
+        if chars > self._emitted:
+            self._emitted = chars
+            return self.SAMPLE_TEXT[:chars]
+        return None
+
+    def finish(self) -> Dict[str, Any]:
+        return {"text": self.SAMPLE_TEXT if self._voiced_samples else "", "confidence": 0.95}
+
+
+# 解码与重采样
+
+class _WavHeader:
+    """从字节流开头解析 WAV 文件头（使用 wave 模块），得到音频参数和文件头之后的数据"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def _has_data_chunk(self) -> bool:
+        """按 RIFF 块头逐块跳过，是否已收到 data 块头（之前的 fmt 等块已完整）"""
+        offset = 12
+        while offset + 8 <= len(self._buffer):
+            chunk_id = bytes(self._buffer[offset:offset + 4])
+            if chunk_id == b"data":
+                return True
+            size = struct.unpack("<I", self._buffer[offset + 4:offset + 8])[0]
+            offset += 8 + size + (size & 1)
+        return False
+
+    def feed(self, chunk: bytes):
+        """文件头不完整时返回None；完整时返回 (声道数, 采样宽度, 采样率, 文件头声明的帧数, 文件头之后的音频数据)"""
+        self._buffer.extend(chunk)
+        if len(self._buffer) < 12:
+            return None
+        if self._buffer[:4] != b"RIFF" or self._buffer[8:12] != b"WAVE":
+            raise AudioRejected("仅支持WAV格式或16位PCM音频")
+        if not self._has_data_chunk():
+            # 文件头尚未收全
+            if len(self._buffer) > MAX_HEADER_BYTES:
+                raise AudioRejected("WAV文件头无效")
+            return None
+        stream = io.BytesIO(bytes(self._buffer))
+        try:
+            reader = wave.open(stream, "rb")
+        except (EOFError, struct.error, wave.Error) as e:
+            raise AudioRejected(f"WAV文件无效: {e}")
+        # wave 读到 data 块头后停止，当前位置即音频数据起始位置
+        data_start = stream.tell()
+        params = (reader.getnchannels(), reader.getsampwidth(), reader.getframerate(), reader.getnframes())
+        return params + (bytes(self._buffer[data_start:]),)
+
+
+class StreamingResampler:
+    """分块线性插值重采样，块之间保留上一块最后一个采样和插值位置，输出与整段重采样一致"""
+
+    def __init__(self, source_rate: int, target_rate: int):
+        self.step = source_rate / target_rate
+        self._tail = np.zeros(0, dtype=np.float32)
+        self._position = 0.0
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        if self.step == 1:
+            return samples
+        buffer = np.concatenate([self._tail, samples])
+        last = len(buffer) - 1
+        if last <= self._position:
+            self._tail = buffer
+            return np.zeros(0, dtype=np.float32)
+        count = math.ceil((last - self._position) / self.step)
+        positions = self._position + self.step * np.arange(count)
+        output = np.interp(positions, np.arange(len(buffer)), buffer).astype(np.float32)
+        self._position += self.step * count - last
+        self._tail = buffer[-1:]
+        return output
+
+
+class SpeechStream:
+    """流式语音识别：逐块接收上传的字节，解码为单声道 float32、重采样后送入识别后端
+
+    只缓存不足一帧的字节和 WAV 文件头，内存占用与音频总长度无关；超过 max_file_size 或
+    speech_max_duration_seconds 时立即拒绝（WAV 文件头声明的时长超限时在收到文件头后就拒绝）。
+    """
+
+    def __init__(
+        self,
+        language: str = "zh-CN",
+        audio_format: str = "wav",
+        sample_rate: Optional[int] = None,
+        recognizer: Optional[str] = None
+    ):
+        if audio_format not in AUDIO_FORMATS:
+            raise AudioRejected("仅支持WAV格式或16位PCM音频")
+        recognizer_name = recognizer or settings.speech_recognizer
+        if recognizer_name not in RECOGNIZERS:
+            raise ValueError(f"未知的语音识别后端: {recognizer_name}")
+        self.language = language
+        self.target_rate = settings.speech_sample_rate
+        self.recognizer = RECOGNIZERS[recognizer_name](language, self.target_rate)
+        self.received_bytes = 0
+        self.frames = 0
+        self._header = _WavHeader() if audio_format == "wav" else None
+        self._channels, self._sample_width, self._rate = 1, 2, sample_rate or self.target_rate
+        self._resampler = StreamingResampler(self._rate, self.target_rate) if audio_format == "pcm" else None
+        self._remainder = b""
+        self._last_partial_frames = 0
+        self._partial: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        return self.frames / self._rate if self._rate else 0.0
+
+    def _start(self, channels: int, sample_width: int, rate: int, declared_frames: int):
+        if sample_width not in (1, 2, 4) or channels < 1 or rate <= 0:
+            raise AudioRejected("不支持的WAV编码（仅支持8/16/32位整数PCM）")
+        self._channels, self._sample_width, self._rate = channels, sample_width, rate
+        # 边录边传的WAV文件头中数据长度可能为0或最大值，只在声明值合理时提前检查
+        if 0 < declared_frames < 0x7FFFFFFF and declared_frames / rate > settings.speech_max_duration_seconds:
+            raise AudioRejected(f"音频时长超过 {settings.speech_max_duration_seconds} 秒", too_large=True)
+        self._resampler = StreamingResampler(rate, self.target_rate)
+
+    def _decode(self, data: bytes) -> np.ndarray:
+        frame_size = self._channels * self._sample_width
+        data = self._remainder + data
+        usable = len(data) - len(data) % frame_size
+        self._remainder = data[usable:]
+        if not usable:
+            return np.zeros(0, dtype=np.float32)
+        if self._sample_width == 1:
+            samples = (np.frombuffer(data[:usable], dtype=np.uint8).astype(np.float32) - 128) / 128
+        elif self._sample_width == 2:
+            samples = np.frombuffer(data[:usable], dtype="<i2").astype(np.float32) / 32768
+        else:
+            samples = np.frombuffer(data[:usable], dtype="<i4").astype(np.float32) / 2147483648
+        if self._channels > 1:
+            samples = samples.reshape(-1, self._channels).mean(axis=1)
+        return samples
+
+    def feed(self, chunk: bytes) -> Optional[Dict[str, Any]]:
+        """处理一块数据，识别后端产生新的部分结果且距上次推送超过 speech_partial_interval 时返回部分结果"""
+        self.received_bytes += len(chunk)
+        if self.received_bytes > settings.max_file_size:
+            raise AudioRejected(size_limit_message(), too_large=True)
+        if self._header is not None:
+            parsed = self._header.feed(chunk)
+            if parsed is None:
+                return None
+            channels, sample_width, rate, declared_frames, chunk = parsed
+            self._header = None
+            self._start(channels, sample_width, rate, declared_frames)
+
+        samples = self._decode(chunk)
+        self.frames += len(samples)
+        if self.duration > settings.speech_max_duration_seconds:
+            raise AudioRejected(f"音频时长超过 {settings.speech_max_duration_seconds} 秒", too_large=True)
+        resampled = self._resampler.process(samples)
+        if not len(resampled):
+            return None
+        partial = self.recognizer.accept(resampled)
+        if partial is not None:
+            self._partial = partial
+        if self._partial is not None \
+                and self.frames - self._last_partial_frames >= settings.speech_partial_interval * self._rate:
+            self._last_partial_frames = self.frames
+            text, self._partial = self._partial, None
+            return {"text": text, "duration": round(self.duration, 2)}
+        return None
+
+    def finish(self) -> Dict[str, Any]:
+        if self._header is not None:
+            raise AudioRejected("音频数据不完整")
+        result = self.recognizer.finish()
+        return {
+            "text": result.get("text", ""),
+            "confidence": result.get("confidence", 0.0),
+            "language": self.language,
+            "duration": round(self.duration, 2)
+        }
+
+
+async def transcribe_stream(
+    chunks: AsyncIterator[bytes],
+    language: str = "zh-CN",
+    audio_format: str = "wav",
+    sample_rate: Optional[int] = None
+) -> Dict[str, Any]:
+    """逐块识别并返回最终结果；超出限制时抛出 AudioRejected，剩余数据不再读取"""
+    stream = SpeechStream(language, audio_format, sample_rate)
+    async for chunk in chunks:
+        if chunk:
+            # 识别后端可能是CPU密集的本地模型，放到线程中执行
+            await asyncio.to_thread(stream.feed, chunk)
+    return await asyncio.to_thread(stream.finish)
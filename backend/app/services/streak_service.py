@@ -0,0 +1,200 @@
+import logging
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy.orm import Session
+
+from app.models.activity import DailyUserActivity, UserActivityDays
+from app.models.learning import Achievement
+from app.utils.upsert import insert_ignoring_conflicts
+
+logger = logging.getLogger(__name__)
+
+# 连续学习天数 -> (成就标题, 奖励点数)
+STREAK_MILESTONES: Dict[int, tuple] = {
+    3: ("连续学习3天", 10),
+    7: ("连续学习7天", 30),
+    30: ("连续学习30天", 100),
+    100: ("连续学习100天", 300),
+}
+STREAK_ACHIEVEMENT_TYPE = "daily_streak"
+
+
+def _day_index(row: UserActivityDays, day: date) -> int:
+    return (day - row.start_date).days
+
+
+def _is_set(bitmap: bytes, index: int) -> bool:
+    byte_index = index >> 3
+    return 0 <= index and byte_index < len(bitmap) and bool(bitmap[byte_index] & (1 << (index & 7)))
+
+
+class StreakService:
+    """基于学习日位图的连续学习统计"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def _get(self, user_id: int, for_update: bool = False) -> Optional[UserActivityDays]:
+        # 会话未开启autoflush，先查找本事务中尚未写入的新行
+        for obj in self.db.new:
+            if isinstance(obj, UserActivityDays) and obj.user_id == user_id:
+                return obj
+        query = self.db.query(UserActivityDays).filter(UserActivityDays.user_id == user_id)
+        if for_update:
+            query = query.with_for_update()
+        return query.first()
+
+    def mark_active(self, user_id: int, day: Optional[date] = None) -> UserActivityDays:
+        """标记某天有学习记录，并增量更新连续天数（不提交事务）"""
+        day = day or datetime.now().date()
+        row = self._get(user_id, for_update=True)
+        if row is None:
+            # 并发的首次写入由唯一约束去重，不会抛出 IntegrityError
+            self.db.execute(insert_ignoring_conflicts(self.db, UserActivityDays), [{
+                "user_id": user_id,
+                "start_date": day,
+                "day_bitmap": b"",
+                "current_streak": 0,
+                "longest_streak": 0,
+                "active_days": 0
+            }])
+            row = self._get(user_id, for_update=True)
+
+        if row.day_bitmap and _is_set(row.day_bitmap, _day_index(row, day)):
+            return row
+
+        previous_longest = row.longest_streak or 0
+        self._set_bit(row, day)
+        row.active_days = (row.active_days or 0) + 1
+
+        last = row.last_active_date
+        if last is None or day == last + timedelta(days=1):
+            row.current_streak = (row.current_streak or 0) + 1
+            row.last_active_date = day
+        elif day > last:
+            row.current_streak = 1
+            row.last_active_date = day
+        else:
+            # 补录过去的日期可能连接两段连续区间，此时重新计算
+            self._recompute_streaks(row)
+
+        row.longest_streak = max(row.longest_streak or 0, row.current_streak or 0)
+        if row.longest_streak > previous_longest:
+            self._award_streak_achievements(user_id, row.longest_streak)
+        return row
+
+    def _set_bit(self, row: UserActivityDays, day: date):
+        bitmap = bytearray(row.day_bitmap or b"")
+        index = _day_index(row, day)
+        if index < 0:
+            # 向前扩展整字节，保持已有位不动
+            shift_bytes = (-index + 7) >> 3
+            bitmap = bytearray(shift_bytes) + bitmap
+            row.start_date = row.start_date - timedelta(days=shift_bytes * 8)
+            index = _day_index(row, day)
+        byte_index = index >> 3
+        if byte_index >= len(bitmap):
+            bitmap.extend(bytes(byte_index - len(bitmap) + 1))
+        bitmap[byte_index] |= 1 << (index & 7)
+        row.day_bitmap = bytes(bitmap)
+
+    def _recompute_streaks(self, row: UserActivityDays):
+        """从位图重新计算当前与最长连续天数"""
+        bits = int.from_bytes(row.day_bitmap or b"", "little")
+        longest = run = 0
+        last_index = -1
+        index = 0
+        while bits >> index:
+            if (bits >> index) & 1:
+                run += 1
+                last_index = index
+                longest = max(longest, run)
+            else:
+                run = 0
+            index += 1
+
+        # 循环在最高的置位处结束，末段即截至最近学习日期的连续天数
+        row.longest_streak = max(row.longest_streak or 0, longest)
+        row.current_streak = run
+        row.last_active_date = row.start_date + timedelta(days=last_index) if last_index >= 0 else None
+
+    def _award_streak_achievements(self, user_id: int, streak: int):
+        """连续天数达到里程碑时发放成就"""
+        reached = [days for days in STREAK_MILESTONES if days <= streak]
+        if not reached:
+            return
+        titles = [STREAK_MILESTONES[days][0] for days in reached]
+        existing = {
+            title for (title,) in self.db.query(Achievement.title).filter(
+                Achievement.user_id == user_id,
+                Achievement.achievement_type == STREAK_ACHIEVEMENT_TYPE,
+                Achievement.title.in_(titles)
+            ).all()
+        }
+        for days in reached:
+            title, points = STREAK_MILESTONES[days]
+            if title in existing:
+                continue
+            self.db.add(Achievement(
+                user_id=user_id,
+                achievement_type=STREAK_ACHIEVEMENT_TYPE,
+                title=title,
+                description=f"连续{days}天坚持学习",
+                points=points
+            ))
+
+    def get_streaks(self, user_id: int, today: Optional[date] = None) -> Dict[str, int]:
+        """获取当前连续天数、最长连续天数与累计学习天数"""
+        today = today or datetime.now().date()
+        row = self._get(user_id)
+        if row is None:
+            return {"current_streak": 0, "longest_streak": 0, "active_days": 0}
+
+        # 今天尚未学习时，昨天为止的连续天数仍然有效
+        current = row.current_streak or 0
+        if row.last_active_date is None or row.last_active_date < today - timedelta(days=1):
+            current = 0
+        return {
+            "current_streak": current,
+            "longest_streak": row.longest_streak or 0,
+            "active_days": row.active_days or 0
+        }
+
+    def count_active_days(self, user_id: int, start_date: date, end_date: date) -> int:
+        """统计日期区间（含两端）内的学习天数"""
+        row = self._get(user_id)
+        if row is None or not row.day_bitmap:
+            return 0
+        start = max(_day_index(row, start_date), 0)
+        end = min(_day_index(row, end_date), len(row.day_bitmap) * 8 - 1)
+        if end < start:
+            return 0
+        window = row.day_bitmap[start >> 3:(end >> 3) + 1]
+        bits = int.from_bytes(window, "little") >> (start & 7)
+        return (bits & ((1 << (end - start + 1)) - 1)).bit_count()
+
+    def rebuild(self, user_ids: Iterable[int]):
+        """根据每日汇总重建学习日位图（不发放成就，不提交事务）"""
+        for user_id in user_ids:
+            days = [
+                activity_date for (activity_date,) in self.db.query(DailyUserActivity.activity_date).filter(
+                    DailyUserActivity.user_id == user_id
+                ).order_by(DailyUserActivity.activity_date).all()
+            ]
+            row = self._get(user_id, for_update=True)
+            if not days:
+                if row is not None:
+                    self.db.delete(row)
+                continue
+            if row is None:
+                row = UserActivityDays(user_id=user_id)
+                self.db.add(row)
+
+            row.start_date = days[0]
+            row.day_bitmap = b""
+            for day in days:
+                self._set_bit(row, day)
+            row.active_days = len(days)
+            row.longest_streak = 0
+            self._recompute_streaks(row)
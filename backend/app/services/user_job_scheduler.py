@@ -0,0 +1,172 @@
+import heapq
+import logging
+import time
+import zlib
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from config import settings
+from database import SessionLocal
+from app.models.user import User
+from app.services.job_runner import JobRunner
+
+logger = logging.getLogger(__name__)
+
+
+def user_zone(name: Optional[str]) -> ZoneInfo:
+    """用户时区，未设置或无效时使用默认时区"""
+    try:
+        return ZoneInfo(name or settings.default_timezone)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo(settings.default_timezone)
+
+
+class PerUserJobScheduler:
+    """按用户本地时间分散执行的每日任务
+
+    每个用户的执行时间 = 本地日期的起始时间 + 按用户ID哈希得到的固定偏移，
+    所有用户的下次到期时间保存在最小堆中，调度器每次轮询只取出已到期的一批，
+    使负载在窗口内保持平稳，而不是在某个整点集中爆发。
+    处理函数返回 (处理数, 失败的用户ID)；执行失败的批次和失败的用户按指数退避重试同一本地日期。
+    """
+
+    def __init__(
+        self,
+        job_name: str,
+        handler: Callable[[date, List[int]], Tuple[int, List[int]]],
+        local_time: Optional[str] = None,
+        window_minutes: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        refresh_seconds: Optional[int] = None,
+        job_runner: Optional[JobRunner] = None
+    ):
+        self.job_name = job_name
+        self.handler = handler
+        self.local_time = datetime.strptime(local_time or settings.report_local_time, "%H:%M").time()
+        self.window_seconds = max((window_minutes if window_minutes is not None else settings.report_stagger_minutes) * 60, 1)
+        self.batch_size = batch_size or settings.user_schedule_batch_size
+        self.refresh_seconds = refresh_seconds or settings.user_schedule_refresh_seconds
+        self.job_runner = job_runner or JobRunner()
+
+        self._heap: List[Tuple[float, int, date]] = []  # (到期时间戳, 用户ID, 本地日期)
+        self._due: Dict[int, Tuple[float, date]] = {}  # 用户当前有效的到期项，堆中其余项为过期项
+        self._timezones: Dict[int, Optional[str]] = {}
+        self._failures: Dict[int, int] = {}  # 用户在当前本地日期上连续失败的次数
+        self._loaded_at: Optional[float] = None
+
+    def offset_seconds(self, user_id: int) -> int:
+        """用户在窗口内的固定偏移（跨进程、跨重启保持一致）"""
+        return zlib.crc32(f"{self.job_name}:{user_id}".encode()) % self.window_seconds
+
+    def due_at(self, user_id: int, tz_name: Optional[str], local_date: date) -> float:
+        """用户某个本地日期的执行时间戳"""
+        start = datetime.combine(local_date, self.local_time, tzinfo=user_zone(tz_name))
+        return (start + timedelta(seconds=self.offset_seconds(user_id))).timestamp()
+
+    def refresh(self, now: Optional[float] = None):
+        """从数据库加载活跃用户及其时区，新用户从本地当天开始排期（当天已过则立即补执行）"""
+        now = now or time.time()
+        db = SessionLocal()
+        try:
+            rows = db.query(User.id, User.timezone).filter(User.is_active == True).yield_per(1000)
+            timezones = {user_id: tz_name for user_id, tz_name in rows}
+        finally:
+            db.close()
+
+        for user_id in list(self._due):
+            if user_id not in timezones:
+                del self._due[user_id]
+                self._timezones.pop(user_id, None)
+                self._failures.pop(user_id, None)
+
+        for user_id, tz_name in timezones.items():
+            current = self._due.get(user_id)
+            if current is not None and self._timezones.get(user_id) == tz_name:
+                continue
+            local_date = datetime.fromtimestamp(now, timezone.utc).astimezone(user_zone(tz_name)).date()
+            if current is not None:
+                # 时区变更时保留原本的本地日期，避免重复或跳过
+                local_date = current[1]
+            self._timezones[user_id] = tz_name
+            self._push(user_id, local_date)
+
+        # 过期项过多时重建堆
+        if len(self._heap) > 2 * len(self._due) + 1000:
+            self._heap = [(due, user_id, local_date) for user_id, (due, local_date) in self._due.items()]
+            heapq.heapify(self._heap)
+
+        self._loaded_at = now
+        logger.info(f"{self.job_name} 已排期 {len(self._due)} 个用户")
+
+    def _push(self, user_id: int, local_date: date, due: Optional[float] = None):
+        if due is None:
+            due = self.due_at(user_id, self._timezones.get(user_id), local_date)
+        self._due[user_id] = (due, local_date)
+        heapq.heappush(self._heap, (due, user_id, local_date))
+
+    def _retry(self, user_id: int, local_date: date, now: float):
+        """失败的用户按指数退避重试同一本地日期，超过重试次数后排期到下一天"""
+        attempts = self._failures.get(user_id, 0) + 1
+        if attempts > settings.user_schedule_max_retries:
+            logger.warning(f"{self.job_name} 用户 {user_id} 的 {local_date} 重试 {attempts - 1} 次仍失败，放弃")
+            self._failures.pop(user_id, None)
+            self._push(user_id, local_date + timedelta(days=1))
+            return
+        self._failures[user_id] = attempts
+        delay = min(
+            settings.user_schedule_retry_seconds * 2 ** (attempts - 1), settings.user_schedule_retry_max_seconds
+        )
+        self._push(user_id, local_date, now + delay)
+
+    def pop_due(self, now: Optional[float] = None) -> List[Tuple[int, date]]:
+        """取出已到期的用户（最多 batch_size 个）"""
+        now = now or time.time()
+        due_users = []
+        while self._heap and self._heap[0][0] <= now and len(due_users) < self.batch_size:
+            due, user_id, local_date = heapq.heappop(self._heap)
+            if self._due.get(user_id) == (due, local_date):
+                due_users.append((user_id, local_date))
+        return due_users
+
+    def tick(self, now: Optional[float] = None) -> int:
+        """处理一批到期用户，返回处理数；由调度器轮询调用"""
+        now = now or time.time()
+        if self._loaded_at is None or now - self._loaded_at >= self.refresh_seconds:
+            self.refresh(now)
+
+        due_users = self.pop_due(now)
+        if not due_users:
+            return 0
+
+        groups: Dict[date, List[int]] = defaultdict(list)
+        for user_id, local_date in due_users:
+            groups[local_date].append(user_id)
+
+        processed = 0
+        for local_date, user_ids in sorted(groups.items()):
+            failed_users: List[int] = list(user_ids)
+
+            def run_batch() -> int:
+                count, failed = self.handler(local_date, user_ids)
+                failed_users[:] = failed
+                return count
+
+            record = self.job_runner.run(self.job_name, None, run_batch)
+            if record is None:
+                # 其他进程正在处理，保留到期项下次再试；处理函数会跳过已完成的用户
+                for user_id in user_ids:
+                    due, _ = self._due[user_id]
+                    heapq.heappush(self._heap, (due, user_id, local_date))
+                continue
+            processed += record["rows_processed"]
+            # 整批执行失败（异常或租约丢失）时所有用户重试；处理函数会跳过已完成的用户
+            failed = set(user_ids) if record["status"] == "failed" else set(failed_users)
+            for user_id in user_ids:
+                if user_id in failed:
+                    self._retry(user_id, local_date, now)
+                else:
+                    self._failures.pop(user_id, None)
+                    self._push(user_id, local_date + timedelta(days=1))
+        return processed
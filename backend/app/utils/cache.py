@@ -0,0 +1,55 @@
+import threading
+import time
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """进程内带过期时间的缓存"""
+
+    def __init__(self, ttl: int, max_size: int = 10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data: Dict[Hashable, Tuple[Any, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """获取缓存值，过期或不存在时返回None"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[int] = None):
+        """设置缓存值"""
+        expires_at = time.monotonic() + (ttl if ttl is not None else self.ttl)
+        with self._lock:
+            if key not in self._data and len(self._data) >= self.max_size:
+                self._evict()
+            self._data[key] = (value, expires_at)
+
+    def delete(self, key: Hashable):
+        """删除缓存值"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _evict(self):
+        """清理过期项，仍然满额时淘汰最早写入的一项"""
+        now = time.monotonic()
+        expired = [k for k, (_, expires_at) in self._data.items() if expires_at <= now]
+        for key in expired:
+            del self._data[key]
+        if len(self._data) >= self.max_size:
+            del self._data[next(iter(self._data))]
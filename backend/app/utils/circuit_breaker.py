@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """熔断器：滑动时间窗口内失败率超过阈值时断开，冷却后半开放行少量试探请求，成功则恢复"""
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate: float = 0.5,
+        window_seconds: float = 60,
+        min_calls: int = 4,
+        open_seconds: float = 30,
+        half_open_max_calls: int = 1
+    ):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self.state = CLOSED
+        self._results: Deque[Tuple[float, bool]] = deque()  # (时间, 是否成功)
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._last_error: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def _trim(self, now: float):
+        while self._results and now - self._results[0][0] > self.window_seconds:
+            self._results.popleft()
+
+    def _open(self, now: float):
+        self.state = OPEN
+        self._opened_at = now
+        self._half_open_calls = 0
+
+    def _close(self):
+        self.state = CLOSED
+        self._results.clear()
+        self._half_open_calls = 0
+
+    def cooling_down(self) -> bool:
+        """是否处于断开且冷却未结束的状态"""
+        with self._lock:
+            return self.state == OPEN and time.monotonic() - self._opened_at < self.open_seconds
+
+    def _trial_slots_full(self, now: float) -> bool:
+        # 试探请求被取消时不会回报结果，超过冷却时间仍未回报的名额视为作废
+        if now - self._opened_at >= self.open_seconds:
+            self._opened_at = now
+            self._half_open_calls = 0
+        return self._half_open_calls >= self.half_open_max_calls
+
+    def available(self) -> bool:
+        """是否可能放行请求（不占用半开试探名额）"""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == OPEN:
+                return now - self._opened_at >= self.open_seconds
+            return self.state == CLOSED or not self._trial_slots_full(now)
+
+    def allow(self) -> bool:
+        """是否允许发出请求；冷却结束后转为半开，只放行有限个试探请求"""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if now - self._opened_at < self.open_seconds:
+                    return False
+                self.state = HALF_OPEN
+                self._opened_at = now
+                self._half_open_calls = 0
+            if self._trial_slots_full(now):
+                return False
+            self._half_open_calls += 1
+            return True
+
+    def record_success(self):
+        now = time.monotonic()
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._close()
+                return
+            self._results.append((now, True))
+            self._trim(now)
+
+    def record_failure(self, error: Optional[str] = None):
+        now = time.monotonic()
+        with self._lock:
+            self._last_error = error
+            if self.state == HALF_OPEN:
+                self._open(now)
+                return
+            if self.state == OPEN:
+                return
+            self._results.append((now, False))
+            self._trim(now)
+            failures = sum(1 for _, success in self._results if not success)
+            if len(self._results) >= self.min_calls and failures / len(self._results) >= self.failure_rate:
+                self._open(now)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前状态，用于健康检查"""
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            calls = len(self._results)
+            failures = sum(1 for _, success in self._results if not success)
+            return {
+                "state": self.state,
+                "window_calls": calls,
+                "window_failures": failures,
+                "failure_rate": round(failures / calls, 3) if calls else 0.0,
+                "retry_in_seconds": (
+                    max(0, round(self.open_seconds - (now - self._opened_at), 1)) if self.state == OPEN else 0
+                ),
+                "last_error": self._last_error
+            }
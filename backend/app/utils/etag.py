@@ -0,0 +1,299 @@
+import hashlib
+import logging
+import threading
+import uuid
+from datetime import date
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+import jwt
+from fastapi import HTTPException, Request, Response, status
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from config import settings
+from app.utils.principal_cache import decode_token
+
+logger = logging.getLogger(__name__)
+
+VersionKey = Tuple[Hashable, ...]
+
+# 进程启动标识：重启后内存计数器归零，旧ETag不应再命中
+_BOOT_ID = uuid.uuid4().hex[:8]
+_PENDING_KEY = "etag_pending_versions"
+
+
+class _MemoryVersionStore:
+    """进程内数据版本计数器"""
+
+    def __init__(self):
+        self._versions: Dict[VersionKey, int] = {}
+        self._lock = threading.Lock()
+
+    tag = _BOOT_ID
+
+    def bump(self, keys: Iterable[VersionKey]) -> Dict[VersionKey, int]:
+        with self._lock:
+            for key in keys:
+                self._versions[key] = self._versions.get(key, 0) + 1
+            return {key: self._versions[key] for key in keys}
+
+    def get_many(self, keys: List[VersionKey]) -> List[int]:
+        with self._lock:
+            return [self._versions.get(key, 0) for key in keys]
+
+
+class _RedisVersionStore:
+    """Redis数据版本计数器（多进程部署时共享）"""
+
+    prefix = "etag:version:"
+
+    def __init__(self, url: str):
+        import redis
+        self._client = redis.Redis.from_url(url)
+
+    def _name(self, key: VersionKey) -> str:
+        return self.prefix + ":".join(str(part) for part in key)
+
+    tag = "r"
+
+    def bump(self, keys: Iterable[VersionKey]) -> Dict[VersionKey, int]:
+        keys = list(keys)
+        pipe = self._client.pipeline()
+        for key in keys:
+            pipe.incr(self._name(key))
+        return dict(zip(keys, pipe.execute()))
+
+    def get_many(self, keys: List[VersionKey]) -> List[int]:
+        values = self._client.mget([self._name(key) for key in keys])
+        return [int(value or 0) for value in values]
+
+
+def _create_store():
+    if settings.redis_url:
+        try:
+            return _RedisVersionStore(settings.redis_url)
+        except Exception as e:
+            logger.warning(f"Redis版本计数器不可用，使用进程内计数器: {e}")
+    return _MemoryVersionStore()
+
+
+_store = _create_store()
+
+
+def bump_version(*keys: VersionKey):
+    """立即递增数据版本"""
+    _store.bump(keys)
+
+
+def data_versions(*keys: VersionKey) -> Optional[Tuple[int, ...]]:
+    """读取数据版本，供进程内缓存校验（多进程部署时 Redis 计数器反映其他进程的写入）；读取失败返回None"""
+    try:
+        return tuple(_store.get_many(list(keys)))
+    except Exception as e:
+        logger.warning(f"读取数据版本失败: {e}")
+        return None
+
+
+def mark_changed(db: Session, *keys: VersionKey):
+    """登记数据版本变更，事务提交后才递增，回滚则丢弃"""
+    db.info.setdefault(_PENDING_KEY, set()).update(keys)
+
+
+_commit_listeners: List[Callable[[Session, Dict[VersionKey, Optional[int]]], None]] = []
+
+
+def on_versions_changed(listener: Callable[[Session, Dict[VersionKey, Optional[int]]], None]):
+    """注册事务提交后的回调，参数为会话和 {本次变更的版本键: 递增后的版本（更新失败时为None）}，
+    用于同步清理依赖这些数据的进程内缓存"""
+    _commit_listeners.append(listener)
+    return listener
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_pending_versions(session: Session):
+    pending = session.info.pop(_PENDING_KEY, None) or set()
+    versions: Dict[VersionKey, Optional[int]] = dict.fromkeys(pending)
+    if pending:
+        try:
+            versions.update(_store.bump(pending))
+        except Exception as e:
+            logger.error(f"更新数据版本失败: {e}")
+    for listener in _commit_listeners:
+        try:
+            listener(session, versions)
+        except Exception as e:
+            logger.error(f"数据版本变更回调失败: {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_versions(session: Session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def user_scope(user_id: int) -> VersionKey:
+    return ("user", user_id)
+
+
+def question_scope(question_id: int) -> VersionKey:
+    return ("question", question_id)
+
+
+def exam_scope(exam_id: int) -> VersionKey:
+    return ("exam", exam_id)
+
+
+QUESTION_SET_SCOPE: VersionKey = ("question_set",)
+CATEGORY_SCOPE: VersionKey = ("categories",)
+
+_QUESTION_USAGE_FIELDS = {"usage_count", "success_rate", "updated_at"}
+
+
+def token_user_id(request: Request) -> Optional[int]:
+    """仅校验JWT签名取出用户ID，不查询数据库"""
+    authorization = request.headers.get("Authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        payload = decode_token(token)
+    except jwt.PyJWTError:
+        return None
+    user_id = payload.get("uid")
+    return int(user_id) if user_id is not None else None
+
+
+class ETagGuard:
+    """按路由启用的条件GET依赖
+
+    根据数据版本计算ETag，If-None-Match 命中时在进入数据库前直接返回304。
+    需放在路由的 dependencies 中，保证先于数据库依赖执行。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        scopes: Callable[[Request], Optional[List[VersionKey]]],
+        per_user: bool = False,
+        authenticated: bool = False,
+        daily: bool = False
+    ):
+        self.name = name
+        self.scopes = scopes
+        self.per_user = per_user
+        self.authenticated = authenticated or per_user
+        self.daily = daily
+
+    def compute_etag(self, request: Request) -> Optional[str]:
+        keys = list(self.scopes(request) or [])
+        parts = [self.name, str(request.url.path), str(request.url.query)]
+        if self.authenticated:
+            # 令牌无效时不参与协商，交给路由自身的鉴权处理
+            user_id = token_user_id(request)
+            if user_id is None:
+                return None
+        if self.per_user:
+            keys.append(user_scope(user_id))
+            parts.append(str(user_id))
+        if self.daily:
+            # 按天统计的数据跨日后自然变化
+            parts.append(date.today().isoformat())
+        parts.extend(f"{_store.tag}.{version}" for version in _store.get_many(keys))
+        digest = hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:20]
+        return f'W/"{digest}"'
+
+    def __call__(self, request: Request, response: Response):
+        try:
+            etag = self.compute_etag(request)
+        except Exception as e:
+            logger.warning(f"计算ETag失败: {e}")
+            return
+        if etag is None:
+            return
+
+        if_none_match = request.headers.get("If-None-Match", "")
+        candidates = {tag.strip() for tag in if_none_match.split(",")}
+        if etag in candidates or "*" in candidates:
+            raise HTTPException(
+                status_code=status.HTTP_304_NOT_MODIFIED,
+                headers={"ETag": etag}
+            )
+        response.headers["ETag"] = etag
+
+
+def path_param_scope(
+    builder: Callable[[int], VersionKey], param: str, *extra: VersionKey
+) -> Callable[[Request], List[VersionKey]]:
+    """根据路径参数生成版本键，可附加固定的版本键"""
+    def scopes(request: Request) -> List[VersionKey]:
+        return [builder(int(request.path_params[param])), *extra]
+    return scopes
+
+
+def static_scope(*keys: VersionKey) -> Callable[[Request], List[VersionKey]]:
+    """固定的版本键"""
+    return lambda request: list(keys)
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_changed_versions(session: Session, flush_context, instances):
+    """根据待写入的对象登记受影响的数据版本"""
+    from app.models.activity import DailyUserActivity
+    from app.models.exam import Exam, ExamResult
+    from app.models.learning import Achievement, LearningPlan, LearningProgress, LearningTask
+    from app.models.question import Question, QuestionCategory, UserAnswer, PracticeSession, ExamQuestion
+    from app.models.user import StudySession, WrongQuestion
+
+    user_owned = (
+        DailyUserActivity, Achievement, LearningPlan, LearningProgress,
+        UserAnswer, PracticeSession, StudySession, WrongQuestion
+    )
+
+    keys = set()
+    task_plan_ids = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, user_owned):
+            if obj.user_id is not None:
+                keys.add(user_scope(obj.user_id))
+        elif isinstance(obj, ExamResult):
+            if obj.student_id is not None:
+                keys.add(user_scope(obj.student_id))
+        elif isinstance(obj, Question):
+            if obj.id is not None:
+                keys.add(question_scope(obj.id))
+            # 答题只会更新使用次数和正确率，不影响题目集合与题目内容
+            if obj in session.new or obj in session.deleted or any(
+                attr.history.has_changes() for attr in inspect(obj).attrs
+                if attr.key not in _QUESTION_USAGE_FIELDS
+            ):
+                keys.add(QUESTION_SET_SCOPE)
+        elif isinstance(obj, QuestionCategory):
+            keys.update((CATEGORY_SCOPE, QUESTION_SET_SCOPE))
+        elif isinstance(obj, Exam):
+            if obj.id is not None:
+                keys.add(exam_scope(obj.id))
+        elif isinstance(obj, ExamQuestion):
+            if obj.exam_id is not None:
+                keys.add(exam_scope(obj.exam_id))
+        elif isinstance(obj, LearningTask):
+            # 学习任务没有 user_id，归属于所在计划的用户；移到其他计划时新旧计划的用户都受影响
+            attrs = inspect(obj).attrs
+            history = attrs.plan_id.history
+            task_plan_ids.update(
+                plan_id for plan_id in (*history.added, *history.unchanged, *history.deleted)
+                if plan_id is not None
+            )
+            # 通过关系关联、尚未写入 plan_id 的任务（不触发懒加载）
+            plan = attrs.learning_plan.loaded_value
+            if isinstance(plan, LearningPlan) and plan.user_id is not None:
+                keys.add(user_scope(plan.user_id))
+
+    if task_plan_ids:
+        with session.no_autoflush:
+            keys.update(
+                user_scope(user_id) for (user_id,) in session.query(LearningPlan.user_id).filter(
+                    LearningPlan.id.in_(task_plan_ids), LearningPlan.user_id.isnot(None)
+                )
+            )
+
+    if keys:
+        mark_changed(session, *keys)
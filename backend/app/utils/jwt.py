@@ -1,3 +1,5 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 
@@ -9,12 +11,19 @@ from fastapi.security import OAuth2PasswordBearer
 from config import settings
 from app.models.user import User
 from app.schemas.auth import TokenData
+from app.utils.principal_cache import decode_token, resolve_user
+from app.services.ai_usage_service import set_current_user
 from database import get_db
 from sqlalchemy.orm import Session
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
+# bcrypt计算期间释放GIL，放到有界线程池中执行，避免阻塞事件循环
+_password_executor = ThreadPoolExecutor(max_workers=settings.password_hash_workers,
+                                        thread_name_prefix="password-hash")
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(plain_password.encode('utf-8'),
                           hashed_password.encode('utf-8'))
@@ -22,7 +31,20 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 
 def get_password_hash(password: str) -> str:
     return bcrypt.hashpw(password.encode('utf-8'),
-                         bcrypt.gensalt()).decode('utf-8')
+                         bcrypt.gensalt(rounds=settings.bcrypt_rounds)).decode('utf-8')
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """在密码线程池中校验密码"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_password_executor, verify_password,
+                                      plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """在密码线程池中计算密码哈希"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_password_executor, get_password_hash, password)
 
 
 def create_access_token(data: dict,
@@ -47,9 +69,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme),
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token,
-                             settings.secret_key,
-                             algorithms=[settings.algorithm])
+        payload = decode_token(token)
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
@@ -57,7 +77,8 @@ async def get_current_user(token: str = Depends(oauth2_scheme),
     except jwt.PyJWTError:
         raise credentials_exception
 
-    user = db.query(User).filter(User.username == token_data.username).first()
+    user = resolve_user(db, token_data.username)
     if user is None:
         raise credentials_exception
+    set_current_user(user.id)
     return user
@@ -0,0 +1,81 @@
+import time
+from typing import Any, Dict, Optional
+
+import jwt
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from config import settings
+from app.models.user import User
+from app.utils.cache import TTLCache
+
+# 令牌 -> 解码后的payload；用户名(sub) -> 用户列值快照
+_token_cache = TTLCache(ttl=settings.auth_cache_ttl)
+_principal_cache = TTLCache(ttl=settings.auth_cache_ttl)
+_PENDING_KEY = "principal_cache_pending_invalidations"
+
+
+def decode_token(token: str) -> Dict[str, Any]:
+    """解码并校验JWT，结果缓存到令牌过期为止（最长 auth_cache_ttl 秒）；校验失败抛出 jwt.PyJWTError"""
+    payload = _token_cache.get(token)
+    if payload is not None:
+        if payload.get("exp") is None or payload["exp"] > time.time():
+            return payload
+        _token_cache.delete(token)
+
+    payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+    ttl = settings.auth_cache_ttl
+    if payload.get("exp") is not None:
+        ttl = min(ttl, int(payload["exp"] - time.time()))
+    if ttl > 0:
+        _token_cache.set(token, payload, ttl)
+    return payload
+
+
+def resolve_user(db: Session, username: str) -> Optional[User]:
+    """按用户名获取当前会话中的用户对象，命中缓存时不查询数据库"""
+    snapshot = _principal_cache.get(username)
+    if snapshot is None:
+        user = db.query(User).filter(User.username == username).first()
+        if user is not None:
+            _principal_cache.set(username, {
+                attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs
+            })
+        return user
+
+    # 由快照重建已持久化状态的对象并并入当前会话，不触发SELECT；关系属性仍可按需加载
+    user = User(**snapshot)
+    make_transient_to_detached(user)
+    return db.merge(user, load=False)
+
+
+def invalidate_user(username: str):
+    _principal_cache.delete(username)
+
+
+def invalidate_all():
+    """清空用户缓存（集合更新等绕过ORM事件的修改之后调用）"""
+    _principal_cache.clear()
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_changed_users(session: Session, flush_context, instances):
+    """用户被修改或删除时登记失效，事务提交后生效"""
+    changed = [obj for obj in list(session.dirty) + list(session.deleted) if isinstance(obj, User)]
+    if not changed:
+        return
+    pending = session.info.setdefault(_PENDING_KEY, set())
+    for user in changed:
+        history = inspect(user).attrs.username.history
+        pending.update(name for name in (user.username, *history.deleted) if name)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_invalidations(session: Session):
+    for username in session.info.pop(_PENDING_KEY, ()):
+        invalidate_user(username)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_invalidations(session: Session):
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,132 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucketLimiter:
+    """进程内令牌桶限流：每个键最多积累 capacity 个令牌，按固定速率恢复"""
+
+    def __init__(self, capacity: int, refill_per_second: float, max_keys: int = 100000):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[Hashable, Tuple[float, float]]" = OrderedDict()  # 键 -> (令牌数, 上次更新时间)
+        self._lock = threading.Lock()
+
+    def allow(self, key: Hashable, cost: float = 1.0) -> bool:
+        """尝试消耗令牌，不足时返回False"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (float(self.capacity), now))
+            tokens = min(self.capacity, tokens + (now - updated_at) * self.refill_per_second)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            # 按最近使用顺序淘汰，令牌已满的桶被淘汰不影响限流效果
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return allowed
+
+    def consume(self, key: Hashable, cost: float):
+        """无条件扣除令牌，余额可以为负（之后需等待恢复），用于请求完成后按实际用量结算"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (float(self.capacity), now))
+            tokens = min(self.capacity, tokens + (now - updated_at) * self.refill_per_second)
+            self._buckets[key] = (tokens - cost, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+
+    def retry_after(self, key: Hashable, cost: float = 1.0) -> int:
+        """距离下次可用的秒数"""
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (float(self.capacity), time.monotonic()))
+        tokens = min(self.capacity, tokens + (time.monotonic() - updated_at) * self.refill_per_second)
+        if tokens >= cost or self.refill_per_second <= 0:
+            return 0
+        return int((cost - tokens) / self.refill_per_second) + 1
+
+    def reset(self, key: Hashable):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+
+# 原子地恢复并扣除令牌：mode 为 allow（不足时不扣）、consume（无条件扣除）或 peek（只读）
+_BUCKET_SCRIPT = """
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local mode = ARGV[5]
+local tokens = tonumber(bucket[1]) or capacity
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+local allowed = 1
+if mode == 'allow' then
+    if tokens >= cost then tokens = tokens - cost else allowed = 0 end
+elseif mode == 'consume' then
+    tokens = tokens - cost
+end
+if mode ~= 'peek' then
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+    redis.call('EXPIRE', KEYS[1], tonumber(ARGV[6]))
+end
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisTokenBucketLimiter(TokenBucketLimiter):
+    """Redis令牌桶：多个进程共享同一份额度；Redis不可用时退回进程内令牌桶"""
+
+    def __init__(self, url: str, prefix: str, capacity: int, refill_per_second: float):
+        super().__init__(capacity, refill_per_second)
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(_BUCKET_SCRIPT)
+        self.prefix = prefix
+        # 令牌恢复满之后桶的状态不再需要保留
+        self._ttl = int(capacity / refill_per_second) + 60 if refill_per_second > 0 else 86400
+
+    def _eval(self, key: Hashable, cost: float, mode: str) -> Tuple[bool, float]:
+        allowed, tokens = self._script(
+            keys=[f"{self.prefix}{key}"],
+            args=[self.capacity, self.refill_per_second, time.time(), cost, mode, self._ttl]
+        )
+        return bool(allowed), float(tokens)
+
+    def allow(self, key: Hashable, cost: float = 1.0) -> bool:
+        try:
+            return self._eval(key, cost, "allow")[0]
+        except Exception as e:
+            logger.warning(f"Redis限流不可用，使用进程内令牌桶: {e}")
+            return super().allow(key, cost)
+
+    def consume(self, key: Hashable, cost: float):
+        try:
+            self._eval(key, cost, "consume")
+        except Exception as e:
+            logger.warning(f"Redis限流不可用，使用进程内令牌桶: {e}")
+            super().consume(key, cost)
+
+    def retry_after(self, key: Hashable, cost: float = 1.0) -> int:
+        try:
+            tokens = self._eval(key, cost, "peek")[1]
+        except Exception as e:
+            logger.warning(f"Redis限流不可用，使用进程内令牌桶: {e}")
+            return super().retry_after(key, cost)
+        if tokens >= cost or self.refill_per_second <= 0:
+            return 0
+        return int((cost - tokens) / self.refill_per_second) + 1
+
+    def reset(self, key: Hashable):
+        super().reset(key)
+        try:
+            self._client.delete(f"{self.prefix}{key}")
+        except Exception as e:
+            logger.warning(f"Redis限流不可用: {e}")
@@ -0,0 +1,109 @@
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from typing import Any, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+# 去掉空白与标点，保留文字、数字和运算符号（x+1 与 x-1、a>b 与 a<b 是不同的问题）
+_NOISE_PATTERN = re.compile(r"[^\w+\-*/=<>^()]+|_+", re.UNICODE)
+# 礼貌用语和“是什么”一类的套话不影响问题含义，去掉后同一问题的不同问法更接近（长的在前，避免被短的截断）；
+# 如何/怎么/为什么/吗 决定了问的是方法、原因还是是非，不能去掉
+_FILLER_PATTERN = re.compile(
+    r"请问|请你|请|能不能|可不可以|能否|帮我|告诉我|解释一下|讲一下|说一下|介绍一下|一下|"
+    r"是什么意思|什么意思|是什么|什么是|什么叫|指的是|的含义|的定义|含义|定义|"
+    r"呢|吧|啊|呀"
+)
+# 数字（含小数）和运算符号：相似度无法区分“长5厘米”与“长6厘米”，只在两者完全相同时才视为同一问题
+_FORMULA_PATTERN = re.compile(r"\d+(?:\.\d+)?|[+\-*/=<>^()×÷%]")
+# 不同长度的字符n-gram权重：单字保证语序变化时仍相近，二/三字保留局部词序
+_NGRAM_WEIGHTS = {1: 0.5, 2: 1.0, 3: 1.0}
+
+
+def normalize_text(text: str) -> str:
+    text = _NOISE_PATTERN.sub("", text or "").lower()
+    stripped = _FILLER_PATTERN.sub("", text)
+    # 整句都是套话时保留原文，避免所有这类问题落到同一个空向量
+    return stripped or text
+
+
+def formula_signature(text: str) -> Tuple[str, ...]:
+    """问题中按顺序出现的数字和运算符号（全角转半角）"""
+    return tuple(_FORMULA_PATTERN.findall(unicodedata.normalize("NFKC", text or "")))
+
+
+def embed_text(text: str, dim: int) -> np.ndarray:
+    """字符n-gram哈希向量（带符号哈希，L2归一化），无需外部模型"""
+    vector = np.zeros(dim, dtype=np.float32)
+    normalized = normalize_text(text)
+    for n, weight in _NGRAM_WEIGHTS.items():
+        for i in range(len(normalized) - n + 1):
+            digest = zlib.crc32(normalized[i:i + n].encode("utf-8"))
+            sign = 1.0 if digest & 0x80000000 else -1.0
+            vector[digest % dim] += sign * weight
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+
+class SemanticCache:
+    """进程内语义缓存：向量存放在固定大小的矩阵中，查询时一次矩阵乘法求最相似项
+
+    namespace 用于隔离不能共用答案的请求（例如不同的用户水平或背景），只在同一命名空间内匹配；
+    每项同时记录数字和运算符号序列，相似度再高，数字或运算符号不同也不命中。
+    """
+
+    def __init__(self, dim: int, threshold: float, max_entries: int, ttl: Optional[int] = None):
+        self.dim = dim
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._vectors = np.zeros((max_entries, dim), dtype=np.float32)
+        # (命名空间, 数字和运算符号序列, 值, 写入时间)
+        self._entries: List[Optional[Tuple[Hashable, Tuple[str, ...], Any, float]]] = [None] * max_entries
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def get(self, text: str, namespace: Hashable = None) -> Optional[Tuple[Any, float]]:
+        """返回 (缓存值, 相似度)；没有超过阈值的项时返回None"""
+        query = embed_text(text, self.dim)
+        if not query.any():
+            return None
+        signature = formula_signature(text)
+        with self._lock:
+            scores = self._vectors @ query
+            now = time.monotonic()
+            for index in np.argsort(scores)[::-1]:
+                score = float(scores[index])
+                if score < self.threshold:
+                    return None
+                entry = self._entries[index]
+                if entry is None or entry[0] != namespace or entry[1] != signature:
+                    continue
+                if self.ttl is not None and now - entry[3] > self.ttl:
+                    continue
+                return entry[2], score
+        return None
+
+    def set(self, text: str, value: Any, namespace: Hashable = None):
+        """写入缓存，满额后按写入顺序覆盖最早的项"""
+        vector = embed_text(text, self.dim)
+        if not vector.any():
+            return
+        with self._lock:
+            index = self._next
+            self._vectors[index] = vector
+            self._entries[index] = (namespace, formula_signature(text), value, time.monotonic())
+            self._next = (index + 1) % self.max_entries
+
+    def clear(self):
+        with self._lock:
+            self._vectors[:] = 0
+            self._entries = [None] * self.max_entries
+            self._next = 0
+
+    def __len__(self) -> int:
+        return sum(1 for entry in self._entries if entry is not None)
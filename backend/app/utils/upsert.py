@@ -0,0 +1,15 @@
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+
+def insert_ignoring_conflicts(db: Session, model):
+    """INSERT 语句，唯一键冲突的行跳过（并发写入同一行时不报错）"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        return sqlite.insert(model).on_conflict_do_nothing()
+    if dialect == "postgresql":
+        return postgresql.insert(model).on_conflict_do_nothing()
+    if dialect in ("mysql", "mariadb"):
+        return insert(model).prefix_with("IGNORE")
+    return insert(model)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+为已有数据库的 questions 表添加 content_hash 列并回填（规范化题干的SHA-256），最后建立唯一索引
+
+重复题干只有ID最小的一条保留哈希，其余保持为空，不影响唯一索引。
+"""
+
+from sqlalchemy import inspect, text
+
+from database import engine
+from app.services.question_service import question_content_hash
+
+BATCH_SIZE = 1000
+
+
+def add_column():
+    columns = {column["name"] for column in inspect(engine).get_columns("questions")}
+    if "content_hash" in columns:
+        print("⚠️  字段已存在: content_hash")
+        return
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE questions ADD COLUMN content_hash VARCHAR(64)"))
+    print("✅ 添加字段: content_hash")
+
+
+def backfill():
+    with engine.begin() as conn:
+        seen = {
+            content_hash for (content_hash,) in conn.execute(
+                text("SELECT content_hash FROM questions WHERE content_hash IS NOT NULL")
+            )
+        }
+    last_id, filled, duplicates = 0, 0, 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(text(
+                "SELECT id, content FROM questions WHERE id > :last_id AND content_hash IS NULL "
+                "ORDER BY id LIMIT :limit"
+            ), {"last_id": last_id, "limit": BATCH_SIZE}).all()
+            if not rows:
+                break
+            updates = []
+            for question_id, content in rows:
+                content_hash = question_content_hash(content or "")
+                if content_hash in seen:
+                    duplicates += 1
+                    continue
+                seen.add(content_hash)
+                updates.append({"id": question_id, "content_hash": content_hash})
+            if updates:
+                conn.execute(text("UPDATE questions SET content_hash = :content_hash WHERE id = :id"), updates)
+            filled += len(updates)
+            last_id = rows[-1][0]
+    print(f"✅ 回填 {filled} 道题目，重复题干 {duplicates} 道")
+
+
+def create_index():
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS ix_questions_content_hash ON questions (content_hash)"
+        ))
+    print("✅ 唯一索引已建立: ix_questions_content_hash")
+
+
+if __name__ == "__main__":
+    add_column()
+    backfill()
+    create_index()
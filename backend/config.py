@@ -1,5 +1,5 @@
 import os
-from typing import Optional, List
+from typing import Optional, List, Dict
 from pydantic_settings import BaseSettings
 
 
@@ -16,6 +16,15 @@ class Settings(BaseSettings):
     secret_key: str = "your-secret-key-here"
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
+    auth_cache_ttl: int = 60  # 已认证用户及解码后令牌的缓存时间（秒）
+
+    # 登录安全配置
+    bcrypt_rounds: int = 12  # bcrypt成本因子，每加1计算时间翻倍
+    password_hash_workers: int = 4  # 密码哈希/校验线程池大小
+    login_rate_username_capacity: int = 5  # 单个用户名的突发登录次数
+    login_rate_username_per_minute: float = 5  # 单个用户名每分钟恢复的登录次数
+    login_rate_ip_capacity: int = 30  # 单个IP的突发登录次数
+    login_rate_ip_per_minute: float = 60  # 单个IP每分钟恢复的登录次数
 
     # CORS配置
     allowed_origins: list = [
@@ -70,6 +79,51 @@ class Settings(BaseSettings):
     ai_fallback_enabled: bool = True
     ai_cache_enabled: bool = True
     ai_cache_ttl: int = 3600  # 1小时
+    ai_breaker_failure_rate: float = 0.5  # 窗口内失败率达到该值时熔断服务商
+    ai_breaker_window_seconds: int = 60  # 失败率统计窗口（秒）
+    ai_breaker_min_calls: int = 4  # 窗口内至少有这么多次调用才判断失败率
+    ai_breaker_open_seconds: int = 30  # 熔断后的冷却时间，之后放行试探请求
+    ai_breaker_probe_interval: int = 15  # 后台试探熔断服务商的间隔（秒）
+    ai_breaker_probe_timeout: int = 5  # 试探请求超时（秒）
+    qa_semantic_cache_enabled: bool = True  # 实时问答按问题相似度复用答案
+    qa_semantic_cache_threshold: float = 0.9  # 余弦相似度达到该值才视为同一问题
+    qa_semantic_cache_size: int = 5000  # 相似度索引最多保留的问题数
+    qa_semantic_cache_dim: int = 2048  # 字符n-gram哈希向量维度
+
+    # AI调用调度配置（优先级：interactive 交互请求、near_real_time 后台任务、batch 定时任务）
+    llm_max_concurrency: int = 8  # 进程内同时进行的AI调用数（并发与优先级排队按进程计算，额度配置Redis后跨进程共享）
+    llm_priority_weights: Dict[str, int] = {"interactive": 6, "near_real_time": 3, "batch": 1}  # 排队时的加权轮询权重
+    llm_batch_max_share: float = 0.5  # 批量调用最多占用的并发比例
+    llm_batch_rate_reserve: float = 0.3  # 服务商RPM/TPM额度中为非批量调用预留的比例
+    llm_provider_rate_limits: Dict[str, Dict[str, int]] = {}  # 各服务商额度，例如 {"deepseek": {"rpm": 60, "tpm": 100000}}
+    llm_rate_max_wait: float = 10  # 所有服务商额度不足时最多等待的秒数
+
+    # 本地模拟AI服务商（压测和离线开发用，不消耗真实额度）
+    llm_stub_enabled: bool = False  # 启用后以模拟服务商替代真实服务商
+    llm_stub_providers: List[str] = ["deepseek"]  # 模拟的服务商名称，可配置多个以测试故障切换
+    llm_stub_seed: int = 0  # 随机种子，相同种子下同一请求序列的延迟和错误一致
+    llm_stub_latency_distribution: str = "lognormal"  # 延迟分布：fixed / uniform / lognormal
+    llm_stub_latency_ms: float = 800  # 延迟中位数（毫秒）
+    llm_stub_latency_spread: float = 0.5  # uniform 为上下浮动比例，lognormal 为对数标准差
+    llm_stub_error_rate: float = 0.0  # 返回错误（429/500/503）的比例
+    llm_stub_timeout_rate: float = 0.0  # 超时的比例
+    llm_stub_responses_file: Optional[str] = None  # 预设响应文件（JSON）：[{"match": "正则", "content": ...}]
+    llm_record_mode: Optional[str] = None  # record 录制真实响应 / replay 回放录制的响应
+    llm_record_file: str = "logs/llm_recordings.jsonl"
+    llm_replay_latency: bool = True  # 回放时按录制的耗时等待
+
+    # AI用量与配额配置（配额为0表示不限制，按自然日计算）
+    ai_user_daily_token_quota: int = 0  # 每个用户每天的token上限
+    ai_user_daily_call_quotas: Dict[str, int] = {}  # 每个用户每天各功能的调用次数上限，例如 {"real_time_qa": 200}
+    ai_feature_daily_token_quotas: Dict[str, int] = {}  # 各功能全站每天的token上限，例如 {"generate_exam": 2000000}
+    ai_usage_flush_calls: int = 50  # 累计多少次调用后写入数据库
+    ai_usage_flush_seconds: int = 30  # 距上次写入超过该秒数后写入数据库
+
+    # 语音识别配置（上传大小限制使用 max_file_size）
+    speech_recognizer: str = "mock"  # 识别后端，见 speech_service.register_recognizer
+    speech_sample_rate: int = 16000  # 送入识别后端的采样率（单声道）
+    speech_max_duration_seconds: int = 300  # 音频最长时长
+    speech_partial_interval: float = 1.0  # WebSocket 推送部分识别结果的最小间隔（音频秒数）
 
     # AI功能开关
     ai_question_generation: bool = True
@@ -88,6 +142,64 @@ class Settings(BaseSettings):
     smtp_username: Optional[str] = None
     smtp_password: Optional[str] = None
 
+    # 统计缓存配置
+    stats_cache_ttl: int = 600  # 用户练习统计快照缓存时间（秒）
+    dashboard_cache_ttl: int = 60  # 仪表板组件默认缓存时间（秒）
+    leaderboard_reload_seconds: int = 300  # 进程内榜单从数据库重建的间隔（秒），未配置Redis的多进程部署依赖它保持一致
+    leaderboard_week_retention_weeks: int = 2  # 周榜在周结束后保留的周数（Redis键到期自动删除）
+
+    # 报告批处理配置
+    report_chunk_size: int = 500  # 每批处理的用户数
+    report_concurrency: int = 20  # 每批内并发生成报告数（主要受AI调用限制）
+    report_process_workers: int = 0  # 大于0时按批次分发到多进程
+
+    # 定时任务配置
+    scheduler_enabled: bool = True  # Web进程内是否启动定时任务（使用独立 worker.py 时设为False）
+    scheduler_poll_seconds: int = 5  # 调度器检查到期任务的间隔（秒）
+    job_lease_seconds: int = 300  # 任务租约时长（秒），执行期间按三分之一周期续期
+    default_timezone: str = "Asia/Shanghai"  # 用户未设置时区时使用
+    report_local_time: str = "20:00"  # 每日报告按用户本地时间的起始生成时间
+    report_stagger_minutes: int = 120  # 各用户报告在起始时间后的分散窗口（分钟）
+    user_schedule_batch_size: int = 200  # 每次最多处理的到期用户数
+    user_schedule_refresh_seconds: int = 600  # 重新加载用户及时区的间隔（秒）
+    user_schedule_retry_seconds: int = 60  # 执行失败的用户首次重试间隔（秒），之后每次加倍
+    user_schedule_retry_max_seconds: int = 3600  # 重试间隔上限（秒）
+    user_schedule_max_retries: int = 5  # 超过该重试次数后放弃当天，排期到下一天
+
+    # 数据保留配置
+    retention_learning_progress_days: int = 90  # 学习进度记录保留天数
+    retention_job_run_days: int = 30  # 定时任务执行历史保留天数
+    retention_inactive_user_days: int = 30  # 超过该天数未登录的用户标记为非活跃
+    retention_archive_enabled: bool = True  # 删除前先压缩归档到 record_archives 表
+    retention_batch_size: int = 500  # 每批按主键范围处理的行数
+    retention_batch_sleep: float = 0.2  # 批次之间的间隔（秒），让出写锁
+    retention_peak_hours: str = "8-23"  # 高峰时段（本地小时，含起不含止）
+    retention_peak_max_batches: int = 10  # 高峰时段每次任务最多处理的批次数，剩余部分留到低峰
+
+    # 题目池配置
+    question_pool_enabled: bool = True  # 出题请求优先从预生成题目池取题
+    question_pool_default_target: int = 30  # 新出现的 (学科, 难度, 题型, 技能点) 组合的目标库存
+    question_pool_batch_size: int = 10  # 补充库存时每次调用AI生成的题目数
+    question_pool_idle_days: int = 14  # 超过该天数无人请求的组合不再补充
+    question_pool_refill_time: str = "03:30"  # 低峰时段补充库存
+
+    # 组卷配置
+    exam_assembly_enabled: bool = True  # 优先从题库按约束组卷，只为题库不足的题型调用AI出题
+    exam_total_score: int = 100  # 试卷总分
+    exam_type_score_weights: Dict[str, int] = {
+        "single_choice": 2, "multiple_choice": 3, "fill_blank": 2, "short_answer": 5, "essay": 10
+    }  # 各题型分值比例，按比例分配总分
+    exam_difficulty_tolerance: int = 1  # 选题难度与要求难度（1-5）的最大偏差
+    exam_assembly_index_ttl: int = 300  # 候选题索引的最长缓存时间（秒），题库变化时立即重建
+
+    # 后台任务配置（AI组卷、学习计划等耗时操作）
+    background_jobs_enabled: bool = True  # 在Web进程中执行后台任务（关闭后由 worker.py 进程执行）
+    background_job_workers: int = 4  # 同时执行的任务数
+    background_job_poll_seconds: int = 10  # 扫描未认领或中断任务的间隔（秒）
+    background_job_stale_seconds: int = 300  # 执行中的任务超过该时间无心跳视为中断
+    background_job_max_attempts: int = 3  # 中断后最多重新执行的次数
+    retention_background_job_days: int = 7  # 已结束的后台任务保留天数
+
     # Redis配置（用于缓存和会话）
     redis_url: Optional[str] = None
 
@@ -2,6 +2,7 @@ from config import settings
 from app.api import auth, question, exam, learning
 from database import engine, Base
 import sys
+import asyncio
 from pathlib import Path
 import logging
 from fastapi import FastAPI, Request
@@ -15,6 +16,7 @@ sys.path.append(str(Path(__file__).parent))
 # 导入所有模型以确保SQLAlchemy关系正确配置
 from app.models import *
 from app.api.learning import skill_router
+from app.services.ai_usage_service import AIQuotaExceeded, begin_request, usage_meter
 
 # 配置日志
 logging.basicConfig(
@@ -36,13 +38,27 @@ async def lifespan(app: FastAPI):
     Base.metadata.create_all(bind=engine)
     logger.info("数据库初始化完成")
     
-    # 启动定时任务服务
-    try:
-        from app.services.scheduler_service import scheduler
-        scheduler.start()
-        logger.info("定时任务服务启动成功")
-    except Exception as e:
-        logger.warning(f"定时任务服务启动失败: {e}")
+    # 启动定时任务服务（也可关闭后通过 worker.py 在独立进程中运行）
+    if settings.scheduler_enabled:
+        try:
+            from app.services.scheduler_service import scheduler
+            scheduler.start()
+            logger.info("定时任务服务启动成功")
+        except Exception as e:
+            logger.warning(f"定时任务服务启动失败: {e}")
+    else:
+        logger.info("定时任务由独立worker进程执行")
+
+    # 后台试探熔断中的AI服务商
+    from app.api.ai import ai_service
+    from app.services.ai_service import run_provider_probes
+    probe_stop = asyncio.Event()
+    probe_task = asyncio.create_task(run_provider_probes(ai_service, probe_stop)) if ai_service._ai_available else None
+
+    # 启动后台任务执行器（同时接手重启前未完成的任务）
+    if settings.background_jobs_enabled:
+        from app.services.background_jobs import job_manager
+        await job_manager.start()
     
     yield
     
@@ -50,12 +66,24 @@ async def lifespan(app: FastAPI):
     logger.info("应用关闭中...")
     
     # 停止定时任务服务
-    try:
-        from app.services.scheduler_service import scheduler
-        scheduler.stop()
-        logger.info("定时任务服务已停止")
-    except Exception as e:
-        logger.warning(f"定时任务服务停止失败: {e}")
+    if settings.scheduler_enabled:
+        try:
+            from app.services.scheduler_service import scheduler
+            scheduler.stop()
+            logger.info("定时任务服务已停止")
+        except Exception as e:
+            logger.warning(f"定时任务服务停止失败: {e}")
+
+    if probe_task:
+        probe_stop.set()
+        await probe_task
+
+    if settings.background_jobs_enabled:
+        from app.services.background_jobs import job_manager
+        await job_manager.stop()
+
+    # 写入尚未落库的AI用量
+    usage_meter.flush()
 
 
 app = FastAPI(
@@ -77,6 +105,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 if not settings.debug:
@@ -86,6 +115,23 @@ if not settings.debug:
     )
 
 
+@app.middleware("http")
+async def ai_usage_context(request: Request, call_next):
+    """为每个请求创建AI用量归属上下文"""
+    begin_request()
+    return await call_next(request)
+
+
+@app.exception_handler(AIQuotaExceeded)
+async def ai_quota_exception_handler(request: Request, exc: AIQuotaExceeded):
+    """AI用量超出配额"""
+    return JSONResponse(
+        status_code=429,
+        content={"success": False, "message": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     """全局异常处理器"""
@@ -147,6 +193,26 @@ except ImportError as e:
 except Exception as e:
     logger.warning(f"仪表板路由加载失败，跳过加载: {e}")
 
+# 尝试导入排行榜路由（如果存在）
+try:
+    from app.api import leaderboard
+    app.include_router(leaderboard.router, prefix="/api/v1")
+    logger.info("排行榜路由加载成功")
+except ImportError as e:
+    logger.warning(f"排行榜路由未找到，跳过加载: {e}")
+except Exception as e:
+    logger.warning(f"排行榜路由加载失败，跳过加载: {e}")
+
+# 尝试导入后台任务路由（如果存在）
+try:
+    from app.api import jobs
+    app.include_router(jobs.router, prefix="/api/v1")
+    logger.info("后台任务路由加载成功")
+except ImportError as e:
+    logger.warning(f"后台任务路由未找到，跳过加载: {e}")
+except Exception as e:
+    logger.warning(f"后台任务路由加载失败，跳过加载: {e}")
+
 
 @app.get("/")
 async def read_root():
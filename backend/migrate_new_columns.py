@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+升级已有数据库：为已有表补充新增字段，并创建新增的表
+
+create_all 只创建不存在的表，不会给已有表加列；升级代码后需先运行本脚本，否则查询 User/Question 会因缺少字段报错。
+- users.timezone: 用户时区，为空时使用 default_timezone
+- questions.content_hash: 题干哈希，回填并建立唯一索引（见 backfill_question_hashes.py）
+"""
+
+from sqlalchemy import inspect, text
+
+import app.models  # noqa: F401  注册全部模型
+from database import Base, engine
+import backfill_question_hashes
+
+# 表名 -> [(字段名, 字段定义)]
+NEW_COLUMNS = {
+    "users": [("timezone", "VARCHAR(50)")],
+}
+
+
+def add_columns():
+    inspector = inspect(engine)
+    for table, columns in NEW_COLUMNS.items():
+        existing = {column["name"] for column in inspector.get_columns(table)}
+        for name, definition in columns:
+            if name in existing:
+                print(f"⚠️  字段已存在: {table}.{name}")
+                continue
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {definition}"))
+            print(f"✅ 添加字段: {table}.{name}")
+
+
+def create_tables():
+    Base.metadata.create_all(bind=engine)
+    print("✅ 新增的表已创建")
+
+
+if __name__ == "__main__":
+    create_tables()
+    add_columns()
+    backfill_question_hashes.add_column()
+    backfill_question_hashes.backfill()
+    backfill_question_hashes.create_index()
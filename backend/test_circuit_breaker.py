@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+测试AI服务商熔断器：失败率熔断、冷却后半开试探、试探成功恢复/失败重新熔断
+"""
+
+import sys
+import time
+from pathlib import Path
+
+# 添加项目路径
+sys.path.append(str(Path(__file__).parent))
+
+from app.utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+COOLDOWN = 0.05
+
+
+def make_breaker() -> CircuitBreaker:
+    return CircuitBreaker("test", failure_rate=0.5, window_seconds=60, min_calls=4, open_seconds=COOLDOWN)
+
+
+def test_opens_on_failure_rate():
+    """调用次数不足时不熔断，失败率达到阈值后熔断并拒绝请求"""
+    breaker = make_breaker()
+    for _ in range(3):
+        breaker.record_failure("timeout")
+    assert breaker.state == CLOSED and breaker.allow()
+
+    breaker.record_success()
+    breaker.record_failure("timeout")
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.cooling_down()
+    assert breaker.snapshot()["last_error"] == "timeout"
+
+
+def test_stays_closed_below_failure_rate():
+    """失败率低于阈值时保持闭合"""
+    breaker = make_breaker()
+    for _ in range(3):
+        breaker.record_success()
+    breaker.record_failure()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+
+def open_breaker() -> CircuitBreaker:
+    breaker = make_breaker()
+    for _ in range(4):
+        breaker.record_failure()
+    assert breaker.state == OPEN
+    return breaker
+
+
+def test_half_open_success_closes():
+    """冷却结束后只放行一个试探请求，试探成功后恢复"""
+    breaker = open_breaker()
+    time.sleep(COOLDOWN * 1.5)
+    assert breaker.available()
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_half_open_failure_reopens():
+    """试探失败后重新熔断并重新计算冷却时间"""
+    breaker = open_breaker()
+    time.sleep(COOLDOWN * 1.5)
+    assert breaker.allow()
+    breaker.record_failure("still down")
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_abandoned_trial_released():
+    """试探请求被取消、没有回报结果时，冷却时间后重新放行试探"""
+    breaker = open_breaker()
+    time.sleep(COOLDOWN * 1.5)
+    assert breaker.allow()
+    assert not breaker.available()
+    time.sleep(COOLDOWN * 1.5)
+    assert breaker.available()
+    assert breaker.allow()
+
+
+if __name__ == "__main__":
+    for test in (
+        test_opens_on_failure_rate,
+        test_stays_closed_below_failure_rate,
+        test_half_open_success_closes,
+        test_half_open_failure_reopens,
+        test_abandoned_trial_released,
+    ):
+        print(f"🧪 {test.__doc__}")
+        test()
+        print("✅ 通过")
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+测试仪表板组件缓存：学习任务变化提交后，最近活动组件返回新数据
+"""
+
+import sys
+from pathlib import Path
+
+# 添加项目路径
+sys.path.append(str(Path(__file__).parent))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.models  # noqa: F401  注册全部模型
+from database import Base
+from app.models.learning import LearningPlan, LearningTask
+from app.services.dashboard_service import DashboardService
+
+USER_ID = 7
+
+
+def make_session():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine, autoflush=False)()
+
+
+def recent_tasks(db):
+    activities = DashboardService.get_widget(db, USER_ID, "recent_activity")
+    return {item["title"]: item["status"] for item in activities if item["type"] == "task"}
+
+
+def test_task_update_refreshes_recent_activity():
+    """新建任务、更新任务状态、删除任务后，最近活动组件不返回缓存的旧数据"""
+    db = make_session()
+    DashboardService.invalidate(USER_ID)
+    plan = LearningPlan(user_id=USER_ID, title="一周计划", plan_type="short_term")
+    db.add(plan)
+    db.commit()
+    assert recent_tasks(db) == {}
+
+    db.add(LearningTask(plan_id=plan.id, title="复习函数"))
+    db.commit()
+    assert recent_tasks(db) == {"复习函数": "pending"}
+
+    task = db.query(LearningTask).one()
+    task.status = "completed"
+    db.commit()
+    assert recent_tasks(db) == {"复习函数": "completed"}
+
+    db.delete(task)
+    db.commit()
+    assert recent_tasks(db) == {}
+
+
+def test_other_user_task_keeps_cache():
+    """其他用户的任务变化不影响本用户的缓存"""
+    db = make_session()
+    DashboardService.invalidate(USER_ID)
+    plan = LearningPlan(user_id=USER_ID, title="一周计划", plan_type="short_term")
+    other = LearningPlan(user_id=USER_ID + 1, title="其他用户", plan_type="short_term")
+    db.add_all([plan, other])
+    db.commit()
+    db.add(LearningTask(plan_id=plan.id, title="复习函数"))
+    db.commit()
+    cached = DashboardService.get_widget(db, USER_ID, "recent_activity")
+
+    db.add(LearningTask(plan_id=other.id, title="其他任务"))
+    db.commit()
+    assert DashboardService.get_widget(db, USER_ID, "recent_activity") is cached
+
+
+if __name__ == "__main__":
+    for test in (
+        test_task_update_refreshes_recent_activity,
+        test_other_user_task_keeps_cache,
+    ):
+        print(f"🧪 {test.__doc__}")
+        test()
+        print("✅ 通过")
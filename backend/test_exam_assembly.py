@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+测试组卷：从题库按题型、难度、知识点标签选题，题库不足的题型先并发完成AI出题，再统一写入题库
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+# 添加项目路径
+sys.path.append(str(Path(__file__).parent))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.models  # noqa: F401  注册全部模型
+from database import Base
+from config import settings
+from app.models.question import ExamQuestion, Question, QuestionCategory
+from app.services import exam_assembler
+from app.services.exam_assembler import ExamAssembler, difficulty_level, get_question_index
+from app.services.exam_service import generate_ai_exam
+
+
+def make_session():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    # 不同测试的内存库可能有相同的题目数和最大ID，清空进程内的候选题索引
+    exam_assembler._index = None
+    return engine, sessionmaker(bind=engine, autoflush=False)()
+
+
+def seed_bank(db, questions):
+    """questions: [(题型, 难度, 标签列表)]，全部归入“数学”分类，返回题目ID"""
+    category = QuestionCategory(name="数学")
+    db.add(category)
+    db.flush()
+    rows = [
+        Question(question_type=question_type, content=f"题目{i}", answer="A",
+                 difficulty=str(level), tags=tags, category_id=category.id)
+        for i, (question_type, level, tags) in enumerate(questions)
+    ]
+    db.add_all(rows)
+    db.commit()
+    return [row.id for row in rows]
+
+
+def levels_of(db, question_ids):
+    return [difficulty_level(value) for (value,) in db.query(Question.difficulty).filter(Question.id.in_(question_ids))]
+
+
+def test_type_counts():
+    """题库充足时每个题型选出要求的题数，且题型正确、不重复"""
+    _, db = make_session()
+    seed_bank(db, [(question_type, 3, []) for question_type in ("single_choice", "fill_blank") for _ in range(10)])
+    plan = ExamAssembler(db, seed=1).assemble("数学", 3, {"single_choice": 5, "fill_blank": 3})
+    assert plan["missing"] == {}
+    assert {name: len(ids) for name, ids in plan["selected"].items()} == {"single_choice": 5, "fill_blank": 3}
+    for question_type, ids in plan["selected"].items():
+        assert len(set(ids)) == len(ids)
+        assert {row for (row,) in db.query(Question.question_type).filter(Question.id.in_(ids))} == {question_type}
+
+
+def test_difficulty_tolerance():
+    """只选难度在要求难度 ± exam_difficulty_tolerance 内的题目，超出范围的题目不补位"""
+    _, db = make_session()
+    tolerance = settings.exam_difficulty_tolerance
+    seed_bank(db, [("single_choice", level, []) for level in range(1, 6) for _ in range(3)])
+    plan = ExamAssembler(db, seed=2).assemble("数学", 3, {"single_choice": 15})
+    picked = levels_of(db, plan["selected"]["single_choice"])
+    assert all(abs(level - 3) <= tolerance for level in picked), picked
+    assert len(picked) == 3 * (2 * tolerance + 1)
+    assert plan["missing"] == {"single_choice": 15 - len(picked)}
+
+
+def test_tag_coverage():
+    """要求的知识点标签都有题目覆盖，即使带标签的题目只占少数；按标签匹配其他分类的题目"""
+    _, db = make_session()
+    seed_bank(db, [("single_choice", 3, []) for _ in range(30)] + [
+        ("single_choice", 3, ["函数"]),
+        ("fill_blank", 3, ["几何"]),
+    ])
+    other = QuestionCategory(name="综合")
+    db.add(other)
+    db.flush()
+    db.add(Question(question_type="fill_blank", content="按标签归入数学", answer="A",
+                    difficulty="3", tags=["数学", "概率"], category_id=other.id))
+    db.commit()
+
+    for seed in range(5):
+        plan = ExamAssembler(db, seed=seed).assemble(
+            "数学", 3, {"single_choice": 2, "fill_blank": 2}, tags=["函数", "几何", "概率"]
+        )
+        ids = [question_id for ids in plan["selected"].values() for question_id in ids]
+        covered = set()
+        for (tags,) in db.query(Question.tags).filter(Question.id.in_(ids)):
+            covered.update(tags or [])
+        assert {"函数", "几何", "概率"} <= covered, (seed, covered)
+
+
+def test_missing_accounting():
+    """题库不足的题型记录缺少的题数，没有候选题的题型全部计入缺口，题数为0的题型忽略"""
+    _, db = make_session()
+    seed_bank(db, [("single_choice", 3, [])] * 1 + [("fill_blank", 3, [])] * 4)
+    plan = ExamAssembler(db, seed=3).assemble(
+        "数学", 3, {"single_choice": 3, "fill_blank": 2, "essay": 2, "short_answer": 0}
+    )
+    assert plan["missing"] == {"single_choice": 2, "essay": 2}
+    assert len(plan["selected"]["single_choice"]) == 1
+    assert len(plan["selected"]["fill_blank"]) == 2
+    assert plan["selected"]["essay"] == []
+    assert "short_answer" not in plan["selected"]
+    assert ExamAssembler(db).assemble("物理", 3, {"single_choice": 2})["missing"] == {"single_choice": 2}
+
+
+def test_index_rebuilt_on_version_change():
+    """题目数或最大ID不变时复用索引；新增或删除题目后立即重建，新题目可被选中"""
+    _, db = make_session()
+    ids = seed_bank(db, [("single_choice", 3, [])] * 2)
+    index = get_question_index(db)
+    assert get_question_index(db) is index
+
+    db.add(Question(question_type="essay", content="新增论述题", answer="A", difficulty="3",
+                    category_id=db.query(QuestionCategory.id).scalar()))
+    db.commit()
+    rebuilt = get_question_index(db)
+    assert rebuilt is not index
+    assert len(ExamAssembler(db).assemble("数学", 3, {"essay": 1})["selected"]["essay"]) == 1
+
+    db.query(Question).filter(Question.id == ids[0]).delete()
+    db.commit()
+    assert get_question_index(db) is not rebuilt
+    plan = ExamAssembler(db).assemble("数学", 3, {"single_choice": 2})
+    assert plan["selected"]["single_choice"] == [ids[1]] and plan["missing"] == {"single_choice": 1}
+
+
+class FakeAIService:
+    """记录同时进行的AI调用数，以及AI调用期间执行的写语句"""
+
+    def __init__(self, engine):
+        self.active = 0
+        self.peak = 0
+        self.writes_during_calls = []
+        event.listen(engine, "before_cursor_execute", self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if self.active and not statement.lstrip().upper().startswith("SELECT"):
+            self.writes_during_calls.append(statement)
+
+    async def generate_questions_with_skill(self, subject, skill, difficulty, count, question_types, use_cache=True):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        return [
+            {"content": f"{subject} {question_types[0]} AI题目{i}", "answer": "A"}
+            for i in range(count)
+        ]
+
+
+def test_gap_generation_before_writes():
+    """各题型的AI出题并发进行，AI调用期间不执行写语句，补充的题目全部写入试卷"""
+    engine, db = make_session()
+    category = QuestionCategory(name="数学")
+    db.add(category)
+    db.flush()
+    db.add_all([
+        Question(question_type="single_choice", content=f"题库单选{i}", answer="A",
+                 difficulty="3", category_id=category.id)
+        for i in range(2)
+    ])
+    db.commit()
+
+    ai_service = FakeAIService(engine)
+    distribution = {"single_choice": 3, "fill_blank": 2, "short_answer": 1}
+    exam = asyncio.run(generate_ai_exam(
+        db, ai_service, subject="数学", difficulty=3, created_by=None, question_distribution=distribution
+    ))
+    db.commit()
+
+    print(f"  AI并发峰值: {ai_service.peak}")
+    assert ai_service.peak == 3
+    assert ai_service.writes_during_calls == []
+    rows = db.query(Question.question_type).join(
+        ExamQuestion, ExamQuestion.question_id == Question.id
+    ).filter(ExamQuestion.exam_id == exam.id).all()
+    counts = {}
+    for (question_type,) in rows:
+        counts[question_type] = counts.get(question_type, 0) + 1
+    assert counts == distribution, counts
+
+
+if __name__ == "__main__":
+    for test in (
+        test_type_counts,
+        test_difficulty_tolerance,
+        test_tag_coverage,
+        test_missing_accounting,
+        test_index_rebuilt_on_version_change,
+        test_gap_generation_before_writes,
+    ):
+        print(f"🧪 {test.__doc__}")
+        test()
+        print("✅ 通过")
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+测试组卷分值分配：按题型权重分配整数分值，总和恰好等于总分，每题至少1分
+"""
+
+import random
+import sys
+from pathlib import Path
+
+# 添加项目路径
+sys.path.append(str(Path(__file__).parent))
+
+from config import settings
+from app.services.exam_assembler import allocate_scores
+
+TYPES = ["single_choice", "multiple_choice", "fill_blank", "short_answer", "essay"]
+
+
+def test_total_matches():
+    """各种题目组合下分值之和都等于总分，且每题至少1分"""
+    rng = random.Random(0)
+    for _ in range(200):
+        question_types = [rng.choice(TYPES) for _ in range(rng.randint(1, 60))]
+        total = rng.randint(len(question_types), 300)
+        scores = allocate_scores(question_types, total)
+        assert len(scores) == len(question_types)
+        assert sum(scores) == total, (question_types, total, scores)
+        assert min(scores) >= 1
+
+
+def test_weights_respected():
+    """权重高的题型分值不低于权重低的题型"""
+    weights = settings.exam_type_score_weights
+    question_types = TYPES * 3
+    scores = allocate_scores(question_types, settings.exam_total_score)
+    print(f"  {dict(zip(TYPES, scores))}")
+    for a, score_a in zip(question_types, scores):
+        for b, score_b in zip(question_types, scores):
+            if weights.get(a, 5) > weights.get(b, 5):
+                assert score_a >= score_b, (a, b, scores)
+
+
+def test_same_type_differs_by_at_most_one():
+    """同一题型的题目分值最多相差1分"""
+    scores = allocate_scores(["single_choice"] * 7, 100)
+    assert sum(scores) == 100 and max(scores) - min(scores) <= 1
+
+
+def test_edge_cases():
+    """空试卷返回空列表；总分小于题目数时每题1分"""
+    assert allocate_scores([], 100) == []
+    assert allocate_scores(["essay"] * 5, 3) == [1] * 5
+    assert allocate_scores(["essay"], 100) == [100]
+
+
+if __name__ == "__main__":
+    for test in (
+        test_total_matches,
+        test_weights_respected,
+        test_same_type_differs_by_at_most_one,
+        test_edge_cases,
+    ):
+        print(f"🧪 {test.__doc__}")
+        test()
+        print("✅ 通过")
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+测试AI调用调度：并发上限、交互请求优先、批量请求并发比例上限、服务商额度为交互请求预留
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+# 添加项目路径
+sys.path.append(str(Path(__file__).parent))
+
+from config import settings
+from app.services.llm_dispatcher import BATCH, INTERACTIVE, LLMDispatcher
+
+
+class override_settings:
+    """临时修改配置"""
+
+    def __init__(self, **values):
+        self.values = values
+        self.saved = {}
+
+    def __enter__(self):
+        for name, value in self.values.items():
+            self.saved[name] = getattr(settings, name)
+            setattr(settings, name, value)
+
+    def __exit__(self, *exc):
+        for name, value in self.saved.items():
+            setattr(settings, name, value)
+
+
+async def _hold(dispatcher: LLMDispatcher, priority: str, order: list, release: asyncio.Event):
+    async with dispatcher.slot(priority):
+        order.append(priority)
+        await release.wait()
+
+
+async def _interactive_first():
+    dispatcher = LLMDispatcher()
+    order, release = [], asyncio.Event()
+    blocker = asyncio.Event()
+    # 占满名额后，先排队的批量请求应让给后排队的交互请求
+    holder = asyncio.create_task(_hold(dispatcher, INTERACTIVE, [], blocker))
+    await asyncio.sleep(0)
+    waiters = [asyncio.create_task(_hold(dispatcher, BATCH, order, release)) for _ in range(2)]
+    await asyncio.sleep(0)
+    waiters += [asyncio.create_task(_hold(dispatcher, INTERACTIVE, order, release)) for _ in range(2)]
+    await asyncio.sleep(0)
+    assert dispatcher.snapshot()["waiting"] == {"interactive": 2, "near_real_time": 0, "batch": 2}
+
+    blocker.set()
+    await holder
+    release.set()
+    await asyncio.gather(*waiters)
+    return order
+
+
+def test_interactive_before_batch():
+    """名额释放时，排队的交互请求先于更早排队的批量请求"""
+    with override_settings(llm_max_concurrency=1):
+        order = asyncio.run(_interactive_first())
+    print(f"  放行顺序: {order}")
+    assert order == [INTERACTIVE, INTERACTIVE, BATCH, BATCH]
+
+
+async def _batch_share():
+    dispatcher = LLMDispatcher()
+    peak, release = 0, asyncio.Event()
+
+    async def batch_call():
+        nonlocal peak
+        async with dispatcher.slot(BATCH):
+            peak = max(peak, dispatcher.snapshot()["in_flight"][BATCH])
+            await release.wait()
+
+    tasks = [asyncio.create_task(batch_call()) for _ in range(6)]
+    await asyncio.sleep(0.01)
+    snapshot = dispatcher.snapshot()
+    release.set()
+    await asyncio.gather(*tasks)
+    return peak, snapshot
+
+
+def test_batch_share_capped():
+    """批量请求最多占用 llm_batch_max_share 的并发名额"""
+    with override_settings(llm_max_concurrency=4, llm_batch_max_share=0.5):
+        peak, snapshot = asyncio.run(_batch_share())
+    print(f"  批量并发峰值: {peak}，排队: {snapshot['waiting'][BATCH]}")
+    assert peak == 2
+    assert snapshot["waiting"][BATCH] == 4
+
+
+def test_rate_reserve_for_interactive():
+    """服务商额度只剩预留部分时，批量请求被限速而交互请求仍可调用"""
+    with override_settings(
+        llm_provider_rate_limits={"stub": {"rpm": 10}}, llm_batch_rate_reserve=0.3, redis_url=None
+    ):
+        dispatcher = LLMDispatcher()
+        batch_calls = 0
+        while dispatcher.take_rate("stub", 0, BATCH):
+            batch_calls += 1
+        interactive_calls = 0
+        while dispatcher.take_rate("stub", 0, INTERACTIVE):
+            interactive_calls += 1
+    print(f"  批量请求 {batch_calls} 次，交互请求 {interactive_calls} 次")
+    assert batch_calls == 7
+    assert interactive_calls == 3
+
+
+if __name__ == "__main__":
+    for test in (
+        test_interactive_before_batch,
+        test_batch_share_capped,
+        test_rate_reserve_for_interactive,
+    ):
+        print(f"🧪 {test.__doc__}")
+        test()
+        print("✅ 通过")
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+测试题目按题干哈希去重写入：批量写入、ORM写入都计算哈希，Core 写入登记数据版本
+"""
+
+import sys
+from pathlib import Path
+
+# 添加项目路径
+sys.path.append(str(Path(__file__).parent))
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.models  # noqa: F401  注册全部模型
+from database import Base
+from app.models.exam import Exam
+from app.models.question import ExamQuestion, Question, question_content_hash
+from app.services.question_service import add_questions_to_exam, create_question, upsert_questions
+from app.utils.etag import QUESTION_SET_SCOPE, data_versions, exam_scope
+
+
+def make_session():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine, autoflush=False)()
+
+
+def question(content: str, **extra):
+    return {"question_type": "single_choice", "content": content, "answer": "A", **extra}
+
+
+def test_upsert_dedupes_normalized_content():
+    """规范化后相同的题干只写入一次，返回与输入顺序对应的ID"""
+    db = make_session()
+    ids = upsert_questions(db, [
+        question("1+1 = ?"),
+        question("１＋１   =  ？"),
+        question("2+2 = ?"),
+    ])
+    db.commit()
+    assert ids[0] == ids[1] and ids[0] != ids[2]
+    assert db.query(Question).count() == 2
+
+    again = upsert_questions(db, [question("2+2 = ?"), question("3+3 = ?")])
+    db.commit()
+    assert again[0] == ids[2]
+    assert db.query(Question).count() == 3
+
+
+def test_orm_insert_fills_hash():
+    """ORM写入的题目同样有哈希，重复题干被唯一索引拦截"""
+    db = make_session()
+    db.add(Question(question_type="single_choice", content="What is  X?", answer="A"))
+    db.commit()
+    stored = db.query(Question).one()
+    assert stored.content_hash == question_content_hash("what is x?")
+
+    db.add(Question(question_type="single_choice", content="what is x?", answer="B"))
+    try:
+        db.commit()
+        raise AssertionError("重复题干应被唯一索引拦截")
+    except IntegrityError:
+        db.rollback()
+
+
+def test_create_question_reuses_existing():
+    """create_question 遇到已有题干时返回已有题目"""
+    db = make_session()
+    first = create_question(db, "single_choice", "勾股定理的内容是什么？", "a²+b²=c²")
+    second = create_question(db, "single_choice", "勾股定理的内容是什么？ ", "a²+b²=c²")
+    assert first.id == second.id
+    assert first.content_hash is not None
+
+
+def test_core_writes_bump_versions():
+    """批量写入题目和试卷题目后，题目集合与试卷的数据版本在提交后递增"""
+    db = make_session()
+    exam = Exam(title="测试试卷")
+    db.add(exam)
+    db.commit()
+
+    before = data_versions(QUESTION_SET_SCOPE, exam_scope(exam.id))
+    ids = upsert_questions(db, [question("版本测试题目")])
+    add_questions_to_exam(db, exam.id, [{"question_id": ids[0], "score": 10, "sequence": 1}])
+    db.commit()
+    after = data_versions(QUESTION_SET_SCOPE, exam_scope(exam.id))
+    assert after[0] > before[0] and after[1] > before[1]
+    assert db.query(ExamQuestion).filter(ExamQuestion.exam_id == exam.id).count() == 1
+
+
+if __name__ == "__main__":
+    for test in (
+        test_upsert_dedupes_normalized_content,
+        test_orm_insert_fills_hash,
+        test_create_question_reuses_existing,
+        test_core_writes_bump_versions,
+    ):
+        print(f"🧪 {test.__doc__}")
+        test()
+        print("✅ 通过")
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+测试实时问答的语义缓存：同一问题的不同问法命中，运算符号、数字或问法不同的问题不命中
+"""
+
+import sys
+from pathlib import Path
+
+# 添加项目路径
+sys.path.append(str(Path(__file__).parent))
+
+from config import settings
+from app.utils.semantic_cache import SemanticCache, embed_text, formula_signature
+
+DIM = settings.qa_semantic_cache_dim
+THRESHOLD = settings.qa_semantic_cache_threshold
+
+
+def similarity(a: str, b: str) -> float:
+    return float(embed_text(a, DIM) @ embed_text(b, DIM))
+
+
+def test_same_question_matches():
+    """礼貌用语、标点和“是什么”一类的套话不影响命中"""
+    pairs = [
+        ("什么是光合作用", "请问光合作用是什么意思？"),
+        ("3+4等于多少", "3+4等于多少？"),
+        ("解方程 x+1=2", "请解方程x+1=2"),
+    ]
+    for a, b in pairs:
+        score = similarity(a, b)
+        print(f"  {score:.3f}  {a} | {b}")
+        assert score >= THRESHOLD, f"{a} 与 {b} 应视为同一问题，相似度 {score:.3f}"
+
+
+def test_operator_and_number_swaps_miss():
+    """只有运算符号或数字不同的问题是不同的问题"""
+    pairs = [
+        ("解方程 x+1=2", "x-1=2"),
+        ("解方程 x+1=2", "解方程 x-1=2"),
+        ("3*4等于多少", "3+4等于多少"),
+        ("a>b时", "a<b时"),
+        ("1/2+1/3", "12+13"),
+    ]
+    for a, b in pairs:
+        score = similarity(a, b)
+        print(f"  {score:.3f}  {a} | {b}")
+        assert score < THRESHOLD, f"{a} 与 {b} 不应命中，相似度 {score:.3f}"
+
+
+def test_long_questions_with_different_numbers_miss():
+    """长问题中只有数字不同时相似度可能超过阈值，按数字和运算符号序列区分"""
+    pairs = [
+        ("一个长方形长5厘米宽3厘米，它的面积是多少平方厘米", "一个长方形长6厘米宽3厘米，它的面积是多少平方厘米"),
+        ("求1到100的和", "求1到1000的和"),
+        ("计算3.5乘以2的结果", "计算35乘以2的结果"),
+    ]
+    for a, b in pairs:
+        print(f"  {similarity(a, b):.3f}  {a} | {b}")
+        assert formula_signature(a) != formula_signature(b)
+        cache = SemanticCache(dim=DIM, threshold=THRESHOLD, max_entries=4)
+        cache.set(a, "answer")
+        assert cache.get(b) is None, f"{a} 与 {b} 不应命中"
+        assert cache.get(a)[0] == "answer"
+
+
+def test_question_words_kept():
+    """为什么/吗/如何/怎么 改变了问题的含义"""
+    pairs = [
+        ("为什么天空是蓝色的", "天空是蓝色的吗"),
+        ("如何学习英语", "学习英语"),
+    ]
+    for a, b in pairs:
+        score = similarity(a, b)
+        print(f"  {score:.3f}  {a} | {b}")
+        assert score < THRESHOLD, f"{a} 与 {b} 不应命中，相似度 {score:.3f}"
+
+
+def test_cache_lookup():
+    """缓存只在同一命名空间内返回超过阈值的项"""
+    cache = SemanticCache(dim=DIM, threshold=THRESHOLD, max_entries=4)
+    cache.set("3+4等于多少", "7", namespace="beginner")
+    assert cache.get("3+4等于多少？", "beginner")[0] == "7"
+    assert cache.get("3*4等于多少", "beginner") is None
+    assert cache.get("3+4等于多少", "advanced") is None
+
+
+if __name__ == "__main__":
+    for test in (
+        test_same_question_matches,
+        test_operator_and_number_swaps_miss,
+        test_long_questions_with_different_numbers_miss,
+        test_question_words_kept,
+        test_cache_lookup,
+    ):
+        print(f"🧪 {test.__doc__}")
+        test()
+        print("✅ 通过")
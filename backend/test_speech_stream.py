@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+测试流式语音识别的解码：分块重采样与整段重采样一致，WAV 文件头按任意大小分块上传都能解析
+"""
+
+import io
+import struct
+import sys
+import wave
+from pathlib import Path
+
+# 添加项目路径
+sys.path.append(str(Path(__file__).parent))
+
+import numpy as np
+
+from config import settings
+from app.services.speech_service import AudioRejected, SpeechStream, StreamingResampler
+
+
+def make_wav(seconds: float = 1.0, rate: int = 44100, channels: int = 2, extra_chunk: bytes = b"") -> bytes:
+    """生成 16 位 PCM 正弦波 WAV；extra_chunk 插入在 fmt 块与 data 块之间"""
+    t = np.arange(int(seconds * rate)) / rate
+    samples = (np.sin(2 * np.pi * 440 * t) * 16000).astype("<i2")
+    frames = np.repeat(samples[:, None], channels, axis=1).tobytes()
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as writer:
+        writer.setnchannels(channels)
+        writer.setsampwidth(2)
+        writer.setframerate(rate)
+        writer.writeframes(frames)
+    data = buffer.getvalue()
+    if extra_chunk:
+        data_at = data.index(b"data")
+        data = data[:data_at] + extra_chunk + data[data_at:]
+        data = data[:4] + struct.pack("<I", len(data) - 8) + data[8:]
+    return data
+
+
+def transcribe(data: bytes, chunk_size: int):
+    stream = SpeechStream(recognizer="mock")
+    for start in range(0, len(data), chunk_size):
+        stream.feed(data[start:start + chunk_size])
+    return stream.finish()
+
+
+def test_resampler_matches_whole():
+    """任意分块的重采样结果与整段线性插值一致"""
+    rng = np.random.default_rng(0)
+    signal = rng.standard_normal(10000).astype(np.float32)
+    for source_rate, target_rate in ((44100, 16000), (8000, 16000), (22050, 16000)):
+        expected = StreamingResampler(source_rate, target_rate).process(signal)
+        for chunk_size in (1, 7, 160, 4096):
+            resampler = StreamingResampler(source_rate, target_rate)
+            output = np.concatenate([
+                resampler.process(signal[start:start + chunk_size])
+                for start in range(0, len(signal), chunk_size)
+            ])
+            assert len(output) == len(expected), (source_rate, chunk_size, len(output), len(expected))
+            assert np.allclose(output, expected, atol=1e-5), (source_rate, chunk_size)
+
+        step = source_rate / target_rate
+        positions = step * np.arange(len(expected))
+        assert np.allclose(expected, np.interp(positions, np.arange(len(signal)), signal), atol=1e-5)
+
+
+def test_wav_header_any_split():
+    """文件头被拆成 1/20/40/44 字节等任意大小的块时都能解析，结果与整块上传一致"""
+    data = make_wav()
+    expected = transcribe(data, len(data))
+    assert expected["duration"] == 1.0 and expected["text"]
+    for chunk_size in (1, 20, 40, 44, 100, 4096):
+        result = transcribe(data, chunk_size)
+        print(f"  分块 {chunk_size} 字节: {result['duration']}s")
+        assert result == expected, chunk_size
+
+
+def test_wav_with_extra_chunk():
+    """fmt 与 data 之间有其他块（如 LIST）时跳过"""
+    info = b"INFOISFT" + struct.pack("<I", 5) + b"test\x00\x00"
+    data = make_wav(extra_chunk=b"LIST" + struct.pack("<I", len(info)) + info)
+    for chunk_size in (20, 40, 4096):
+        assert transcribe(data, chunk_size)["duration"] == 1.0
+
+
+def test_invalid_wav_rejected():
+    """非 WAV 数据、不支持的编码被拒绝，文件头未收完就结束视为数据不完整"""
+    try:
+        transcribe(b"ID3" + b"\x00" * 100, 20)
+        raise AssertionError("非WAV数据应被拒绝")
+    except AudioRejected:
+        pass
+
+    data = bytearray(make_wav())
+    fmt_at = data.index(b"fmt ")
+    data[fmt_at + 8:fmt_at + 10] = struct.pack("<H", 3)  # IEEE float
+    try:
+        transcribe(bytes(data), 20)
+        raise AssertionError("不支持的编码应被拒绝")
+    except AudioRejected:
+        pass
+
+    try:
+        transcribe(make_wav()[:30], 10)
+        raise AssertionError("文件头不完整应被拒绝")
+    except AudioRejected as e:
+        assert e.message == "音频数据不完整"
+
+
+def test_duration_limit():
+    """文件头声明的时长超限时收到文件头后就拒绝"""
+    data = make_wav(seconds=0.1, rate=8000, channels=1)
+    fake = data[:40] + struct.pack("<I", 8000 * 2 * (settings.speech_max_duration_seconds + 1)) + data[44:]
+    stream = SpeechStream(recognizer="mock")
+    try:
+        stream.feed(fake[:44])
+        raise AssertionError("声明时长超限应被拒绝")
+    except AudioRejected as e:
+        assert e.too_large
+
+
+if __name__ == "__main__":
+    for test in (
+        test_resampler_matches_whole,
+        test_wav_header_any_split,
+        test_wav_with_extra_chunk,
+        test_invalid_wav_rejected,
+        test_duration_limit,
+    ):
+        print(f"🧪 {test.__doc__}")
+        test()
+        print("✅ 通过")
@@ -0,0 +1,67 @@
+"""独立的定时任务与后台任务进程：python worker.py
+
+Web进程设置 SCHEDULER_ENABLED=false 后，由该进程负责执行定时任务；
+可以部署多个实例，数据库租约保证每个任务周期在集群内只执行一次。
+同时运行后台任务执行器，Web进程设置 BACKGROUND_JOBS_ENABLED=false 后提交的任务由该进程认领执行。
+"""
+import asyncio
+import logging
+import signal
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+
+from config import settings
+from database import engine, Base
+from app.models import *
+
+logging.basicConfig(
+    level=getattr(logging, settings.log_level),
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler(settings.log_file),
+        logging.StreamHandler()
+    ]
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def run_worker():
+    """定时任务在调度线程中执行，后台任务在本事件循环中执行，收到退出信号后依次停止"""
+    from app.services.background_jobs import job_manager
+    from app.services.scheduler_service import scheduler
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+
+    def handle_signal(signum):
+        logger.info(f"收到信号 {signum}，worker进程退出中...")
+        stop.set()
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, handle_signal, signum)
+
+    scheduler.start()
+    await job_manager.start()
+    logger.info("worker进程启动")
+    try:
+        await stop.wait()
+    finally:
+        await job_manager.stop()
+        scheduler.stop()
+
+
+def main():
+    Base.metadata.create_all(bind=engine)
+
+    try:
+        asyncio.run(run_worker())
+    finally:
+        from app.services.ai_usage_service import usage_meter
+        usage_meter.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -125,12 +125,11 @@ export const aiApi = {
     audioFile: File,
     language: string = "zh-CN"
   ): Promise<SpeechToTextResult> {
-    const formData = new FormData();
-    formData.append("audio_file", audioFile);
-    formData.append("language", language);
-    return apiClient.post("/api/v1/ai/speech-to-text", formData, {
+    // 请求体为音频原始数据，服务端边接收边识别
+    const params = new URLSearchParams({ language });
+    return apiClient.post(`/api/v1/ai/speech-to-text?${params.toString()}`, audioFile, {
       headers: {
-        "Content-Type": "multipart/form-data",
+        "Content-Type": audioFile.type || "application/octet-stream",
       },
     });
   },